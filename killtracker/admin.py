@@ -1,9 +1,10 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 
 from django.db.models import Q
 from django.db.models.functions import Lower
 from django.http import HttpResponseRedirect
 from django.shortcuts import render
+from django.urls import path
 from django.utils.safestring import mark_safe
 
 from allianceauth.eveonline.models import EveAllianceInfo
@@ -16,7 +17,13 @@ from .constants import (
     EVE_GROUP_MINING_DRONE,
     EVE_GROUP_ORBITAL_INFRASTRUCTURE,
 )
+from .app_settings import (
+    KILLTRACKER_PIPELINE_STATS_ENABLED,
+    KILLTRACKER_PROFILING_ENABLED,
+)
 from .core.killmails import Killmail
+from .core.metrics import stage_stats
+from .core.profiling import Operation, tracker_profile
 from .forms import TrackerAdminForm, TrackerAdminKillmailIdForm, field_nice_display
 from .models import Webhook, Tracker
 from . import tasks
@@ -24,13 +31,29 @@ from . import tasks
 
 @admin.register(Webhook)
 class WebhookAdmin(admin.ModelAdmin):
-    list_display = ("name", "is_enabled", "_messages_in_queue")
+    list_display = (
+        "name",
+        "is_enabled",
+        "_messages_in_queue",
+        "_queue_size_limit",
+        "_messages_shed",
+    )
     list_filter = ("is_enabled",)
     ordering = ("name",)
 
     def _messages_in_queue(self, obj):
         return obj.main_queue.size()
 
+    def _queue_size_limit(self, obj):
+        return obj.queue_size_limit if obj.queue_size_limit else "-"
+
+    _queue_size_limit.short_description = "queue limit"
+
+    def _messages_shed(self, obj):
+        return obj.messages_shed()
+
+    _messages_shed.short_description = "messages dropped"
+
     actions = ["send_test_message", "purge_messages"]
 
     def purge_messages(self, request, queryset):
@@ -38,6 +61,7 @@ class WebhookAdmin(admin.ModelAdmin):
         killmails_deleted = 0
         for webhook in queryset:
             killmails_deleted += webhook.main_queue.clear()
+            webhook.reset_messages_shed()
             actions_count += 1
 
         self.message_user(
@@ -81,6 +105,27 @@ class TrackerAdmin(admin.ModelAdmin):
     )
     ordering = ("name",)
 
+    def get_list_display(self, request):
+        list_display = super().get_list_display(request)
+        if KILLTRACKER_PROFILING_ENABLED:
+            list_display = tuple(list_display) + ("_profile_matching", "_profile_embed")
+        return list_display
+
+    def _profile(self, obj) -> dict:
+        if not hasattr(obj, "_profile_cache"):
+            obj._profile_cache = tracker_profile(obj.pk)
+        return obj._profile_cache
+
+    def _profile_matching(self, obj):
+        return str(self._profile(obj)[Operation.PROCESS_KILLMAIL])
+
+    _profile_matching.short_description = "profile matching"
+
+    def _profile_embed(self, obj):
+        return str(self._profile(obj)[Operation.CREATE_EMBED])
+
+    _profile_embed.short_description = "profile embed"
+
     def _color(self, obj):
         html = (
             f'<input type="color" value="{obj.color}" disabled>' if obj.color else "-"
@@ -164,37 +209,44 @@ class TrackerAdmin(admin.ModelAdmin):
         if "apply" in request.POST:
             form = TrackerAdminKillmailIdForm(request.POST)
             if form.is_valid():
-                killmail_id = form.cleaned_data["killmail_id"]
-                killmail = Killmail.create_from_zkb_api(killmail_id)
-                if killmail:
-                    request.session["last_killmail_id"] = killmail_id
+                killmail_ids = form.cleaned_data["killmail_ids"]
+                killmails = Killmail.create_from_zkb_api_bulk(killmail_ids)
+                if killmails:
+                    request.session["last_killmail_ids"] = form.data["killmail_ids"]
                     actions_count = 0
-                    for tracker in queryset:
-                        tasks.run_tracker.delay(
-                            tracker_pk=tracker.pk,
-                            killmail_json=killmail.asjson(),
-                            ignore_max_age=True,
-                        )
-                        actions_count += 1
+                    for killmail in killmails.values():
+                        killmail_json = killmail.asjson()
+                        for tracker in queryset:
+                            tasks.run_tracker.delay(
+                                tracker_pk=tracker.pk,
+                                killmail_json=killmail_json,
+                                ignore_max_age=True,
+                            )
+                            actions_count += 1
 
                     self.message_user(
                         request,
                         (
-                            f"Started {actions_count} tracker(s) for "
-                            f"killmail with ID {killmail_id}."
+                            f"Started {actions_count} tracker run(s) for "
+                            f"{len(killmails)} killmail(s)."
                         ),
                     )
-                else:
+                missing_ids = [obj for obj in killmail_ids if obj not in killmails]
+                if missing_ids:
                     self.message_user(
                         request,
-                        "Failed to load killmail with ID {killmail_id} from ZKB",
+                        (
+                            "Failed to load killmails with IDs "
+                            f"{', '.join(map(str, missing_ids))} from ZKB"
+                        ),
+                        level=messages.WARNING,
                     )
 
             return HttpResponseRedirect(request.get_full_path())
         else:
-            last_killmail_id = request.session.get("last_killmail_id")
-            if last_killmail_id:
-                initial = {"killmail_id": last_killmail_id}
+            last_killmail_ids = request.session.get("last_killmail_ids")
+            if last_killmail_ids:
+                initial = {"killmail_ids": last_killmail_ids}
             else:
                 initial = None
             form = TrackerAdminKillmailIdForm(initial=initial)
@@ -211,6 +263,43 @@ class TrackerAdmin(admin.ModelAdmin):
 
     run_test_killmail.short_description = "Run test killmail with selected trackers"
 
+    def get_urls(self):
+        urls = super().get_urls()
+        my_urls = [
+            path(
+                "pipeline_stats/",
+                self.admin_site.admin_view(self.pipeline_stats_view),
+                name="killtracker_pipeline_stats",
+            ),
+        ]
+        return my_urls + urls
+
+    def pipeline_stats_view(self, request):
+        names = {**Tracker.objects.label_names(), **Webhook.objects.label_names()}
+        rows = [
+            {
+                "stage": stage,
+                "name": names.get(data.label, data.label) if data.label else None,
+                "count": data.count,
+                "average": data.average,
+                "p50": data.percentile(50),
+                "p95": data.percentile(95),
+                "p99": data.percentile(99),
+            }
+            for stage, histograms in stage_stats().items()
+            for data in histograms
+        ]
+        return render(
+            request,
+            "admin/killtracker_pipeline_stats.html",
+            {
+                **self.admin_site.each_context(request),
+                "title": "Killtracker Pipeline Stats",
+                "rows": rows,
+                "is_enabled": KILLTRACKER_PIPELINE_STATS_ENABLED,
+            },
+        )
+
     autocomplete_fields = ["origin_solar_system"]
 
     filter_horizontal = (
@@ -231,7 +320,7 @@ class TrackerAdmin(admin.ModelAdmin):
     )
 
     fieldsets = (
-        (None, {"fields": ("name", "description", "is_enabled", "color")}),
+        (None, {"fields": ("name", "description", "is_enabled", "color", "shard")}),
         (
             "Discord Configuration",
             {
@@ -240,6 +329,9 @@ class TrackerAdmin(admin.ModelAdmin):
                     "ping_type",
                     "ping_groups",
                     "is_posting_name",
+                    "priority",
+                    "battle_mode",
+                    "digest_window",
                 ),
             },
         ),
@@ -28,6 +28,111 @@ KILLTRACKER_STORING_KILLMAILS_ENABLED = clean_setting(
 # When False the webhook will use it's own values as set on the platform
 KILLTRACKER_WEBHOOK_SET_AVATAR = clean_setting("KILLTRACKER_WEBHOOK_SET_AVATAR", True)
 
+# Whether durations of all pipeline stages are recorded as histograms in Redis
+KILLTRACKER_PIPELINE_STATS_ENABLED = clean_setting(
+    "KILLTRACKER_PIPELINE_STATS_ENABLED", False
+)
+
+# Whether trackers are profiled. When enabled DB queries, ESI calls and duration
+# are recorded for each tracker and shown on the admin site
+KILLTRACKER_PROFILING_ENABLED = clean_setting("KILLTRACKER_PROFILING_ENABLED", False)
+
+# Duration of the sliding window in minutes over which profiles are aggregated
+KILLTRACKER_PROFILING_WINDOW = clean_setting(
+    "KILLTRACKER_PROFILING_WINDOW", default_value=60, min_value=5
+)
+
+# Whether metrics are collected and exposed for Prometheus
+KILLTRACKER_METRICS_ENABLED = clean_setting("KILLTRACKER_METRICS_ENABLED", False)
+
+# Optional token required to access the metrics endpoint.
+# Prometheus needs to send it as bearer token in the authorization header.
+KILLTRACKER_METRICS_TOKEN = clean_setting(
+    "KILLTRACKER_METRICS_TOKEN", None, required_type=str
+)
+
+# Killmails with at least this total value in million ISK are sent with high priority
+# Set to 0 to disable
+KILLTRACKER_HIGH_PRIORITY_MIN_VALUE = clean_setting(
+    "KILLTRACKER_HIGH_PRIORITY_MIN_VALUE", 2000
+)
+
+# Max age in minutes of low priority messages waiting to be sent to a webhook.
+# Older messages are dropped. Set to 0 to disable
+KILLTRACKER_WEBHOOK_LOW_PRIORITY_MAX_AGE = clean_setting(
+    "KILLTRACKER_WEBHOOK_LOW_PRIORITY_MAX_AGE", 60
+)
+
+# Default max number of messages waiting to be sent to a webhook.
+# When exceeded messages are dropped according to the webhook's shedding policy.
+# Set to 0 for no limit
+KILLTRACKER_WEBHOOK_MAX_QUEUE_SIZE = clean_setting(
+    "KILLTRACKER_WEBHOOK_MAX_QUEUE_SIZE", 5000
+)
+
+# Time window in minutes for clustering killmails into battles.
+# A battle ends when there was no kill in its systems for this duration
+KILLTRACKER_BATTLE_WINDOW = clean_setting(
+    "KILLTRACKER_BATTLE_WINDOW", default_value=15, min_value=1
+)
+
+# Celery queues for the tasks of each pipeline stage, e.g. {"deliver": "discord"}.
+# Stages are: ingest, match, render, deliver, storage and maintenance.
+# Tasks of stages without a queue run on the default queue
+KILLTRACKER_TASK_QUEUES = clean_setting("KILLTRACKER_TASK_QUEUES", dict())
+
+# Number of shards trackers are distributed over. Each shard is evaluated
+# by one task per killmail on its own queue, when a match queue is configured.
+# 1 disables sharding
+KILLTRACKER_TRACKER_SHARDS = clean_setting(
+    "KILLTRACKER_TRACKER_SHARDS", default_value=1, min_value=1
+)
+
+# Number of processes for evaluating trackers in parallel within a worker.
+# 0 disables the process pool
+KILLTRACKER_PROCESS_POOL_SIZE = clean_setting(
+    "KILLTRACKER_PROCESS_POOL_SIZE", default_value=0, min_value=0
+)
+
+# Path of the universe snapshot file created with killtracker_export_universe.
+# When set, geography of solar systems is looked up from the snapshot
+KILLTRACKER_UNIVERSE_SNAPSHOT_PATH = clean_setting(
+    "KILLTRACKER_UNIVERSE_SNAPSHOT_PATH", None, required_type=str
+)
+
+# Whether trackers and static data are preloaded into the caches
+# when a Celery worker starts
+KILLTRACKER_WARMUP_ON_WORKER_READY = clean_setting(
+    "KILLTRACKER_WARMUP_ON_WORKER_READY", True
+)
+
+# If set to true killmails are only matched when all static data they need
+# is known locally. Other killmails are parked until the data is loaded from ESI
+KILLTRACKER_ESI_FREE_MODE = clean_setting("KILLTRACKER_ESI_FREE_MODE", False)
+
+# Number of consecutive failed calls after which an external service
+# like ESI, ZKB or Discord is considered down and no longer called
+KILLTRACKER_CIRCUIT_BREAKER_FAILURE_THRESHOLD = clean_setting(
+    "KILLTRACKER_CIRCUIT_BREAKER_FAILURE_THRESHOLD", default_value=5, min_value=1
+)
+
+# Time in seconds a service considered down is not called,
+# before calls are tried again
+KILLTRACKER_CIRCUIT_BREAKER_RESET_TIMEOUT = clean_setting(
+    "KILLTRACKER_CIRCUIT_BREAKER_RESET_TIMEOUT", default_value=60, min_value=1
+)
+
+# Number of concurrent requests for fetching killmails from ZKB RedisQ.
+# 1 fetches one killmail at a time
+KILLTRACKER_REDISQ_CONCURRENCY = clean_setting(
+    "KILLTRACKER_REDISQ_CONCURRENCY", default_value=1, min_value=1
+)
+
+# Queue ID for ZKB RedisQ. When not set RedisQ identifies the queue by IP address
+KILLTRACKER_REDISQ_QUEUE_ID = clean_setting(
+    "KILLTRACKER_REDISQ_QUEUE_ID", None, required_type=str
+)
+
 
 #####################
 # INTERNAL SETTINGS
@@ -62,3 +167,34 @@ KILLTRACKER_GENERATE_MESSAGE_RETRY_COUNTDOWN = clean_setting(
 KILLTRACKER_TASK_OBJECTS_CACHE_TIMEOUT = clean_setting(
     "KILLTRACKER_TASK_OBJECTS_CACHE_TIMEOUT", 60
 )
+
+# Max. duration in seconds before a worker flushes its counters to Redis
+KILLTRACKER_METRICS_FLUSH_INTERVAL = clean_setting(
+    "KILLTRACKER_METRICS_FLUSH_INTERVAL", 10
+)
+
+# Max. duration in seconds before a worker refreshes the learned clause statistics
+# of a tracker from Redis
+KILLTRACKER_CLAUSE_STATS_REFRESH_INTERVAL = clean_setting(
+    "KILLTRACKER_CLAUSE_STATS_REFRESH_INTERVAL", 60
+)
+
+# Timeout in seconds for entity names in the shared name cache
+KILLTRACKER_NAMES_CACHE_TIMEOUT = clean_setting(
+    "KILLTRACKER_NAMES_CACHE_TIMEOUT", 3600 * 24
+)
+
+# Max. number of entity names each worker keeps in its local name cache
+KILLTRACKER_NAMES_CACHE_LOCAL_SIZE = clean_setting(
+    "KILLTRACKER_NAMES_CACHE_LOCAL_SIZE", 10000
+)
+
+# Timeout in seconds for the cached embed parts of a killmail shared by all trackers
+KILLTRACKER_EMBED_BASE_CACHE_TIMEOUT = clean_setting(
+    "KILLTRACKER_EMBED_BASE_CACHE_TIMEOUT", 3600
+)
+
+# Min duration in seconds between updates of the message for an ongoing battle
+KILLTRACKER_BATTLE_UPDATE_THROTTLE = clean_setting(
+    "KILLTRACKER_BATTLE_UPDATE_THROTTLE", default_value=30, min_value=5
+)
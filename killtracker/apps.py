@@ -6,3 +6,6 @@ class KillmailsConfig(AppConfig):
     name = "killtracker"
     label = "killtracker"
     verbose_name = f"Killtracker v{__version__}"
+
+    def ready(self):
+        from . import signals  # noqa: F401
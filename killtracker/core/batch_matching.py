@@ -0,0 +1,344 @@
+"""Vectorized matching of many killmails against many trackers
+
+Killmails of a batch are encoded once as NumPy arrays, so that the clauses of each
+tracker can be evaluated for all killmails at once with vectorized masks.
+Clauses, which need to be calculated for each killmail and tracker individually
+like distances and jumps, are evaluated afterwards with the normal matcher
+for the remaining candidates only.
+
+This module requires NumPy, which is an optional dependency.
+"""
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from django.utils.timezone import now
+
+from eveuniverse.models import EveSolarSystem
+
+from ..app_settings import KILLTRACKER_KILLMAIL_MAX_AGE_FOR_TRACKER
+from .circuit_breaker import Service, breaker
+from .killmails import Killmail
+from .matching import (
+    CompiledClauses,
+    KillmailMatcher,
+    compile_clauses,
+    ship_type_group_ids,
+)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# security classes of solar systems
+_SECURITY_UNKNOWN = 0
+_SECURITY_HIGH = 1
+_SECURITY_LOW = 2
+_SECURITY_NULL = 3
+_SECURITY_W_SPACE = 4
+
+# clauses evaluated with the normal matcher, because they depend on the tracker
+_PER_OBJECT_CLAUSES = {"require_max_distance", "require_max_jumps"}
+
+
+def is_available() -> bool:
+    """returns True if NumPy is installed and batch matching can be used"""
+    return np is not None
+
+
+class BatchMatcher:
+    """Matches a batch of killmails against trackers with vectorized masks"""
+
+    def __init__(self, killmails: List[Killmail]) -> None:
+        if not is_available():
+            raise RuntimeError("Batch matching requires NumPy")
+        self.killmails = killmails
+        self._encode_killmails()
+
+    def _encode_killmails(self) -> None:
+        killmails = self.killmails
+        ship_type_ids = set()
+        for killmail in killmails:
+            ship_type_ids |= killmail.ship_type_ids()
+        ship_type_groups = ship_type_group_ids(ship_type_ids)
+        solar_systems = self._solar_systems(
+            {obj.solar_system_id for obj in killmails if obj.solar_system_id}
+        )
+
+        def _id(value: Optional[int]) -> int:
+            return value if value else 0
+
+        self.time = np.array([obj.time.timestamp() for obj in killmails])
+        self.has_zkb = np.array([bool(obj.zkb) for obj in killmails], dtype=bool)
+        self.is_npc = np.array(
+            [bool(obj.zkb and obj.zkb.is_npc) for obj in killmails], dtype=bool
+        )
+        self.value = np.array(
+            [
+                obj.zkb.total_value
+                if obj.zkb and obj.zkb.total_value is not None
+                else np.nan
+                for obj in killmails
+            ],
+            dtype=float,
+        )
+        self.attackers_count = np.array(
+            [len(obj.attackers) for obj in killmails], dtype=np.int64
+        )
+        systems = [solar_systems.get(obj.solar_system_id) for obj in killmails]
+        self.security_class = np.array(
+            [self._security_class(obj) for obj in systems], dtype=np.int8
+        )
+        self.solar_system_id = np.array(
+            [obj.id if obj else 0 for obj in systems], dtype=np.int64
+        )
+        self.constellation_id = np.array(
+            [obj.eve_constellation_id if obj else 0 for obj in systems],
+            dtype=np.int64,
+        )
+        self.region_id = np.array(
+            [obj.eve_constellation.eve_region_id if obj else 0 for obj in systems],
+            dtype=np.int64,
+        )
+        self.victim_alliance_id = np.array(
+            [_id(obj.victim.alliance_id) for obj in killmails], dtype=np.int64
+        )
+        self.victim_corporation_id = np.array(
+            [_id(obj.victim.corporation_id) for obj in killmails], dtype=np.int64
+        )
+        self.victim_ship_type_id = np.array(
+            [_id(obj.victim.ship_type_id) for obj in killmails], dtype=np.int64
+        )
+        self.victim_ship_group_id = np.array(
+            [_id(ship_type_groups.get(obj.victim.ship_type_id)) for obj in killmails],
+            dtype=np.int64,
+        )
+        attackers = [
+            (num, attacker)
+            for num, killmail in enumerate(killmails)
+            for attacker in killmail.attackers
+        ]
+        self.attacker_killmail = np.array([num for num, _ in attackers], dtype=np.int64)
+        self.attacker_alliance_id = np.array(
+            [_id(obj.alliance_id) for _, obj in attackers], dtype=np.int64
+        )
+        self.attacker_corporation_id = np.array(
+            [_id(obj.corporation_id) for _, obj in attackers], dtype=np.int64
+        )
+        self.attacker_ship_type_id = np.array(
+            [_id(obj.ship_type_id) for _, obj in attackers], dtype=np.int64
+        )
+        self.attacker_ship_group_id = np.array(
+            [_id(ship_type_groups.get(obj.ship_type_id)) for _, obj in attackers],
+            dtype=np.int64,
+        )
+
+    @staticmethod
+    def _solar_systems(ids: set) -> Dict[int, EveSolarSystem]:
+        solar_systems = {
+            obj.id: obj
+            for obj in EveSolarSystem.objects.filter(id__in=ids).select_related(
+                "eve_constellation"
+            )
+        }
+        for solar_system_id in ids - set(solar_systems.keys()):
+            with breaker(Service.ESI).guard():
+                (
+                    solar_systems[solar_system_id],
+                    _,
+                ) = EveSolarSystem.objects.get_or_create_esi(id=solar_system_id)
+        return solar_systems
+
+    @staticmethod
+    def _security_class(solar_system: Optional[EveSolarSystem]) -> int:
+        if not solar_system:
+            return _SECURITY_UNKNOWN
+        if solar_system.is_high_sec:
+            return _SECURITY_HIGH
+        if solar_system.is_low_sec:
+            return _SECURITY_LOW
+        if solar_system.is_null_sec:
+            return _SECURITY_NULL
+        if solar_system.is_w_space:
+            return _SECURITY_W_SPACE
+        return _SECURITY_UNKNOWN
+
+    def match_matrix(self, trackers: list, ignore_max_age: bool = False):
+        """returns a boolean matrix of killmails x trackers,
+        which is True where a killmail matches a tracker
+        """
+        matrix = np.zeros((len(self.killmails), len(trackers)), dtype=bool)
+        if not ignore_max_age:
+            threshold = (
+                now() - timedelta(minutes=KILLTRACKER_KILLMAIL_MAX_AGE_FOR_TRACKER)
+            ).timestamp()
+            is_recent = self.time >= threshold
+        else:
+            is_recent = np.ones(len(self.killmails), dtype=bool)
+        for num, tracker in enumerate(trackers):
+            matrix[:, num] = self.match_tracker(tracker, is_recent)
+        return matrix
+
+    def match_tracker(self, tracker, candidates=None):
+        """returns a boolean mask of the killmails matching a tracker"""
+        compiled = tracker._compiled_clauses or compile_clauses(tracker)
+        mask = (
+            np.ones(len(self.killmails), dtype=bool)
+            if candidates is None
+            else candidates.copy()
+        )
+        per_object_clauses = []
+        for clause in compiled.active_clauses:
+            if clause.name in _PER_OBJECT_CLAUSES:
+                per_object_clauses.append(clause.name)
+                continue
+            mask &= getattr(self, f"_mask_{clause.name}")(tracker, compiled)
+            if not mask.any():
+                return mask
+        for clause_name in per_object_clauses:
+            for num in np.flatnonzero(mask):
+                matcher = KillmailMatcher(
+                    tracker=tracker, killmail=self.killmails[num], compiled=compiled
+                )
+                mask[num] = bool(getattr(matcher, f"_check_{clause_name}")())
+        return mask
+
+    def _ids(self, compiled: CompiledClauses, name: str):
+        return np.array(sorted(compiled.related_ids.get(name, set())), dtype=np.int64)
+
+    def _attackers_any(self, values, ids):
+        hits = np.isin(values, ids)
+        counts = np.bincount(
+            self.attacker_killmail[hits], minlength=len(self.killmails)
+        )
+        return counts > 0
+
+    def _attackers_missing_any(self, values, ids):
+        """True for killmails where at least one of the ids is not among attackers"""
+        hits = np.isin(values, ids)
+        pairs = np.unique(
+            np.stack([self.attacker_killmail[hits], values[hits]]), axis=1
+        )
+        counts = np.bincount(pairs[0], minlength=len(self.killmails))
+        return counts < len(ids)
+
+    def _mask_require_min_attackers(self, tracker, compiled):
+        return self.attackers_count >= tracker.require_min_attackers
+
+    def _mask_require_max_attackers(self, tracker, compiled):
+        return self.attackers_count <= tracker.require_max_attackers
+
+    def _mask_exclude_npc_kills(self, tracker, compiled):
+        return self.has_zkb & ~self.is_npc
+
+    def _mask_require_npc_kills(self, tracker, compiled):
+        return self.is_npc
+
+    def _mask_require_min_value(self, tracker, compiled):
+        with np.errstate(invalid="ignore"):
+            return self.value >= tracker.require_min_value * 1000000
+
+    def _mask_exclude_high_sec(self, tracker, compiled):
+        return self.security_class != _SECURITY_HIGH
+
+    def _mask_exclude_low_sec(self, tracker, compiled):
+        return self.security_class != _SECURITY_LOW
+
+    def _mask_exclude_null_sec(self, tracker, compiled):
+        return self.security_class != _SECURITY_NULL
+
+    def _mask_exclude_w_space(self, tracker, compiled):
+        return self.security_class != _SECURITY_W_SPACE
+
+    def _mask_require_regions(self, tracker, compiled):
+        return np.isin(self.region_id, self._ids(compiled, "require_regions"))
+
+    def _mask_require_constellations(self, tracker, compiled):
+        return np.isin(
+            self.constellation_id, self._ids(compiled, "require_constellations")
+        )
+
+    def _mask_require_solar_systems(self, tracker, compiled):
+        return np.isin(
+            self.solar_system_id, self._ids(compiled, "require_solar_systems")
+        )
+
+    def _mask_exclude_attacker_alliances(self, tracker, compiled):
+        return self._attackers_missing_any(
+            self.attacker_alliance_id,
+            self._ids(compiled, "exclude_attacker_alliances"),
+        )
+
+    def _mask_require_attacker_alliances(self, tracker, compiled):
+        return self._attackers_any(
+            self.attacker_alliance_id,
+            self._ids(compiled, "require_attacker_alliances"),
+        )
+
+    def _mask_exclude_attacker_corporations(self, tracker, compiled):
+        return self._attackers_missing_any(
+            self.attacker_corporation_id,
+            self._ids(compiled, "exclude_attacker_corporations"),
+        )
+
+    def _mask_require_attacker_corporations(self, tracker, compiled):
+        return self._attackers_any(
+            self.attacker_corporation_id,
+            self._ids(compiled, "require_attacker_corporations"),
+        )
+
+    def _mask_require_victim_alliances(self, tracker, compiled):
+        return np.isin(
+            self.victim_alliance_id, self._ids(compiled, "require_victim_alliances")
+        )
+
+    def _mask_require_victim_corporations(self, tracker, compiled):
+        return np.isin(
+            self.victim_corporation_id,
+            self._ids(compiled, "require_victim_corporations"),
+        )
+
+    def _mask_require_victim_ship_groups(self, tracker, compiled):
+        return np.isin(
+            self.victim_ship_group_id,
+            self._ids(compiled, "require_victim_ship_groups"),
+        )
+
+    def _mask_require_victim_ship_types(self, tracker, compiled):
+        return np.isin(
+            self.victim_ship_type_id, self._ids(compiled, "require_victim_ship_types")
+        )
+
+    def _mask_require_attackers_ship_groups(self, tracker, compiled):
+        return self._attackers_any(
+            self.attacker_ship_group_id,
+            self._ids(compiled, "require_attackers_ship_groups"),
+        )
+
+    def _mask_require_attackers_ship_types(self, tracker, compiled):
+        return self._attackers_any(
+            self.attacker_ship_type_id,
+            self._ids(compiled, "require_attackers_ship_types"),
+        )
+
+
+def match_killmails(
+    trackers: list, killmails: List[Killmail], ignore_max_age: bool = False
+) -> List[List[Optional[Killmail]]]:
+    """matches a batch of killmails against trackers
+
+    returns for each killmail a list with the processed killmail of each tracker
+    in the order of the trackers or None if the tracker is not matching
+    """
+    matrix = BatchMatcher(killmails).match_matrix(trackers, ignore_max_age)
+    results = []
+    for row, killmail in zip(matrix, killmails):
+        results.append(
+            [
+                tracker.process_killmail(killmail, ignore_max_age=True)
+                if is_match
+                else None
+                for tracker, is_match in zip(trackers, row)
+            ]
+        )
+    return results
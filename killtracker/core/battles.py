@@ -0,0 +1,221 @@
+"""Clustering of killmails into battles
+
+Incoming killmails are grouped into battles by solar system and time.
+A killmail belongs to an ongoing battle, when another killmail of that battle
+occurred in the same or a neighbouring solar system within the battle window.
+
+Battles are maintained incrementally in Redis. All keys expire after the window,
+so memory is bounded by the number of battles active at the same time.
+"""
+from dataclasses import dataclass
+import datetime as dt
+from time import time
+from typing import List, Optional, Set, Tuple
+
+from django.core.cache import cache
+
+from allianceauth.services.hooks import get_extension_logger
+from eveuniverse.models import EveStargate
+
+from .. import __title__
+from ..app_settings import KILLTRACKER_BATTLE_WINDOW
+from ..utils import LoggerAddTag
+from .killmails import BattleInfo, Killmail
+
+logger = LoggerAddTag(get_extension_logger(__name__), __title__)
+
+NEIGHBOURS_CACHE_TIMEOUT = 86400
+
+# assigns a killmail to an ongoing battle in the same or a neighbouring system
+# or starts a new battle. Extends the window of the battle for the own system.
+# KEYS: sequence, own system, neighbour systems - ARGV: window in seconds
+# returns battle ID and 1 if the battle is new else 0
+_ASSIGN_SCRIPT = """
+local battle_id = false
+for i = 2, #KEYS do
+    battle_id = redis.call('GET', KEYS[i])
+    if battle_id then
+        break
+    end
+end
+local is_new = 0
+if not battle_id then
+    battle_id = redis.call('INCR', KEYS[1])
+    is_new = 1
+end
+redis.call('SET', KEYS[2], battle_id, 'EX', ARGV[1])
+return {tonumber(battle_id), is_new}
+"""
+
+
+@dataclass
+class Battle:
+    """Summary of an ongoing battle"""
+
+    id: int
+    killmail_count: int
+    total_value: float
+    started: dt.datetime
+    last_kill: dt.datetime
+    solar_systems: List[Tuple[int, int]]
+
+
+def _window_seconds() -> int:
+    return KILLTRACKER_BATTLE_WINDOW * 60
+
+
+def _sequence_key() -> str:
+    return f"{__title__}_battle_sequence"
+
+
+def _solar_system_key(solar_system_id: int) -> str:
+    return f"{__title__}_battle_solar_system_{solar_system_id}"
+
+
+def _battle_key(battle_id: int) -> str:
+    return f"{__title__}_battle_{battle_id}"
+
+
+def _battle_solar_systems_key(battle_id: int) -> str:
+    return f"{__title__}_battle_{battle_id}:solar_systems"
+
+
+def _battle_trackers_key(battle_id: int) -> str:
+    return f"{__title__}_battle_{battle_id}:trackers"
+
+
+def neighbour_solar_system_ids(solar_system_id: int) -> Set[int]:
+    """returns IDs of solar systems connected by stargates to the given system.
+
+    Returns an empty set if stargates have not been loaded for eveuniverse.
+    """
+    key = f"{__title__}_solar_system_neighbours_{solar_system_id}"
+    ids = cache.get(key)
+    if ids is None:
+        ids = list(
+            EveStargate.objects.filter(
+                eve_solar_system_id=solar_system_id,
+                destination_eve_solar_system__isnull=False,
+            ).values_list("destination_eve_solar_system_id", flat=True)
+        )
+        cache.set(key, ids, timeout=NEIGHBOURS_CACHE_TIMEOUT)
+    return set(ids)
+
+
+def assign_battle(killmail: Killmail) -> Optional[BattleInfo]:
+    """assigns a killmail to a battle and updates the battle
+
+    returns info about the assigned battle
+    or None if the killmail has no solar system
+    """
+    if not killmail.solar_system_id:
+        return None
+    window = _window_seconds()
+    neighbour_keys = [
+        _solar_system_key(obj)
+        for obj in sorted(neighbour_solar_system_ids(killmail.solar_system_id))
+    ]
+    conn = cache.get_master_client()
+    script = conn.register_script(_ASSIGN_SCRIPT)
+    battle_id, is_new = script(
+        keys=[_sequence_key(), _solar_system_key(killmail.solar_system_id)]
+        + neighbour_keys,
+        args=[window],
+    )
+    battle_id = int(battle_id)
+    battle_key = _battle_key(battle_id)
+    systems_key = _battle_solar_systems_key(battle_id)
+    trackers_key = _battle_trackers_key(battle_id)
+    pipe = conn.pipeline()
+    pipe.hincrby(battle_key, "killmail_count", 1)
+    if killmail.zkb and killmail.zkb.total_value:
+        pipe.hincrbyfloat(battle_key, "total_value", killmail.zkb.total_value)
+    now_ts = time()
+    pipe.hsetnx(battle_key, "started", now_ts)
+    pipe.hset(battle_key, "last_kill", now_ts)
+    pipe.zincrby(systems_key, 1, killmail.solar_system_id)
+    pipe.expire(battle_key, window * 2)
+    pipe.expire(systems_key, window * 2)
+    pipe.expire(trackers_key, window * 2)
+    killmail_count = pipe.execute()[0]
+    return BattleInfo(
+        battle_id=battle_id, is_new=bool(is_new), killmail_count=int(killmail_count)
+    )
+
+
+def battle(battle_id: int) -> Optional[Battle]:
+    """returns the summary of a battle or None if it does not exist"""
+    pipe = cache.get_master_client().pipeline()
+    pipe.hgetall(_battle_key(battle_id))
+    pipe.zrevrange(_battle_solar_systems_key(battle_id), 0, -1, withscores=True)
+    data, solar_systems = pipe.execute()
+    data = {key.decode("utf8"): value for key, value in data.items()}
+    if not data:
+        return None
+    return Battle(
+        id=battle_id,
+        killmail_count=int(data.get("killmail_count", 0)),
+        total_value=float(data.get("total_value", 0)),
+        started=dt.datetime.fromtimestamp(float(data["started"]), tz=dt.timezone.utc),
+        last_kill=dt.datetime.fromtimestamp(
+            float(data["last_kill"]), tz=dt.timezone.utc
+        ),
+        solar_systems=[(int(obj), int(count)) for obj, count in solar_systems],
+    )
+
+
+def claim_alert(battle_id: int, tracker_pk: int) -> bool:
+    """claims the alert for a battle for a tracker.
+
+    returns True if the tracker has not yet alerted for this battle
+    """
+    key = _battle_trackers_key(battle_id)
+    pipe = cache.get_master_client().pipeline()
+    pipe.hsetnx(key, f"alert:{tracker_pk}", 1)
+    pipe.expire(key, _window_seconds() * 2)
+    is_claimed, _ = pipe.execute()
+    return bool(is_claimed)
+
+
+def _update_key(battle_id: int, tracker_pk: int) -> str:
+    return f"{__title__}_battle_{battle_id}_tracker_{tracker_pk}_update"
+
+
+def set_message_id(battle_id: int, tracker_pk: int, message_id: int) -> None:
+    """stores the ID of the Discord message posted by a tracker for a battle"""
+    key = _battle_trackers_key(battle_id)
+    pipe = cache.get_master_client().pipeline()
+    pipe.hset(key, f"message:{tracker_pk}", message_id)
+    pipe.expire(key, _window_seconds() * 2)
+    pipe.execute()
+
+
+def message_id(battle_id: int, tracker_pk: int) -> Optional[int]:
+    """returns the ID of the Discord message posted by a tracker for a battle
+    or None if not known
+    """
+    value = cache.get_master_client().hget(
+        _battle_trackers_key(battle_id), f"message:{tracker_pk}"
+    )
+    return int(value) if value else None
+
+
+def claim_update(battle_id: int, tracker_pk: int, throttle: int) -> bool:
+    """claims the next update of the message for a battle.
+    Only one update can be claimed within the throttle duration in seconds.
+
+    returns True if the update was claimed
+    """
+    return bool(
+        cache.get_master_client().set(
+            _update_key(battle_id, tracker_pk), 1, nx=True, ex=throttle
+        )
+    )
+
+
+def clear_battles() -> None:
+    """deletes all battles"""
+    conn = cache.get_master_client()
+    keys = list(conn.scan_iter(f"{__title__}_battle_*"))
+    if keys:
+        conn.delete(*keys)
@@ -0,0 +1,216 @@
+"""Circuit breakers for external services
+
+The health of ESI, ZKB and Discord is tracked from the outcomes of actual calls,
+so no extra requests are needed to check if a service is online.
+After too many consecutive failures the circuit of a service is opened
+and calls are refused without network access until the reset timeout has passed.
+The circuit is then half-open and a single call is let through as a trial,
+while other calls are still refused: a success closes the circuit,
+while a failure opens it again right away.
+
+The state is kept in Redis, so that all workers share it.
+"""
+from contextlib import contextmanager
+from typing import Iterator
+
+from bravado.exception import (
+    BravadoConnectionError,
+    BravadoTimeoutError,
+    HTTPServerError,
+)
+import requests
+
+from django.core.cache import cache
+
+from allianceauth.services.hooks import get_extension_logger
+
+from .. import __title__
+from ..app_settings import (
+    KILLTRACKER_CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+    KILLTRACKER_CIRCUIT_BREAKER_RESET_TIMEOUT,
+)
+from ..exceptions import ServiceUnavailable
+from ..utils import LoggerAddTag
+
+logger = LoggerAddTag(get_extension_logger(__name__), __title__)
+
+# HTTP status codes from this value on are failures of the service
+HTTP_SERVER_ERROR = 500
+
+# Max duration of a trial call in seconds. Another trial call is let through
+# after this time, e.g. when the worker making the trial call was terminated
+TRIAL_TIMEOUT = 30
+
+
+class Service:
+    """External services with a circuit breaker"""
+
+    ESI = "esi"
+    ZKB = "zkb"
+    DISCORD = "discord"
+
+    ALL = [ESI, ZKB, DISCORD]
+
+
+def is_service_failure(ex: Exception) -> bool:
+    """returns True if the exception means the called service failed,
+    e.g. a timeout or a server error, but not a client error like 404
+    """
+    if isinstance(ex, requests.HTTPError):
+        return ex.response is None or ex.response.status_code >= HTTP_SERVER_ERROR
+    return isinstance(
+        ex,
+        (
+            requests.ConnectionError,
+            requests.Timeout,
+            BravadoConnectionError,
+            BravadoTimeoutError,
+            HTTPServerError,
+        ),
+    )
+
+
+class _Call:
+    """A guarded call to a service"""
+
+    def __init__(self) -> None:
+        self.is_failed = False
+
+    def failed(self) -> None:
+        """marks this call as failed, e.g. when a response had a server error"""
+        self.is_failed = True
+
+    def check_status(self, status_code: int) -> None:
+        """marks this call as failed if the status code is a server error"""
+        if status_code >= HTTP_SERVER_ERROR:
+            self.failed()
+
+
+class CircuitBreaker:
+    """Circuit breaker for an external service"""
+
+    def __init__(
+        self,
+        service: str,
+        failure_threshold: int = KILLTRACKER_CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+        reset_timeout: int = KILLTRACKER_CIRCUIT_BREAKER_RESET_TIMEOUT,
+    ) -> None:
+        self.service = service
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(service='{self.service}')"
+
+    @property
+    def _open_key(self) -> str:
+        return f"{__title__}_circuit_{self.service}_open"
+
+    @property
+    def _failures_key(self) -> str:
+        return f"{__title__}_circuit_{self.service}_failures"
+
+    @property
+    def _trial_key(self) -> str:
+        return f"{__title__}_circuit_{self.service}_trial"
+
+    def _is_half_open(self) -> bool:
+        """returns True if the reset timeout of an opened circuit has passed"""
+        return self.failures() >= self.failure_threshold and not cache.get(
+            self._open_key
+        )
+
+    def is_available(self) -> bool:
+        """returns True if the service can be called"""
+        if cache.get(self._open_key):
+            return False
+        return not (self._is_half_open() and cache.get(self._trial_key))
+
+    def retry_after(self) -> int:
+        """returns time in seconds until the service will be called again"""
+        return cache.ttl(self._open_key) or cache.ttl(self._trial_key) or 0
+
+    def failures(self) -> int:
+        """returns the number of consecutive failed calls"""
+        value = cache.get_master_client().get(self._failures_key)
+        return int(value) if value else 0
+
+    def record_success(self) -> None:
+        """records a successful call and closes the circuit"""
+        if cache.get_master_client().delete(self._failures_key):
+            cache.delete(self._open_key)
+            logger.info("%s: Service has recovered", self.service)
+
+    def record_failure(self) -> None:
+        """records a failed call and opens the circuit
+        when the failure threshold is reached
+        """
+        with cache.get_master_client().pipeline() as pipe:
+            pipe.incr(self._failures_key)
+            # failures are kept beyond the reset timeout,
+            # so that a failed trial call opens the circuit again right away
+            pipe.expire(self._failures_key, self.reset_timeout * 2)
+            failures, _ = pipe.execute()
+        if failures >= self.failure_threshold:
+            cache.set(self._open_key, True, timeout=self.reset_timeout)
+            logger.warning(
+                "%s: Service considered down after %d failed calls. "
+                "Pausing calls for %d seconds",
+                self.service,
+                failures,
+                self.reset_timeout,
+            )
+
+    def check(self) -> None:
+        """raises ServiceUnavailable if the service can not be called"""
+        if not self.is_available():
+            raise ServiceUnavailable(self.service, self.retry_after())
+
+    @contextmanager
+    def guard(self) -> Iterator[_Call]:
+        """guards a call to the service and records its outcome.
+
+        Raises ServiceUnavailable without calling the service when it is down
+        or when another call is already being tried while the circuit is half-open.
+        """
+        self.check()
+        is_trial = self._is_half_open()
+        if is_trial and not cache.add(self._trial_key, True, timeout=TRIAL_TIMEOUT):
+            raise ServiceUnavailable(self.service, self.retry_after())
+        call = _Call()
+        try:
+            try:
+                yield call
+            except Exception as ex:
+                if is_service_failure(ex):
+                    self.record_failure()
+                raise
+            if call.is_failed:
+                self.record_failure()
+            else:
+                self.record_success()
+        finally:
+            if is_trial:
+                cache.delete(self._trial_key)
+
+    def reset(self) -> None:
+        """closes the circuit and forgets all failures"""
+        cache.get_master_client().delete(self._failures_key)
+        cache.delete(self._open_key)
+        cache.delete(self._trial_key)
+
+
+def breaker(service: str) -> CircuitBreaker:
+    """returns the circuit breaker for a service"""
+    return CircuitBreaker(service)
+
+
+def is_service_available(service: str) -> bool:
+    """returns True if the service can be called"""
+    return breaker(service).is_available()
+
+
+def reset_breakers() -> None:
+    """closes the circuits of all services"""
+    for service in Service.ALL:
+        breaker(service).reset()
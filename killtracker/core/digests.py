@@ -0,0 +1,125 @@
+"""Digests of killmails matched by a tracker
+
+Killmails matched by a tracker in digest mode are aggregated incrementally in Redis
+and periodically posted as one summary message.
+The memory needed for a digest is bounded by the number of distinct entities
+in its window and all keys expire, in case a digest is never sent.
+"""
+from dataclasses import dataclass
+import datetime as dt
+from time import time
+from typing import Dict, List, Optional, Tuple
+
+from django.core.cache import cache
+
+from .. import __title__
+from .killmails import Killmail
+
+# Max duration in seconds a digest is kept in addition to its window
+DIGEST_EXPIRY_MARGIN = 3600
+
+
+@dataclass
+class Digest:
+    """Summary of killmails matched by a tracker within a window"""
+
+    tracker_pk: int
+    count: int
+    total_value: float
+    started: dt.datetime
+    top_ship_types: List[Tuple[int, int]]
+    top_attacker_orgs: List[Tuple[int, int]]
+    top_solar_systems: List[Tuple[int, int]]
+    most_valuable_killmail: Optional[Tuple[int, float]] = None
+
+    def entity_ids(self) -> List[int]:
+        ids = set()
+        for top_list in [
+            self.top_ship_types,
+            self.top_attacker_orgs,
+            self.top_solar_systems,
+        ]:
+            ids |= {entity_id for entity_id, _ in top_list}
+        return sorted(ids)
+
+
+def _keys(tracker_pk: int) -> Dict[str, str]:
+    base = f"{__title__}_digest_tracker_{tracker_pk}"
+    return {
+        "summary": base,
+        "ship_types": f"{base}:ship_types",
+        "attacker_orgs": f"{base}:attacker_orgs",
+        "solar_systems": f"{base}:solar_systems",
+        "values": f"{base}:values",
+    }
+
+
+def add_killmail(tracker_pk: int, killmail: Killmail, window: int) -> bool:
+    """adds a killmail to the current digest of a tracker
+
+    returns True if this killmail started a new digest
+    """
+    keys = _keys(tracker_pk)
+    pipe = cache.get_master_client().pipeline()
+    pipe.hincrby(keys["summary"], "count", 1)
+    pipe.hsetnx(keys["summary"], "started", time())
+    total_value = killmail.zkb.total_value if killmail.zkb else None
+    if total_value:
+        pipe.hincrbyfloat(keys["summary"], "total_value", total_value)
+        pipe.zadd(keys["values"], {killmail.id: total_value})
+        pipe.zremrangebyrank(keys["values"], 0, -2)
+    if killmail.victim and killmail.victim.ship_type_id:
+        pipe.zincrby(keys["ship_types"], 1, killmail.victim.ship_type_id)
+    attacker_org_ids = {
+        attacker.alliance_id or attacker.corporation_id
+        for attacker in killmail.attackers
+        if attacker.alliance_id or attacker.corporation_id
+    }
+    for org_id in attacker_org_ids:
+        pipe.zincrby(keys["attacker_orgs"], 1, org_id)
+    if killmail.solar_system_id:
+        pipe.zincrby(keys["solar_systems"], 1, killmail.solar_system_id)
+    for key in keys.values():
+        pipe.expire(key, window + DIGEST_EXPIRY_MARGIN)
+    count = pipe.execute()[0]
+    return count == 1
+
+
+def _decode_top_list(items: list) -> List[Tuple[int, int]]:
+    return [(int(member), int(score)) for member, score in items]
+
+
+def pop_digest(tracker_pk: int, top: int = 5) -> Optional[Digest]:
+    """removes the current digest of a tracker and returns it.
+    Returns None if there is no digest.
+    """
+    keys = _keys(tracker_pk)
+    pipe = cache.get_master_client().pipeline(transaction=True)
+    pipe.hgetall(keys["summary"])
+    for name in ["ship_types", "attacker_orgs", "solar_systems"]:
+        pipe.zrevrange(keys[name], 0, top - 1, withscores=True)
+    pipe.zrevrange(keys["values"], 0, 0, withscores=True)
+    pipe.delete(*keys.values())
+    summary, ship_types, attacker_orgs, solar_systems, values, _ = pipe.execute()
+    summary = {key.decode("utf8"): value for key, value in summary.items()}
+    count = int(summary.get("count", 0))
+    if not count:
+        return None
+    return Digest(
+        tracker_pk=tracker_pk,
+        count=count,
+        total_value=float(summary.get("total_value", 0)),
+        started=dt.datetime.fromtimestamp(
+            float(summary["started"]), tz=dt.timezone.utc
+        ),
+        top_ship_types=_decode_top_list(ship_types),
+        top_attacker_orgs=_decode_top_list(attacker_orgs),
+        top_solar_systems=_decode_top_list(solar_systems),
+        most_valuable_killmail=(
+            (int(values[0][0]), float(values[0][1])) if values else None
+        ),
+    )
+
+
+def clear_digest(tracker_pk: int) -> None:
+    cache.get_master_client().delete(*_keys(tracker_pk).values())
@@ -0,0 +1,70 @@
+"""Cached mapping of Auth groups to Discord roles for pinging groups
+
+The mapping is refreshed periodically and when groups change by a task,
+so that generating messages never needs to call the Discord API.
+When a refresh fails the last known mapping is kept.
+"""
+from typing import Dict, Iterable, Optional
+
+from requests.exceptions import HTTPError
+
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+
+from allianceauth.services.hooks import get_extension_logger
+from allianceauth.services.modules.discord.models import DiscordUser
+
+from .. import __title__
+from ..utils import LoggerAddTag
+
+logger = LoggerAddTag(get_extension_logger(__name__), __title__)
+
+CACHE_KEY = f"{__title__}_discord_group_roles"
+
+
+def group_roles() -> Dict[int, Optional[int]]:
+    """returns the last known mapping of group PKs to Discord role IDs.
+    Groups without a matching role are mapped to None.
+    """
+    return cache.get(CACHE_KEY) or dict()
+
+
+def refresh_group_roles(groups: Iterable[Group]) -> Dict[int, Optional[int]]:
+    """refreshes the mapping for the given groups from the Discord API
+    and returns the updated mapping
+    """
+    mapping = group_roles()
+    for group in groups:
+        try:
+            role = DiscordUser.objects.group_to_role(group)
+        except HTTPError:
+            logger.warning(
+                "Failed to get Discord role for group %s. Keeping last known role.",
+                group,
+                exc_info=True,
+            )
+        else:
+            mapping[group.pk] = int(role["id"]) if role else None
+
+    cache.set(CACHE_KEY, mapping, timeout=None)
+    return mapping
+
+
+def group_role_id(group: Group) -> Optional[int]:
+    """returns the Discord role ID for a group from cache or None if not known.
+    Schedules a refresh when the group is not yet in the cache.
+    """
+    mapping = group_roles()
+    if group.pk not in mapping:
+        from ..tasks import update_discord_group_roles
+
+        logger.info("Discord role for group %s not yet known", group)
+        update_discord_group_roles.delay()
+        return None
+
+    return mapping[group.pk]
+
+
+def clear_group_roles() -> None:
+    """clears the cached mapping"""
+    cache.delete(CACHE_KEY)
@@ -0,0 +1,177 @@
+"""Parallel evaluation of trackers in a process pool
+
+Matching killmails with many attackers against many trackers is CPU bound.
+The engine evaluates trackers in a pool of forked processes, which inherit
+all trackers with their compiled clauses from the dispatching process.
+Each call then only sends the killmails to the workers and returns the results
+to the dispatching process.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import multiprocessing
+import os
+import sys
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from django.db import connections
+
+from allianceauth.services.hooks import get_extension_logger
+
+from .. import __title__
+from ..app_settings import KILLTRACKER_PROCESS_POOL_SIZE
+from ..utils import LoggerAddTag
+from .killmails import Killmail
+from .metrics import Stage, measure_stage, tracker_label
+
+logger = LoggerAddTag(get_extension_logger(__name__), __title__)
+
+# trackers of each engine. Set before the pool processes of an engine are forked,
+# so that they inherit them
+_engine_trackers: Dict[int, list] = dict()
+_engine_ids = itertools.count(1)
+
+# PID of the pool worker process which has been initialized
+_worker_pid = None
+
+
+def _init_worker() -> None:
+    """initializes a pool worker process once after it has been forked"""
+    global _worker_pid
+    if _worker_pid == os.getpid():
+        return
+    _worker_pid = os.getpid()
+    connections.close_all()
+
+
+def _match_trackers(
+    engine_id: int, start: int, stop: int, killmails_json: List[str]
+) -> List[List[Optional[str]]]:
+    """evaluates a slice of the trackers of an engine against killmails
+
+    returns for each killmail the processed killmails of matching trackers
+    or None for trackers not matching
+    """
+    _init_worker()
+    trackers = _engine_trackers[engine_id][start:stop]
+    results = []
+    for killmail_json in killmails_json:
+        killmail = Killmail.from_json(killmail_json)
+        matches = []
+        for tracker in trackers:
+            with measure_stage(Stage.MATCH, tracker_label(tracker.pk)):
+                killmail_new = tracker.process_killmail(killmail)
+            matches.append(killmail_new.asjson() if killmail_new else None)
+        results.append(matches)
+    return results
+
+
+def trackers_stamp(trackers: list) -> Tuple:
+    """returns a stamp of the content of the given trackers,
+    which changes when trackers are added, removed or changed
+    """
+    return tuple((tracker.pk, tracker.change_stamp) for tracker in trackers)
+
+
+class TrackerEngine:
+    """Evaluates trackers against killmails in a pool of processes"""
+
+    def __init__(self, trackers: list, pool_size: int) -> None:
+        self.trackers = trackers
+        self.stamp = trackers_stamp(trackers)
+        self.pool_size = max(1, pool_size)
+        self._id = next(_engine_ids)
+        self._is_started = False
+        _engine_trackers[self._id] = trackers
+        # initializer needs Python 3.7, so trackers are passed on by forking
+        if sys.version_info >= (3, 7):
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.pool_size,
+                mp_context=multiprocessing.get_context("fork"),
+            )
+        else:
+            # always forks on Linux
+            self._executor = ProcessPoolExecutor(max_workers=self.pool_size)
+
+    def match(self, killmails: List[Killmail]) -> List[List[Optional[Killmail]]]:
+        """evaluates all trackers against the given killmails
+
+        returns for each killmail a list with the processed killmail of each tracker
+        in the order of the trackers or None if the tracker is not matching
+        """
+        if not killmails or not self.trackers:
+            return [[] for _ in killmails]
+        killmails_json = [killmail.asjson() for killmail in killmails]
+        if not self._is_started:
+            # pool processes are forked on the first call and must not inherit
+            # open DB connections, which they would share with this process
+            connections.close_all()
+            self._is_started = True
+        chunk_size = -(-len(self.trackers) // self.pool_size)
+        futures = [
+            self._executor.submit(
+                _match_trackers, self._id, start, start + chunk_size, killmails_json
+            )
+            for start in range(0, len(self.trackers), chunk_size)
+        ]
+        results = [[] for _ in killmails]
+        for future in futures:
+            for num, matches in enumerate(future.result()):
+                results[num] += [
+                    Killmail.from_json(obj) if obj else None for obj in matches
+                ]
+        return results
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+        _engine_trackers.pop(self._id, None)
+
+
+class _ShardEngines:
+    """Thread-safe cache of the engines for each shard of this worker process"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._engines: Dict[int, TrackerEngine] = dict()
+
+    def get(self, shard: int, trackers: list) -> TrackerEngine:
+        with self._lock:
+            engine = self._engines.get(shard)
+            if engine and engine.stamp == trackers_stamp(trackers):
+                return engine
+            if engine:
+                engine.shutdown()
+            logger.info(
+                "Starting process pool with %d workers for shard %d",
+                KILLTRACKER_PROCESS_POOL_SIZE,
+                shard,
+            )
+            engine = TrackerEngine(trackers, KILLTRACKER_PROCESS_POOL_SIZE)
+            self._engines[shard] = engine
+            return engine
+
+    def clear(self) -> None:
+        with self._lock:
+            for engine in self._engines.values():
+                engine.shutdown()
+            self._engines.clear()
+
+
+_shard_engines = _ShardEngines()
+
+
+def is_engine_enabled() -> bool:
+    """returns True if trackers are evaluated in a process pool"""
+    return KILLTRACKER_PROCESS_POOL_SIZE > 0
+
+
+def shard_engine(shard: int, trackers: list) -> TrackerEngine:
+    """returns the engine for the trackers of a shard.
+    A new engine is started when the trackers have been changed.
+    """
+    return _shard_engines.get(shard, trackers)
+
+
+def shutdown_engines() -> None:
+    """shuts down all engines of this worker process"""
+    _shard_engines.clear()
@@ -0,0 +1,67 @@
+"""Concurrent fetching of killmails from ZKB RedisQ
+
+RedisQ returns at most one killmail per long-poll request, which limits
+the throughput of a single listener during peak hours.
+Concurrent listeners share the same RedisQ queue, so each receives
+different killmails. Killmails received more than once, e.g. after a listener
+timed out or from overlapping runs, are dropped before matching
+and the remaining killmails are handed on in order of their kill time.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from django.core.cache import cache
+
+from allianceauth.services.hooks import get_extension_logger
+
+from .. import __title__
+from ..utils import LoggerAddTag
+from .killmails import Killmail
+
+logger = LoggerAddTag(get_extension_logger(__name__), __title__)
+
+RECEIVED_KILLMAIL_TIMEOUT = 3600
+
+
+def _received_key(killmail_id: int) -> str:
+    return f"{__title__}_received_killmail_{killmail_id}"
+
+
+def is_new_killmail(killmail_id: int) -> bool:
+    """returns True if a killmail has not been received before
+    and marks it as received
+    """
+    return cache.add(
+        _received_key(killmail_id), True, timeout=RECEIVED_KILLMAIL_TIMEOUT
+    )
+
+
+def fetch_killmails(concurrency: int, queue_id: str = None) -> List[Killmail]:
+    """fetches killmails from ZKB RedisQ with concurrent requests
+
+    returns the new killmails received ordered by kill time.
+    Raises the error of the first failed request if no killmail was received.
+    """
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [
+            executor.submit(Killmail.create_from_zkb_redisq, queue_id=queue_id)
+            for _ in range(concurrency)
+        ]
+    killmails = []
+    error: Optional[Exception] = None
+    for future in futures:
+        try:
+            killmail = future.result()
+        except Exception as ex:
+            logger.warning("Failed to fetch killmail from ZKB RedisQ", exc_info=True)
+            error = error or ex
+            continue
+        if not killmail:
+            continue
+        if is_new_killmail(killmail.id):
+            killmails.append(killmail)
+        else:
+            logger.debug("Dropped duplicate killmail %d", killmail.id)
+    if error and not killmails:
+        raise error
+    return sorted(killmails, key=lambda obj: (obj.time, obj.id))
@@ -1,7 +1,8 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, field
 import json
-from typing import List, Optional, Set
+from typing import Dict, Iterable, List, Optional, Set
 
 from dacite import from_dict, DaciteError
 import requests
@@ -14,6 +15,8 @@ from allianceauth.services.hooks import get_extension_logger
 from .. import __title__, USER_AGENT_TEXT
 from ..app_settings import KILLTRACKER_REDISQ_TTW
 from ..providers import esi
+from .circuit_breaker import Service, breaker
+from .metrics import Stage, measure_stage
 from ..utils import LoggerAddTag, JSONDateTimeDecoder, JSONDateTimeEncoder
 
 
@@ -23,6 +26,12 @@ ZKB_REDISQ_URL = "https://redisq.zkillboard.com/listen.php"
 ZKB_API_URL = "https://zkillboard.com/api/"
 ZKB_KILLMAIL_BASEURL = "https://zkillboard.com/kill/"
 REQUESTS_TIMEOUT = (5, 30)
+ZKB_API_CACHE_TIMEOUT = 3600 * 24
+ZKB_API_MAX_WORKERS = 5
+
+
+def _zkb_api_cache_key(killmail_id: int) -> str:
+    return f"{__title__.upper()}_KILLMAIL_{killmail_id}"
 
 
 @dataclass
@@ -113,6 +122,29 @@ class TrackerInfo(_KillmailBase):
     matching_ship_type_ids: Optional[List[int]] = None
 
 
+@dataclass
+class BattleInfo(_KillmailBase):
+    battle_id: int
+    is_new: bool = False
+    killmail_count: int = 1
+
+
+@dataclass
+class KillmailEmbedBase:
+    """Parts of a Discord embed for a killmail, which are the same for all trackers"""
+
+    description: str
+    title: str
+    solar_system_name: str
+    thumbnail_url: str
+    url: str
+    footer_icon_url: str
+    author_name: Optional[str] = None
+    author_url: Optional[str] = None
+    author_icon_url: Optional[str] = None
+    names: Dict[int, str] = field(default_factory=dict)
+
+
 @dataclass
 class Killmail(_KillmailBase):
     id: int
@@ -123,6 +155,7 @@ class Killmail(_KillmailBase):
     zkb: KillmailZkb
     solar_system_id: Optional[int] = None
     tracker_info: Optional[TrackerInfo] = None
+    battle_info: Optional[BattleInfo] = None
 
     def __repr__(self):
         return f"{type(self).__name__}(id={self.id})"
@@ -193,87 +226,166 @@ class Killmail(_KillmailBase):
         return cls.from_dict(json.loads(json_str, cls=JSONDateTimeDecoder))
 
     @classmethod
-    def create_from_zkb_redisq(cls) -> "Killmail":
+    def create_from_zkb_redisq(cls, queue_id: str = None) -> "Killmail":
         """Fetches and returns a killmail from ZKB.
 
+        Params:
+        - queue_id: ID of the RedisQ queue, else RedisQ uses the IP address
+
         Returns None if no killmail is received.
         """
         logger.info("Trying to fetch killmail from ZKB RedisQ...")
-        r = requests.get(
-            ZKB_REDISQ_URL,
-            params={"ttw": KILLTRACKER_REDISQ_TTW},
-            timeout=REQUESTS_TIMEOUT,
-            headers={"User-Agent": USER_AGENT_TEXT},
-        )
-        r.raise_for_status()
-        data = r.json()
+        params = {"ttw": KILLTRACKER_REDISQ_TTW}
+        if queue_id:
+            params["queueID"] = queue_id
+        with measure_stage(Stage.FETCH), breaker(Service.ZKB).guard():
+            r = requests.get(
+                ZKB_REDISQ_URL,
+                params=params,
+                timeout=REQUESTS_TIMEOUT,
+                headers={"User-Agent": USER_AGENT_TEXT},
+            )
+            r.raise_for_status()
+            data = r.json()
         if data:
             logger.debug("data:\n%s", data)
         if data and "package" in data and data["package"]:
             logger.info("Received a killmail from ZKB RedisQ")
             package_data = data["package"]
-            return cls._create_from_dict(package_data)
+            with measure_stage(Stage.PARSE):
+                return cls._create_from_dict(package_data)
         else:
             logger.debug("Did not received a killmail from ZKB RedisQ")
             return None
 
     @classmethod
-    def create_from_zkb_api(cls, killmail_id: int) -> "Killmail":
+    def create_from_zkb_killstream(cls, data: dict) -> Optional["Killmail"]:
+        """Creates a killmail from a message of the ZKB websocket killstream,
+        which is an ESI killmail with an additional zkb property.
+
+        Returns None if the message is not a killmail.
+        """
+        if not data or "killmail_id" not in data:
+            return None
+        killmail_esi = {key: value for key, value in data.items() if key != "zkb"}
+        package_data = {
+            "killID": data["killmail_id"],
+            "killmail": killmail_esi,
+            "zkb": data.get("zkb", {}),
+        }
+        with measure_stage(Stage.PARSE):
+            return cls._create_from_dict(package_data)
+
+    @classmethod
+    def create_from_zkb_api(cls, killmail_id: int) -> Optional["Killmail"]:
         """Fetches and returns a killmail from ZKB API.
 
         results are cached
         """
+        return cls.create_from_zkb_api_bulk([killmail_id]).get(killmail_id)
 
-        cache_key = f"{__title__.upper()}_KILLMAIL_{killmail_id}"
-        killmail_json = cache.get(cache_key)
-        if killmail_json:
-            return Killmail.from_json(killmail_json)
-        else:
-            logger.info(
-                "Trying to fetch killmail from ZKB API with killmail ID %d ...",
-                killmail_id,
+    @classmethod
+    def create_from_zkb_api_bulk(
+        cls, killmail_ids: Iterable[int], max_workers: int = ZKB_API_MAX_WORKERS
+    ) -> Dict[int, "Killmail"]:
+        """Fetches and returns killmails from ZKB API.
+
+        Killmails not in the cache are fetched concurrently from ZKB and ESI.
+        Killmails which could not be found or fetched are missing in the result.
+
+        results are cached
+        """
+        killmail_ids = list(dict.fromkeys(int(obj) for obj in killmail_ids))
+        cache_keys = {obj: _zkb_api_cache_key(obj) for obj in killmail_ids}
+        cached = cache.get_many(list(cache_keys.values()))
+        killmails = {
+            killmail_id: Killmail.from_json(cached[key])
+            for killmail_id, key in cache_keys.items()
+            if key in cached
+        }
+        missing_ids = [obj for obj in killmail_ids if obj not in killmails]
+        if missing_ids:
+            with ThreadPoolExecutor(
+                max_workers=min(max_workers, len(missing_ids))
+            ) as executor:
+                futures = {
+                    killmail_id: executor.submit(cls._fetch_from_zkb_api, killmail_id)
+                    for killmail_id in missing_ids
+                }
+            fetched = dict()
+            for killmail_id, future in futures.items():
+                try:
+                    fetched[killmail_id] = future.result()
+                except Exception:
+                    logger.warning(
+                        "Failed to fetch killmail with ID %d from ZKB API",
+                        killmail_id,
+                        exc_info=True,
+                    )
+            new_killmails = {
+                killmail_id: killmail
+                for killmail_id, killmail in fetched.items()
+                if killmail
+            }
+            cache.set_many(
+                {
+                    cache_keys[killmail_id]: killmail.asjson()
+                    for killmail_id, killmail in new_killmails.items()
+                },
+                timeout=ZKB_API_CACHE_TIMEOUT,
             )
-            url = f"{ZKB_API_URL}killID/{killmail_id}/"
+            killmails.update(new_killmails)
+        return killmails
+
+    @classmethod
+    def _fetch_from_zkb_api(cls, killmail_id: int) -> Optional["Killmail"]:
+        logger.info(
+            "Trying to fetch killmail from ZKB API with killmail ID %d ...",
+            killmail_id,
+        )
+        url = f"{ZKB_API_URL}killID/{killmail_id}/"
+        with breaker(Service.ZKB).guard():
             r = requests.get(
-                url, timeout=REQUESTS_TIMEOUT, headers={"User-Agent": USER_AGENT_TEXT}
+                url,
+                timeout=REQUESTS_TIMEOUT,
+                headers={"User-Agent": USER_AGENT_TEXT},
             )
             r.raise_for_status()
             zkb_data = r.json()
-            if not zkb_data:
-                logger.warning(
-                    "ZKB API did not return any data for killmail ID %d", killmail_id
-                )
-                return None
-
-            logger.debug("data:\n%s", zkb_data)
-            try:
-                killmail_zkb = zkb_data[0]
-            except KeyError:
-                return None
+        if not zkb_data:
+            logger.warning(
+                "ZKB API did not return any data for killmail ID %d", killmail_id
+            )
+            return None
+
+        logger.debug("data:\n%s", zkb_data)
+        try:
+            killmail_zkb = zkb_data[0]
+        except KeyError:
+            return None
 
+        with breaker(Service.ESI).guard():
             killmail_esi = esi.client.Killmails.get_killmails_killmail_id_killmail_hash(
                 killmail_id=killmail_id, killmail_hash=killmail_zkb["zkb"]["hash"]
             ).results()
-            if not killmail_esi:
-                logger.warning(
-                    "ESI did not return any data for killmail ID %d", killmail_id
-                )
-                return None
-
-            # esi returns datetime, but _create_from_dict() expects a string in
-            # same format as returned from zkb redisq
-            killmail_esi["killmail_time"] = killmail_esi["killmail_time"].strftime(
-                "%Y-%m-%dT%H:%M:%SZ"
+        if not killmail_esi:
+            logger.warning(
+                "ESI did not return any data for killmail ID %d", killmail_id
             )
+            return None
 
-            killmail_dict = {
-                "killID": killmail_id,
-                "killmail": killmail_esi,
-                "zkb": killmail_zkb["zkb"],
-            }
-            killmail = cls._create_from_dict(killmail_dict)
-            cache.set(key=cache_key, value=killmail.asjson())
-            return killmail
+        # esi returns datetime, but _create_from_dict() expects a string in
+        # same format as returned from zkb redisq
+        killmail_esi["killmail_time"] = killmail_esi["killmail_time"].strftime(
+            "%Y-%m-%dT%H:%M:%SZ"
+        )
+
+        killmail_dict = {
+            "killID": killmail_id,
+            "killmail": killmail_esi,
+            "zkb": killmail_zkb["zkb"],
+        }
+        return cls._create_from_dict(killmail_dict)
 
     @staticmethod
     def _create_from_dict(package_data: dict) -> "Killmail":
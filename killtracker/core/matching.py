@@ -0,0 +1,662 @@
+"""Matching of killmails against the clauses of a tracker
+
+Clauses are evaluated in order of their cost per observed rejection rate,
+so that a rejected killmail touches as little work as possible.
+Rejection rates are learned online for each tracker. They are first counted
+in-process and then periodically merged in Redis, so all workers learn together.
+"""
+from collections import defaultdict
+from dataclasses import dataclass
+import threading
+from time import monotonic
+from typing import Dict, Iterable, List, Optional, Set
+
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef
+
+from allianceauth.services.hooks import get_extension_logger
+from eveuniverse.helpers import meters_to_ly
+from eveuniverse.models import EveSolarSystem, EveType
+
+from .. import __title__
+from ..app_settings import (
+    KILLTRACKER_CLAUSE_STATS_REFRESH_INTERVAL,
+    KILLTRACKER_ESI_FREE_MODE,
+)
+from ..exceptions import ServiceUnavailable
+from ..utils import LoggerAddTag
+from . import universe
+from .circuit_breaker import Service, breaker
+from .killmails import Killmail
+from .universe import SolarSystemInfo
+
+logger = LoggerAddTag(get_extension_logger(__name__), __title__)
+
+SHIP_TYPE_GROUPS_CACHE_TIMEOUT = 3600 * 24
+
+
+@dataclass(frozen=True)
+class Clause:
+    """A clause of a tracker, which can reject killmails.
+
+    The cost is an estimate of the work for evaluating it
+    relative to a simple comparison.
+    The field of a relation clause is the field of the related objects to match.
+    """
+
+    name: str
+    cost: int
+    is_relation: bool = False
+    field: str = "id"
+
+
+# all clauses in their canonical order, which is also used to break ties
+CLAUSES = (
+    Clause("require_min_attackers", 1),
+    Clause("require_max_attackers", 1),
+    Clause("exclude_npc_kills", 1),
+    Clause("require_npc_kills", 1),
+    Clause("require_min_value", 1),
+    Clause("exclude_high_sec", 10),
+    Clause("exclude_low_sec", 10),
+    Clause("exclude_null_sec", 10),
+    Clause("exclude_w_space", 10),
+    Clause("require_max_distance", 10),
+    Clause("require_max_jumps", 100),
+    Clause("require_regions", 15, True),
+    Clause("require_constellations", 15, True),
+    Clause("require_solar_systems", 15, True),
+    Clause("exclude_attacker_alliances", 5, True, "alliance_id"),
+    Clause("require_attacker_alliances", 5, True, "alliance_id"),
+    Clause("exclude_attacker_corporations", 5, True, "corporation_id"),
+    Clause("require_attacker_corporations", 5, True, "corporation_id"),
+    Clause("require_victim_alliances", 5, True, "alliance_id"),
+    Clause("require_victim_corporations", 5, True, "corporation_id"),
+    Clause("require_victim_ship_groups", 20, True),
+    Clause("require_victim_ship_types", 20, True),
+    Clause("require_attackers_ship_groups", 20, True),
+    Clause("require_attackers_ship_types", 20, True),
+)
+_CLAUSES_BY_NAME = {clause.name: clause for clause in CLAUSES}
+
+# the matching ship types of the first of these clauses are shown on a message
+SHIP_TYPE_CLAUSES_PRIORITY = (
+    "require_attackers_ship_types",
+    "require_attackers_ship_groups",
+    "require_victim_ship_types",
+    "require_victim_ship_groups",
+)
+
+
+class _ClauseStats:
+    """Thread-safe in-process statistics of evaluated and rejected clauses"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._pending = defaultdict(int)
+        self._rates = dict()
+
+    def record(self, tracker_pk: int, clause: str, is_rejected: bool) -> None:
+        with self._lock:
+            self._pending[(tracker_pk, f"{clause}:evaluated")] += 1
+            if is_rejected:
+                self._pending[(tracker_pk, f"{clause}:rejected")] += 1
+
+    def rejection_rates(self, tracker_pk: int) -> Dict[str, float]:
+        """returns the learned rejection rates of a tracker's clauses.
+        Rates are refreshed from Redis after the refresh interval.
+        """
+        with self._lock:
+            loaded_at, rates = self._rates.get(tracker_pk, (None, None))
+        if (
+            loaded_at is None
+            or monotonic() - loaded_at >= KILLTRACKER_CLAUSE_STATS_REFRESH_INTERVAL
+        ):
+            rates = self._refresh(tracker_pk)
+        return rates
+
+    def _refresh(self, tracker_pk: int) -> Dict[str, float]:
+        with self._lock:
+            pending = {
+                field: amount
+                for (pk, field), amount in self._pending.items()
+                if pk == tracker_pk
+            }
+            for field in pending.keys():
+                del self._pending[(tracker_pk, field)]
+            _, rates = self._rates.get(tracker_pk, (None, dict()))
+            self._rates[tracker_pk] = (monotonic(), rates)
+
+        key = _stats_key(tracker_pk)
+        try:
+            pipe = cache.get_master_client().pipeline()
+            for field, amount in pending.items():
+                pipe.hincrby(key, field, amount)
+            pipe.hgetall(key)
+            raw = pipe.execute()[-1]
+        except Exception:
+            logger.warning(
+                "Failed to refresh clause stats for tracker %s",
+                tracker_pk,
+                exc_info=True,
+            )
+            return rates
+
+        rates = _calc_rejection_rates(raw)
+        with self._lock:
+            self._rates[tracker_pk] = (monotonic(), rates)
+        return rates
+
+    def clear(self, tracker_pk: int) -> None:
+        with self._lock:
+            for key in [key for key in self._pending.keys() if key[0] == tracker_pk]:
+                del self._pending[key]
+            self._rates.pop(tracker_pk, None)
+
+
+_clause_stats = _ClauseStats()
+
+
+def _stats_key(tracker_pk: int) -> str:
+    return f"{__title__}_clause_stats_tracker_{tracker_pk}"
+
+
+def _calc_rejection_rates(raw: dict) -> Dict[str, float]:
+    counts = defaultdict(lambda: [0, 0])
+    for field, value in raw.items():
+        clause, _, prop = field.decode("utf8").partition(":")
+        counts[clause][0 if prop == "evaluated" else 1] = int(value)
+    # smoothed, so that unknown clauses start with a rate of 0.5
+    return {
+        clause: (rejected + 1) / (evaluated + 2)
+        for clause, (evaluated, rejected) in counts.items()
+    }
+
+
+def clause_stats(tracker_pk: int) -> Dict[str, Dict[str, int]]:
+    """returns the evaluated and rejected counts of a tracker's clauses
+    as recorded in Redis
+    """
+    stats = defaultdict(lambda: {"evaluated": 0, "rejected": 0})
+    for field, value in (
+        cache.get_master_client().hgetall(_stats_key(tracker_pk)).items()
+    ):
+        clause, _, prop = field.decode("utf8").partition(":")
+        stats[clause][prop] = int(value)
+    return dict(stats)
+
+
+def clear_clause_stats(tracker_pk: int) -> None:
+    """clears the learned clause statistics of a tracker"""
+    _clause_stats.clear(tracker_pk)
+    cache.get_master_client().delete(_stats_key(tracker_pk))
+
+
+def order_clauses(tracker_pk: int, clauses: List[Clause]) -> List[Clause]:
+    """returns clauses ordered by expected cost to reject a killmail"""
+    rates = _clause_stats.rejection_rates(tracker_pk)
+    position = {clause.name: num for num, clause in enumerate(CLAUSES)}
+    return sorted(
+        clauses,
+        key=lambda clause: (
+            clause.cost / rates.get(clause.name, 0.5),
+            position[clause.name],
+        ),
+    )
+
+
+def _ship_type_group_key(ship_type_id: int) -> str:
+    return f"{__title__}_ship_type_group_{ship_type_id}"
+
+
+class _ShipTypeGroups:
+    """Thread-safe cache of ship type groups of this worker process.
+    Groups of types never change, so entries do not expire.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._data: Dict[int, int] = dict()
+
+    def get_many(self, ship_type_ids: Iterable[int]) -> Dict[int, int]:
+        with self._lock:
+            return {obj: self._data[obj] for obj in ship_type_ids if obj in self._data}
+
+    def set_many(self, data: Dict[int, int]) -> None:
+        with self._lock:
+            self._data.update(data)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+_ship_type_groups = _ShipTypeGroups()
+
+
+def _load_ship_type_groups(ship_type_ids: Set[int]) -> Dict[int, int]:
+    return dict(
+        EveType.objects.filter(id__in=ship_type_ids).values_list("id", "eve_group_id")
+    )
+
+
+def ship_type_group_ids(
+    ship_type_ids: Iterable[int], load_from_esi: bool = True
+) -> Dict[int, int]:
+    """returns mapping of ship type ID to group ID for the given ship types.
+
+    Looks up the groups in the cache of this process, then in the shared cache
+    and finally in the database, loading missing ship types from ESI if requested.
+    """
+    ship_type_ids = {int(obj) for obj in ship_type_ids if obj}
+    result = _ship_type_groups.get_many(ship_type_ids)
+    missing_ids = ship_type_ids - set(result.keys())
+    if missing_ids:
+        shared = cache.get_many([_ship_type_group_key(obj) for obj in missing_ids])
+        found = {
+            obj: shared[_ship_type_group_key(obj)]
+            for obj in missing_ids
+            if _ship_type_group_key(obj) in shared
+        }
+        missing_ids -= set(found.keys())
+        if missing_ids:
+            loaded = _load_ship_type_groups(missing_ids)
+            unknown_ids = missing_ids - set(loaded.keys())
+            if unknown_ids and load_from_esi:
+                with breaker(Service.ESI).guard():
+                    EveType.objects.bulk_get_or_create_esi(ids=list(unknown_ids))
+                loaded.update(_load_ship_type_groups(unknown_ids))
+            cache.set_many(
+                {
+                    _ship_type_group_key(obj): group_id
+                    for obj, group_id in loaded.items()
+                },
+                timeout=SHIP_TYPE_GROUPS_CACHE_TIMEOUT,
+            )
+            found.update(loaded)
+        _ship_type_groups.set_many(found)
+        result.update(found)
+    return result
+
+
+def preload_ship_type_groups(category_ids: Iterable[int]) -> int:
+    """loads the groups of all types of the given categories into the caches
+    and returns the number of types loaded
+    """
+    data = dict(
+        EveType.objects.filter(eve_group__eve_category_id__in=category_ids).values_list(
+            "id", "eve_group_id"
+        )
+    )
+    cache.set_many(
+        {_ship_type_group_key(obj): group_id for obj, group_id in data.items()},
+        timeout=SHIP_TYPE_GROUPS_CACHE_TIMEOUT,
+    )
+    _ship_type_groups.set_many(data)
+    return len(data)
+
+
+def clear_ship_type_groups() -> None:
+    """clears the ship type groups cached by this worker process"""
+    _ship_type_groups.clear()
+
+
+class _SolarSystemLocation:
+    """Solar system from the database with the interface of a solar system
+    from the universe snapshot. Related objects are only loaded when needed.
+    """
+
+    def __init__(self, solar_system: EveSolarSystem) -> None:
+        self._solar_system = solar_system
+
+    def __getattr__(self, name: str):
+        return getattr(self._solar_system, name)
+
+    @property
+    def constellation_id(self) -> int:
+        return self._solar_system.eve_constellation_id
+
+    @property
+    def region_id(self) -> int:
+        return self._solar_system.eve_constellation.eve_region_id
+
+    def distance_to(self, destination) -> Optional[float]:
+        return SolarSystemInfo.distance_to(self, destination)
+
+
+@dataclass
+class CompiledClauses:
+    """Active clauses of a tracker with the IDs of all related objects preloaded,
+    so that matching needs no queries for them.
+    """
+
+    active_clauses: List[Clause]
+    related_ids: Dict[str, Set[int]]
+    # changes when the tracker is changed, e.g. its fields or related objects
+    stamp: int = 0
+
+
+def compile_clauses(tracker) -> CompiledClauses:
+    """returns the compiled clauses of a tracker"""
+    matcher = KillmailMatcher(tracker=tracker, killmail=None)
+    active_clauses = matcher.active_clauses()
+    related_ids = {
+        clause.name: matcher._related_ids(clause.name)
+        for clause in active_clauses
+        if clause.is_relation
+    }
+    values = [field.value_to_string(tracker) for field in tracker._meta.concrete_fields]
+    stamp = hash(
+        repr((values, sorted((name, sorted(ids)) for name, ids in related_ids.items())))
+    )
+    return CompiledClauses(
+        active_clauses=active_clauses, related_ids=related_ids, stamp=stamp
+    )
+
+
+class KillmailMatcher:
+    """Matches a killmail against the clauses of a tracker.
+
+    Information shared by clauses like the solar system or the distance
+    is only fetched when a clause needs it.
+    Uses the compiled clauses of the tracker if given.
+    """
+
+    def __init__(
+        self, tracker, killmail: Killmail, compiled: CompiledClauses = None
+    ) -> None:
+        self.tracker = tracker
+        self.killmail = killmail
+        self.compiled = compiled
+        self._solar_system = None
+        self._is_solar_system_loaded = False
+        self._location = None
+        self._is_location_loaded = False
+        self._distance = None
+        self._is_distance_calculated = False
+        self._jumps = None
+        self._is_jumps_calculated = False
+        self._ship_type_groups = None
+        self._matching_ship_type_ids = dict()
+
+    @property
+    def solar_system(self) -> Optional[EveSolarSystem]:
+        if not self._is_solar_system_loaded:
+            if self.killmail.solar_system_id:
+                try:
+                    self._solar_system = EveSolarSystem.objects.get(
+                        id=self.killmail.solar_system_id
+                    )
+                except EveSolarSystem.DoesNotExist:
+                    with breaker(Service.ESI).guard():
+                        (
+                            self._solar_system,
+                            _,
+                        ) = EveSolarSystem.objects.get_or_create_esi(
+                            id=self.killmail.solar_system_id
+                        )
+            self._is_solar_system_loaded = True
+        return self._solar_system
+
+    @property
+    def location(self):
+        """geography of the killmail's solar system or None if not known.
+        Uses the universe snapshot if available to avoid DB queries.
+        """
+        if not self._is_location_loaded:
+            if self.killmail.solar_system_id:
+                self._location = universe.solar_system(self.killmail.solar_system_id)
+                if not self._location and self.solar_system:
+                    self._location = _SolarSystemLocation(self.solar_system)
+            self._is_location_loaded = True
+        return self._location
+
+    def _origin_location(self):
+        origin_id = self.tracker.origin_solar_system_id
+        if not origin_id:
+            return None
+        location = universe.solar_system(origin_id)
+        if not location:
+            location = _SolarSystemLocation(self.tracker.origin_solar_system)
+        return location
+
+    @property
+    def distance(self) -> Optional[float]:
+        """distance in LY from the tracker's origin or None if not known"""
+        if not self._is_distance_calculated:
+            origin = self._origin_location()
+            if origin and self.location:
+                self._distance = meters_to_ly(origin.distance_to(self.location))
+            self._is_distance_calculated = True
+        return self._distance
+
+    def _jump_table(self) -> Optional[Dict[int, int]]:
+        if not self.tracker.origin_solar_system_id:
+            return None
+        return universe.jump_table(
+            self.tracker.origin_solar_system_id,
+            universe.tracker_jump_table_jumps(self.tracker),
+        )
+
+    @property
+    def jumps(self) -> Optional[int]:
+        """jumps from the tracker's origin or None if not known.
+
+        Looked up from the jump table of the origin. Only systems not covered
+        by the table need a route from ESI, which is skipped in ESI-free mode
+        or while ESI is down.
+        """
+        if not self._is_jumps_calculated:
+            table = self._jump_table()
+            if table and self.killmail.solar_system_id in table:
+                self._jumps = table[self.killmail.solar_system_id]
+            elif (
+                not KILLTRACKER_ESI_FREE_MODE
+                and self.tracker.origin_solar_system
+                and self.solar_system
+            ):
+                try:
+                    with breaker(Service.ESI).guard():
+                        self._jumps = self.tracker.origin_solar_system.jumps_to(
+                            self.solar_system
+                        )
+                except ServiceUnavailable:
+                    self._jumps = None
+            self._is_jumps_calculated = True
+        return self._jumps
+
+    @property
+    def matching_ship_type_ids(self) -> Optional[List[int]]:
+        for clause in SHIP_TYPE_CLAUSES_PRIORITY:
+            if clause in self._matching_ship_type_ids:
+                return self._matching_ship_type_ids[clause]
+        return None
+
+    def is_matching(self) -> bool:
+        """returns True if the killmail matches all clauses of the tracker"""
+        tracker_pk = self.tracker.pk
+        for clause in order_clauses(tracker_pk, self.active_clauses()):
+            try:
+                is_matching = bool(getattr(self, f"_check_{clause.name}")())
+            except AttributeError:
+                is_matching = False
+            _clause_stats.record(tracker_pk, clause.name, not is_matching)
+            if not is_matching:
+                return False
+        return True
+
+    def active_clauses(self) -> List[Clause]:
+        """returns the clauses used by the tracker"""
+        if self.compiled:
+            return self.compiled.active_clauses
+        relations_in_use = self._relations_in_use()
+        return [
+            clause
+            for clause in CLAUSES
+            if (clause.is_relation and clause.name in relations_in_use)
+            or (not clause.is_relation and getattr(self.tracker, clause.name))
+        ]
+
+    def _relations_in_use(self) -> Set[str]:
+        """returns names of all relation clauses that have objects,
+        fetched with a single query
+        """
+        tracker_model = type(self.tracker)
+        prefix = "has_"
+        annotations = {
+            f"{prefix}{clause.name}": Exists(
+                getattr(tracker_model, clause.name).through.objects.filter(
+                    tracker_id=OuterRef("pk")
+                )
+            )
+            for clause in CLAUSES
+            if clause.is_relation
+        }
+        result = (
+            tracker_model.objects.filter(pk=self.tracker.pk)
+            .values(**annotations)
+            .first()
+        )
+        if not result:
+            return set()
+        return {name[len(prefix) :] for name, exists in result.items() if exists}
+
+    def _related_ids(self, name: str) -> Set[int]:
+        if self.compiled:
+            return self.compiled.related_ids.get(name, set())
+        field = _CLAUSES_BY_NAME[name].field
+        return set(getattr(self.tracker, name).values_list(field, flat=True))
+
+    def _ship_type_group_ids(self) -> Dict[int, int]:
+        """returns mapping of ship type ID to group ID for all ships of the killmail.
+        Makes sure all ship types are in the local database.
+        """
+        if self._ship_type_groups is None:
+            self._ship_type_groups = ship_type_group_ids(self.killmail.ship_type_ids())
+        return self._ship_type_groups
+
+    def _check_require_min_attackers(self) -> bool:
+        return len(self.killmail.attackers) >= self.tracker.require_min_attackers
+
+    def _check_require_max_attackers(self) -> bool:
+        return len(self.killmail.attackers) <= self.tracker.require_max_attackers
+
+    def _check_exclude_npc_kills(self) -> bool:
+        return not self.killmail.zkb.is_npc
+
+    def _check_require_npc_kills(self) -> bool:
+        return self.killmail.zkb.is_npc
+
+    def _check_require_min_value(self) -> bool:
+        return self.killmail.zkb.total_value >= self.tracker.require_min_value * 1000000
+
+    def _check_exclude_high_sec(self) -> bool:
+        return not self.location or not self.location.is_high_sec
+
+    def _check_exclude_low_sec(self) -> bool:
+        return not self.location or not self.location.is_low_sec
+
+    def _check_exclude_null_sec(self) -> bool:
+        return not self.location or not self.location.is_null_sec
+
+    def _check_exclude_w_space(self) -> bool:
+        return not self.location or not self.location.is_w_space
+
+    def _check_require_max_distance(self) -> bool:
+        return (
+            self.distance is not None
+            and self.distance <= self.tracker.require_max_distance
+        )
+
+    def _check_require_max_jumps(self) -> bool:
+        table = self._jump_table()
+        if table is not None:
+            jumps = table.get(self.killmail.solar_system_id)
+        else:
+            jumps = self.jumps
+        return jumps is not None and jumps <= self.tracker.require_max_jumps
+
+    def _check_require_regions(self) -> bool:
+        return self.location and (
+            self.location.region_id in self._related_ids("require_regions")
+        )
+
+    def _check_require_constellations(self) -> bool:
+        return self.location and (
+            self.location.constellation_id
+            in self._related_ids("require_constellations")
+        )
+
+    def _check_require_solar_systems(self) -> bool:
+        return self.location and (
+            self.location.id in self._related_ids("require_solar_systems")
+        )
+
+    def _check_exclude_attacker_alliances(self) -> bool:
+        excluded_ids = self._related_ids("exclude_attacker_alliances")
+        return bool(excluded_ids - set(self.killmail.attackers_alliance_ids()))
+
+    def _check_require_attacker_alliances(self) -> bool:
+        required_ids = self._related_ids("require_attacker_alliances")
+        return bool(required_ids & set(self.killmail.attackers_alliance_ids()))
+
+    def _check_exclude_attacker_corporations(self) -> bool:
+        excluded_ids = self._related_ids("exclude_attacker_corporations")
+        return bool(excluded_ids - set(self.killmail.attackers_corporation_ids()))
+
+    def _check_require_attacker_corporations(self) -> bool:
+        required_ids = self._related_ids("require_attacker_corporations")
+        return bool(required_ids & set(self.killmail.attackers_corporation_ids()))
+
+    def _check_require_victim_alliances(self) -> bool:
+        return self.killmail.victim.alliance_id in self._related_ids(
+            "require_victim_alliances"
+        )
+
+    def _check_require_victim_corporations(self) -> bool:
+        return self.killmail.victim.corporation_id in self._related_ids(
+            "require_victim_corporations"
+        )
+
+    def _check_require_victim_ship_groups(self) -> bool:
+        ship_type_id = self.killmail.victim.ship_type_id
+        group_id = self._ship_type_group_ids().get(ship_type_id)
+        if group_id in self._related_ids("require_victim_ship_groups"):
+            self._matching_ship_type_ids["require_victim_ship_groups"] = [ship_type_id]
+            return True
+        return False
+
+    def _check_require_victim_ship_types(self) -> bool:
+        ship_type_id = self.killmail.victim.ship_type_id
+        if ship_type_id in self._related_ids("require_victim_ship_types"):
+            self._matching_ship_type_ids["require_victim_ship_types"] = [ship_type_id]
+            return True
+        return False
+
+    def _check_require_attackers_ship_groups(self) -> bool:
+        ship_type_groups = self._ship_type_group_ids()
+        group_ids = self._related_ids("require_attackers_ship_groups")
+        ship_type_ids = sorted(
+            {
+                type_id
+                for type_id in self.killmail.attackers_ship_type_ids()
+                if ship_type_groups.get(type_id) in group_ids
+            }
+        )
+        if ship_type_ids:
+            self._matching_ship_type_ids[
+                "require_attackers_ship_groups"
+            ] = ship_type_ids
+            return True
+        return False
+
+    def _check_require_attackers_ship_types(self) -> bool:
+        self._ship_type_group_ids()
+        ship_type_ids = sorted(
+            set(self.killmail.attackers_ship_type_ids())
+            & self._related_ids("require_attackers_ship_types")
+        )
+        if ship_type_ids:
+            self._matching_ship_type_ids["require_attackers_ship_types"] = ship_type_ids
+            return True
+        return False
@@ -0,0 +1,386 @@
+"""Instrumentation of the killtracker pipeline
+
+Durations of each pipeline stage are recorded as histograms in Redis,
+so that all workers contribute to the same statistics.
+
+Counters are first incremented in-process and then periodically flushed to Redis.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+import threading
+from time import monotonic, perf_counter
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.core.cache import cache
+
+from allianceauth.services.hooks import get_extension_logger
+
+from .. import __title__
+from ..app_settings import (
+    KILLTRACKER_METRICS_ENABLED,
+    KILLTRACKER_METRICS_FLUSH_INTERVAL,
+    KILLTRACKER_PIPELINE_STATS_ENABLED,
+)
+from ..utils import LoggerAddTag
+
+logger = LoggerAddTag(get_extension_logger(__name__), __title__)
+
+TASK_DURATION_HISTOGRAM = "task"
+
+
+class Stage:
+    """Stages of the killtracker pipeline"""
+
+    FETCH = "fetch"
+    PARSE = "parse"
+    MATCH = "match"
+    RENDER = "render"
+    ENQUEUE = "enqueue"
+    SEND = "send"
+    END_TO_END = "end_to_end"  # from kill time until posted on Discord
+
+    ALL = [FETCH, PARSE, MATCH, RENDER, ENQUEUE, SEND, END_TO_END]
+
+
+@dataclass
+class HistogramData:
+    """Snapshot of a histogram"""
+
+    name: str
+    label: Optional[str]
+    buckets: List[Tuple[float, int]]
+    count: int
+    sum: float
+
+    @property
+    def average(self) -> Optional[float]:
+        return self.sum / self.count if self.count else None
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """returns upper bound of the bucket containing the given percentile"""
+        if not self.count:
+            return None
+        threshold = self.count * percent / 100
+        cumulated = 0
+        for upper_bound, count in self.buckets:
+            cumulated += count
+            if cumulated >= threshold:
+                return upper_bound
+        return float("inf")
+
+
+class Histogram:
+    """A histogram of durations in seconds stored in Redis"""
+
+    DEFAULT_BUCKETS = (
+        0.005,
+        0.01,
+        0.025,
+        0.05,
+        0.1,
+        0.25,
+        0.5,
+        1,
+        2.5,
+        5,
+        10,
+        30,
+        60,
+        120,
+        300,
+        600,
+        1800,
+        float("inf"),
+    )
+    KEYS_REGISTRY = f"{__title__}_histograms"
+
+    def __init__(self, name: str, label: str = None, buckets: tuple = None) -> None:
+        self.name = str(name)
+        self.label = str(label) if label else None
+        self.buckets = tuple(buckets) if buckets else self.DEFAULT_BUCKETS
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(name='{self.name}', label='{self.label}')"
+
+    @property
+    def key(self) -> str:
+        key = f"{__title__}_histogram_{self.name}"
+        return f"{key}:{self.label}" if self.label else key
+
+    def observe(self, value: float) -> None:
+        """adds an observation to this histogram"""
+        for upper_bound in self.buckets:
+            if value <= upper_bound:
+                break
+        pipe = cache.get_master_client().pipeline()
+        pipe.hincrby(self.key, str(upper_bound), 1)
+        pipe.hincrby(self.key, "_count", 1)
+        pipe.hincrbyfloat(self.key, "_sum", value)
+        pipe.sadd(self.KEYS_REGISTRY, self.key)
+        pipe.execute()
+
+    def data(self) -> HistogramData:
+        """returns current data of this histogram"""
+        raw = {
+            key.decode("utf8"): value
+            for key, value in cache.get_master_client().hgetall(self.key).items()
+        }
+        return HistogramData(
+            name=self.name,
+            label=self.label,
+            buckets=[
+                (upper_bound, int(raw.get(str(upper_bound), 0)))
+                for upper_bound in self.buckets
+            ],
+            count=int(raw.get("_count", 0)),
+            sum=float(raw.get("_sum", 0)),
+        )
+
+    def clear(self) -> None:
+        cache.get_master_client().delete(self.key)
+
+    @classmethod
+    def all(cls) -> List["Histogram"]:
+        """returns all histograms that have been recorded"""
+        histograms = list()
+        for key in cache.get_master_client().smembers(cls.KEYS_REGISTRY):
+            name_and_label = key.decode("utf8").replace(f"{__title__}_histogram_", "")
+            name, _, label = name_and_label.partition(":")
+            histograms.append(cls(name=name, label=label))
+        return sorted(histograms, key=lambda obj: (obj.name, obj.label or ""))
+
+    @classmethod
+    def clear_all(cls) -> None:
+        for histogram in cls.all():
+            histogram.clear()
+        cache.get_master_client().delete(cls.KEYS_REGISTRY)
+
+
+def tracker_label(tracker_pk: int) -> str:
+    return f"tracker_{tracker_pk}"
+
+
+def webhook_label(webhook_pk: int) -> str:
+    return f"webhook_{webhook_pk}"
+
+
+def record_stage(stage: str, duration: float, label: str = None) -> None:
+    """records the duration for a pipeline stage in seconds
+
+    Will record for the stage in total and additionally for the label, if given.
+    """
+    if not KILLTRACKER_PIPELINE_STATS_ENABLED:
+        return
+    try:
+        Histogram(stage).observe(duration)
+        if label:
+            Histogram(stage, label).observe(duration)
+    except Exception:
+        logger.warning("Failed to record stats for stage %s", stage, exc_info=True)
+
+
+@contextmanager
+def measure_stage(stage: str, label: str = None) -> Iterator[None]:
+    """measures the duration of the enclosed block for a pipeline stage"""
+    started = perf_counter()
+    yield
+    record_stage(stage, perf_counter() - started, label)
+
+
+def stage_stats() -> Dict[str, List[HistogramData]]:
+    """returns data of all recorded histograms grouped by stage"""
+    stats = {stage: list() for stage in Stage.ALL}
+    for histogram in Histogram.all():
+        stats.setdefault(histogram.name, list()).append(histogram.data())
+    return stats
+
+
+def record_task_duration(task_name: str, duration: float) -> None:
+    """records the duration of a task in seconds"""
+    if not KILLTRACKER_METRICS_ENABLED:
+        return
+    try:
+        Histogram(TASK_DURATION_HISTOGRAM, task_name).observe(duration)
+    except Exception:
+        logger.warning("Failed to record duration of %s", task_name, exc_info=True)
+
+
+class Counter:
+    """Counters of the killtracker pipeline"""
+
+    KILLMAILS_RECEIVED = "killmails_received"
+    KILLMAILS_MATCHED = "killmails_matched"
+    KILLMAILS_PARKED = "killmails_parked"
+    MESSAGES_ENQUEUED = "messages_enqueued"
+    MESSAGES_SENT = "messages_sent"
+    MESSAGES_FAILED = "messages_failed"
+    MESSAGES_SHED = "messages_shed"
+    WEBHOOK_RATE_LIMITED = "webhook_rate_limited"
+
+    DESCRIPTIONS = {
+        KILLMAILS_RECEIVED: "Killmails received from ZKB",
+        KILLMAILS_MATCHED: "Killmails matched by a tracker",
+        KILLMAILS_PARKED: "Killmails parked until missing static data is loaded",
+        MESSAGES_ENQUEUED: "Messages enqueued for a webhook",
+        MESSAGES_SENT: "Messages sent successfully to a webhook",
+        MESSAGES_FAILED: "Messages that failed to be sent to a webhook",
+        MESSAGES_SHED: "Messages dropped because the queue of a webhook was full",
+        WEBHOOK_RATE_LIMITED: "Too many requests errors (429) received from a webhook",
+    }
+    REDIS_KEY = f"{__title__}_counters"
+
+
+class _CounterBuffer:
+    """Thread-safe in-process buffer for counter increments"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._pending = defaultdict(int)
+        self._last_flush = monotonic()
+
+    def add(self, field: str, amount: int) -> None:
+        with self._lock:
+            self._pending[field] += amount
+            is_due = (
+                monotonic() - self._last_flush >= KILLTRACKER_METRICS_FLUSH_INTERVAL
+            )
+        if is_due:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            pending = self._pending
+            self._pending = defaultdict(int)
+            self._last_flush = monotonic()
+        if not pending:
+            return
+        try:
+            pipe = cache.get_master_client().pipeline()
+            for field, amount in pending.items():
+                pipe.hincrby(Counter.REDIS_KEY, field, amount)
+            pipe.execute()
+        except Exception:
+            logger.warning("Failed to flush counters", exc_info=True)
+
+
+_counter_buffer = _CounterBuffer()
+
+
+def _counter_field(name: str, label: str = None) -> str:
+    return f"{name}:{label}" if label else name
+
+
+def increment_counter(name: str, label: str = None, amount: int = 1) -> None:
+    """increments a counter, optionally for a label like a tracker"""
+    if KILLTRACKER_METRICS_ENABLED:
+        _counter_buffer.add(_counter_field(name, label), amount)
+
+
+def flush_counters() -> None:
+    """flushes all pending counter increments of this process to Redis"""
+    _counter_buffer.flush()
+
+
+def counter_values() -> Dict[Tuple[str, Optional[str]], int]:
+    """returns current values of all counters aggregated from all processes"""
+    values = dict()
+    for field, value in cache.get_master_client().hgetall(Counter.REDIS_KEY).items():
+        name, _, label = field.decode("utf8").partition(":")
+        values[(name, label or None)] = int(value)
+    return values
+
+
+def clear_counters() -> None:
+    cache.get_master_client().delete(Counter.REDIS_KEY)
+
+
+def _prometheus_escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _prometheus_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    parts = [f'{key}="{_prometheus_escape(value)}"' for key, value in labels.items()]
+    return "{" + ",".join(parts) + "}"
+
+
+def _label_to_dict(label: Optional[str], label_names: Dict[str, str]) -> dict:
+    """converts a stats label like tracker_1 into Prometheus labels"""
+    if not label:
+        return dict()
+    kind, _, pk = label.rpartition("_")
+    if kind in ("tracker", "webhook") and pk.isdigit():
+        return {f"{kind}_id": pk, kind: label_names.get(label, "")}
+    return {"label": label}
+
+
+def prometheus_text(
+    label_names: Dict[str, str] = None,
+    gauges: Iterable[Tuple[str, str, dict, float]] = None,
+) -> str:
+    """renders all metrics in the Prometheus text exposition format
+
+    Args:
+    - label_names: map of stats labels to the names of trackers and webhooks
+    - gauges: additional gauges as tuples of name, description, labels and value
+    """
+    prefix = __title__.lower()
+    label_names = label_names if label_names else dict()
+    lines = list()
+
+    # counters
+    values_by_name = defaultdict(list)
+    for (name, label), value in counter_values().items():
+        values_by_name[name].append((label, value))
+    for name, description in Counter.DESCRIPTIONS.items():
+        metric = f"{prefix}_{name}_total"
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} counter")
+        for label, value in sorted(values_by_name.get(name, [(None, 0)]), key=str):
+            labels = _prometheus_labels(_label_to_dict(label, label_names))
+            lines.append(f"{metric}{labels} {value}")
+
+    # gauges
+    gauges_by_name = defaultdict(list)
+    descriptions = dict()
+    for name, description, labels, value in gauges or []:
+        gauges_by_name[name].append((labels, value))
+        descriptions[name] = description
+    for name, items in gauges_by_name.items():
+        metric = f"{prefix}_{name}"
+        lines.append(f"# HELP {metric} {descriptions[name]}")
+        lines.append(f"# TYPE {metric} gauge")
+        for labels, value in items:
+            lines.append(f"{metric}{_prometheus_labels(labels)} {value}")
+
+    # histograms
+    histograms_by_name = defaultdict(list)
+    for histogram in Histogram.all():
+        histograms_by_name[histogram.name].append(histogram.data())
+    for name, histograms in histograms_by_name.items():
+        if name == TASK_DURATION_HISTOGRAM:
+            metric = f"{prefix}_task_duration_seconds"
+            description = "Duration of tasks"
+        else:
+            metric = f"{prefix}_stage_{name}_duration_seconds"
+            description = f"Duration of pipeline stage {name}"
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} histogram")
+        for data in histograms:
+            if name == TASK_DURATION_HISTOGRAM:
+                base_labels = {"task": data.label}
+            else:
+                base_labels = _label_to_dict(data.label, label_names)
+            cumulated = 0
+            for upper_bound, count in data.buckets:
+                cumulated += count
+                le = "+Inf" if upper_bound == float("inf") else str(upper_bound)
+                labels = _prometheus_labels({**base_labels, "le": le})
+                lines.append(f"{metric}_bucket{labels} {cumulated}")
+            labels = _prometheus_labels(base_labels)
+            lines.append(f"{metric}_sum{labels} {data.sum}")
+            lines.append(f"{metric}_count{labels} {data.count}")
+
+    return "\n".join(lines) + "\n"
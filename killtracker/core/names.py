@@ -0,0 +1,141 @@
+"""Shared cache for resolving Eve entity IDs to names
+
+Names are looked up in a per-worker LRU cache first, then in the Django cache
+shared by all workers. Remaining IDs are resolved in one batch from the database
+or with a single call to ESI's /universe/names/ endpoint.
+"""
+from collections import OrderedDict
+import threading
+from typing import Any, Dict, Iterable
+
+from django.core.cache import cache
+
+from allianceauth.services.hooks import get_extension_logger
+from eveuniverse.helpers import EveEntityNameResolver
+from eveuniverse.models import EveEntity, EveSolarSystem
+
+from .. import __title__
+from ..app_settings import (
+    KILLTRACKER_NAMES_CACHE_LOCAL_SIZE,
+    KILLTRACKER_NAMES_CACHE_TIMEOUT,
+)
+from ..utils import LoggerAddTag
+from .circuit_breaker import Service, breaker
+
+logger = LoggerAddTag(get_extension_logger(__name__), __title__)
+
+
+class _LocalCache:
+    """Thread-safe LRU cache of this worker process"""
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        result = dict()
+        with self._lock:
+            for key in keys:
+                if key in self._data:
+                    self._data.move_to_end(key)
+                    result[key] = self._data[key]
+        return result
+
+    def set_many(self, data: Dict[str, Any]) -> None:
+        with self._lock:
+            for key, value in data.items():
+                self._data[key] = value
+                self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+_local_cache = _LocalCache(KILLTRACKER_NAMES_CACHE_LOCAL_SIZE)
+
+
+def _name_key(entity_id: int) -> str:
+    return f"{__title__}_entity_name_{entity_id}"
+
+
+def _region_key(solar_system_id: int) -> str:
+    return f"{__title__}_solar_system_region_{solar_system_id}"
+
+
+def _get_many(keys: Iterable[str]) -> Dict[str, Any]:
+    """returns values for keys found in the local or shared cache"""
+    keys = set(keys)
+    result = _local_cache.get_many(keys)
+    missing_keys = keys - set(result.keys())
+    if missing_keys:
+        shared_result = cache.get_many(missing_keys)
+        _local_cache.set_many(shared_result)
+        result.update(shared_result)
+    return result
+
+
+def _set_many(data: Dict[str, Any]) -> None:
+    _local_cache.set_many(data)
+    cache.set_many(data, timeout=KILLTRACKER_NAMES_CACHE_TIMEOUT)
+
+
+def resolve_names(ids: Iterable[int]) -> EveEntityNameResolver:
+    """returns a resolver for the names of the given entity IDs"""
+    ids = {int(obj) for obj in ids if obj}
+    cached = _get_many(_name_key(entity_id) for entity_id in ids)
+    names_map = {
+        entity_id: cached[_name_key(entity_id)]
+        for entity_id in ids
+        if _name_key(entity_id) in cached
+    }
+    missing_ids = ids - set(names_map.keys())
+    if missing_ids:
+        logger.debug("Resolving names for %d IDs", len(missing_ids))
+        esi_breaker = breaker(Service.ESI)
+        if esi_breaker.is_available():
+            with esi_breaker.guard():
+                resolver = EveEntity.objects.bulk_resolve_names(ids=missing_ids)
+            new_names = {
+                entity_id: resolver.to_name(entity_id)
+                for entity_id in missing_ids
+                if resolver.to_name(entity_id)
+            }
+        else:
+            # ESI is down, so only names already known are used
+            new_names = dict(
+                EveEntity.objects.filter(id__in=missing_ids)
+                .exclude(name="")
+                .values_list("id", "name")
+            )
+        _set_many({_name_key(entity_id): name for entity_id, name in new_names.items()})
+        names_map.update(new_names)
+
+    return EveEntityNameResolver(names_map)
+
+
+def solar_system_region_name(solar_system_id: int) -> str:
+    """returns the name of the region a solar system belongs to"""
+    key = _region_key(solar_system_id)
+    region_name = _get_many([key]).get(key)
+    if not region_name:
+        try:
+            solar_system = EveSolarSystem.objects.get(id=solar_system_id)
+        except EveSolarSystem.DoesNotExist:
+            with breaker(Service.ESI).guard():
+                solar_system, _ = EveSolarSystem.objects.get_or_create_esi(
+                    id=solar_system_id
+                )
+        if not solar_system:
+            return ""
+        region_name = solar_system.eve_constellation.eve_region.name
+        _set_many({key: region_name})
+    return region_name
+
+
+def clear_local_cache() -> None:
+    """clears the name cache of this worker process"""
+    _local_cache.clear()
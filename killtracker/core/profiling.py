@@ -0,0 +1,207 @@
+"""Opt-in profiling of trackers
+
+Records DB queries, ESI calls and wall time per tracker and operation
+in Redis buckets, which are aggregated over a sliding window.
+"""
+from contextlib import contextmanager
+from dataclasses import dataclass
+import functools
+import threading
+from time import perf_counter, time
+from typing import Dict, Iterator
+
+from requests.adapters import BaseAdapter
+
+from django.core.cache import cache
+from django.db import connection
+
+from allianceauth.services.hooks import get_extension_logger
+from eveuniverse.providers import esi as eveuniverse_esi
+
+from .. import __title__
+from ..app_settings import KILLTRACKER_PROFILING_ENABLED, KILLTRACKER_PROFILING_WINDOW
+from ..providers import esi
+from ..utils import LoggerAddTag
+
+logger = LoggerAddTag(get_extension_logger(__name__), __title__)
+
+ESI_BASE_URL = "https://esi.evetech.net/"
+ESI_PROVIDERS = (esi, eveuniverse_esi)
+BUCKET_SECONDS = 300
+
+_local = threading.local()
+_install_lock = threading.Lock()
+
+
+class Operation:
+    """Profiled operations of a tracker"""
+
+    PROCESS_KILLMAIL = "process_killmail"
+    CREATE_EMBED = "create_embed"
+
+
+@dataclass
+class ProfileResult:
+    """Measurements of one profiled call"""
+
+    queries: int = 0
+    esi_calls: int = 0
+    duration: float = 0
+
+
+@dataclass
+class ProfileSummary:
+    """Aggregated measurements of an operation within the profiling window"""
+
+    count: int = 0
+    queries: int = 0
+    esi_calls: int = 0
+    duration: float = 0
+
+    @property
+    def avg_queries(self) -> float:
+        return self.queries / self.count if self.count else 0
+
+    @property
+    def avg_esi_calls(self) -> float:
+        return self.esi_calls / self.count if self.count else 0
+
+    @property
+    def avg_duration(self) -> float:
+        return self.duration / self.count if self.count else 0
+
+    def __str__(self) -> str:
+        if not self.count:
+            return "-"
+        return (
+            f"{self.avg_duration * 1000:,.1f} ms, {self.avg_queries:,.1f} queries, "
+            f"{self.avg_esi_calls:,.1f} ESI calls ({self.count:,}x)"
+        )
+
+
+def _active_results() -> list:
+    if not hasattr(_local, "results"):
+        _local.results = list()
+    return _local.results
+
+
+class _EsiCallCounterAdapter(BaseAdapter):
+    """transport adapter of an ESI client which counts requests
+    for all profiles active in the current thread
+    """
+
+    def __init__(self, adapter: BaseAdapter) -> None:
+        super().__init__()
+        self._adapter = adapter
+
+    def send(self, request, **kwargs):
+        for result in _active_results():
+            result.esi_calls += 1
+        return self._adapter.send(request, **kwargs)
+
+    def close(self):
+        self._adapter.close()
+
+
+def _install_esi_call_counter() -> None:
+    """mounts the ESI call counter on the HTTP session of all ESI clients
+    which have been created and do not have it yet
+    """
+    for provider in ESI_PROVIDERS:
+        client = provider._client  # clients are created lazily by the provider
+        if client is None:
+            continue
+        session = client.swagger_spec.http_client.session
+        if isinstance(session.get_adapter(ESI_BASE_URL), _EsiCallCounterAdapter):
+            continue
+        with _install_lock:
+            adapter = session.get_adapter(ESI_BASE_URL)
+            if not isinstance(adapter, _EsiCallCounterAdapter):
+                session.mount(ESI_BASE_URL, _EsiCallCounterAdapter(adapter))
+
+
+@contextmanager
+def profile() -> Iterator[ProfileResult]:
+    """measures DB queries, ESI calls and wall time of the enclosed block"""
+    _install_esi_call_counter()
+    result = ProfileResult()
+
+    def count_queries(execute, sql, params, many, context):
+        result.queries += 1
+        return execute(sql, params, many, context)
+
+    results = _active_results()
+    results.append(result)
+    started = perf_counter()
+    try:
+        with connection.execute_wrapper(count_queries):
+            yield result
+    finally:
+        result.duration = perf_counter() - started
+        results.remove(result)
+
+
+def _bucket_key(tracker_pk: int, bucket: int) -> str:
+    return f"{__title__}_profile_tracker_{tracker_pk}_{bucket}"
+
+
+def record_profile(tracker_pk: int, operation: str, result: ProfileResult) -> None:
+    """records a profiled call for a tracker"""
+    bucket = int(time() // BUCKET_SECONDS)
+    key = _bucket_key(tracker_pk, bucket)
+    try:
+        pipe = cache.get_master_client().pipeline()
+        pipe.hincrby(key, f"{operation}:count", 1)
+        pipe.hincrby(key, f"{operation}:queries", result.queries)
+        pipe.hincrby(key, f"{operation}:esi_calls", result.esi_calls)
+        pipe.hincrbyfloat(key, f"{operation}:duration", result.duration)
+        pipe.expire(key, KILLTRACKER_PROFILING_WINDOW * 60 + BUCKET_SECONDS)
+        pipe.execute()
+    except Exception:
+        logger.warning(
+            "Failed to record profile for tracker %s", tracker_pk, exc_info=True
+        )
+
+
+def tracker_profile(tracker_pk: int) -> Dict[str, ProfileSummary]:
+    """returns aggregated profile of a tracker within the profiling window
+    for each operation
+    """
+    current_bucket = int(time() // BUCKET_SECONDS)
+    buckets_count = max(1, KILLTRACKER_PROFILING_WINDOW * 60 // BUCKET_SECONDS)
+    pipe = cache.get_master_client().pipeline()
+    for bucket in range(current_bucket - buckets_count + 1, current_bucket + 1):
+        pipe.hgetall(_bucket_key(tracker_pk, bucket))
+
+    summaries = {
+        Operation.PROCESS_KILLMAIL: ProfileSummary(),
+        Operation.CREATE_EMBED: ProfileSummary(),
+    }
+    for raw in pipe.execute():
+        for field, value in raw.items():
+            operation, _, prop = field.decode("utf8").partition(":")
+            summary = summaries.setdefault(operation, ProfileSummary())
+            if prop == "duration":
+                summary.duration += float(value)
+            else:
+                setattr(summary, prop, getattr(summary, prop) + int(value))
+
+    return summaries
+
+
+def profiled(operation: str):
+    """decorator for profiling a tracker method when profiling is enabled"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(tracker, *args, **kwargs):
+            if not KILLTRACKER_PROFILING_ENABLED:
+                return func(tracker, *args, **kwargs)
+            with profile() as result:
+                value = func(tracker, *args, **kwargs)
+            record_profile(tracker.pk, operation, result)
+            return value
+
+        return wrapper
+
+    return decorator
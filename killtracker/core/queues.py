@@ -0,0 +1,294 @@
+"""Message queues for webhooks
+
+Bulk operations need a constant number of roundtrips to Redis
+regardless of the number of messages.
+"""
+from dataclasses import dataclass, field
+from time import time
+from typing import Iterable, List, Optional
+
+from redis import Redis
+
+
+@dataclass(frozen=True)
+class QueuedMessage:
+    """A message taken from a priority queue"""
+
+    message: str
+    priority: int
+    score: float
+    member: str = field(repr=False)
+
+
+# enqueues messages into one lane and returns the new size of the queue
+# KEYS: lane, sequence, all lanes - ARGV: now in ms, messages
+_ENQUEUE_SCRIPT = """
+for i = 2, #ARGV do
+    local seq = redis.call('INCR', KEYS[2])
+    local score = tonumber(ARGV[1]) * 1000 + seq % 1000
+    redis.call('ZADD', KEYS[1], score, seq .. ':' .. ARGV[i])
+end
+local size = 0
+for i = 3, #KEYS do
+    size = size + redis.call('ZCARD', KEYS[i])
+end
+return size
+"""
+
+# dequeues up to max messages, starting with the highest priority lane
+# KEYS: all lanes ordered by priority - ARGV: max
+# returns flat list of lane index, member and score for each message
+_DEQUEUE_SCRIPT = """
+local max = tonumber(ARGV[1])
+local result = {}
+for i, key in ipairs(KEYS) do
+    local remaining = max - #result / 3
+    if remaining <= 0 then
+        break
+    end
+    local items = redis.call('ZRANGE', key, 0, remaining - 1, 'WITHSCORES')
+    for j = 1, #items, 2 do
+        redis.call('ZREM', key, items[j])
+        table.insert(result, i)
+        table.insert(result, items[j])
+        table.insert(result, items[j + 1])
+    end
+end
+return result
+"""
+
+# removes messages until the queue has no more then max size messages
+# KEYS: all lanes ordered by priority - ARGV: max size, policy
+# policy "oldest" removes the oldest messages regardless of priority
+# policy "priority" removes the oldest messages of the lowest priority first
+# returns number of removed messages
+_TRIM_SCRIPT = """
+local size = 0
+for i, key in ipairs(KEYS) do
+    size = size + redis.call('ZCARD', key)
+end
+local excess = size - tonumber(ARGV[1])
+if excess <= 0 then
+    return 0
+end
+if ARGV[2] == 'priority' then
+    local removed = 0
+    for i = #KEYS, 1, -1 do
+        local remaining = excess - removed
+        if remaining <= 0 then
+            break
+        end
+        removed = removed + redis.call('ZREMRANGEBYRANK', KEYS[i], 0, remaining - 1)
+    end
+    return removed
+end
+local candidates = {}
+for i, key in ipairs(KEYS) do
+    local items = redis.call('ZRANGE', key, 0, excess - 1, 'WITHSCORES')
+    for j = 1, #items, 2 do
+        table.insert(candidates, {key, items[j], tonumber(items[j + 1])})
+    end
+end
+table.sort(candidates, function(a, b) return a[3] < b[3] end)
+for i = 1, excess do
+    redis.call('ZREM', candidates[i][1], candidates[i][2])
+end
+return excess
+"""
+
+
+class PriorityMQ:
+    """Message queue with priority lanes using Redis sorted sets.
+
+    Messages are dequeued from the highest priority lane first
+    and within a lane in the order they were enqueued.
+    """
+
+    REDIS_KEY_PREFIX = "REDIS_PRIORITY_MQ"
+
+    def __init__(
+        self,
+        conn: Redis,
+        name: str,
+        priorities: Iterable[int],
+        default_priority: int = None,
+    ) -> None:
+        self._conn = conn
+        self._name = str(name)
+        self._priorities = sorted(priorities, reverse=True)
+        if not self._priorities:
+            raise ValueError("Need at least one priority")
+        self._default_priority = (
+            default_priority
+            if default_priority is not None
+            else self._priorities[len(self._priorities) // 2]
+        )
+        self._validate_priority(self._default_priority)
+
+    @property
+    def conn(self) -> Redis:
+        return self._conn
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def priorities(self) -> List[int]:
+        """priorities of this queue from highest to lowest"""
+        return list(self._priorities)
+
+    def _validate_priority(self, priority: int) -> None:
+        if priority not in self._priorities:
+            raise ValueError(f"Invalid priority: {priority}")
+
+    def _lane_key(self, priority: int) -> str:
+        return f"{self.REDIS_KEY_PREFIX}_{self.name}_{priority}"
+
+    def _lane_keys(self) -> List[str]:
+        return [self._lane_key(priority) for priority in self._priorities]
+
+    def _sequence_key(self) -> str:
+        return f"{self.REDIS_KEY_PREFIX}_{self.name}_sequence"
+
+    def size(self, priority: int = None) -> int:
+        """return current number of messages in the queue
+        or in the lane of the given priority
+        """
+        if priority is not None:
+            self._validate_priority(priority)
+            return int(self.conn.zcard(self._lane_key(priority)))
+
+        pipe = self.conn.pipeline()
+        for key in self._lane_keys():
+            pipe.zcard(key)
+        return sum(pipe.execute())
+
+    def clear(self) -> int:
+        """deletes all messages from the queue.
+        Returns number of cleared messages.
+        """
+        pipe = self.conn.pipeline()
+        for key in self._lane_keys():
+            pipe.zcard(key)
+        pipe.delete(*self._lane_keys())
+        return sum(pipe.execute()[:-1])
+
+    def enqueue(self, message: str, priority: int = None) -> int:
+        """enqueue one message into the queue with the given priority
+
+        returns size of the queue after enqueuing
+        """
+        return self.enqueue_bulk([message], priority)
+
+    def enqueue_bulk(self, messages: List[str], priority: int = None) -> int:
+        """enqueue a list of messages with the same priority into the queue at once
+
+        returns size of the queue after enqueuing
+        """
+        priority = self._default_priority if priority is None else priority
+        self._validate_priority(priority)
+        script = self.conn.register_script(_ENQUEUE_SCRIPT)
+        return int(
+            script(
+                keys=[self._lane_key(priority), self._sequence_key()]
+                + self._lane_keys(),
+                args=[int(time() * 1000)] + [str(message) for message in messages],
+            )
+        )
+
+    def dequeue(self) -> Optional[str]:
+        """dequeue the next message from the queue. returns None if empty"""
+        item = self.dequeue_item()
+        return item.message if item else None
+
+    def dequeue_item(self) -> Optional[QueuedMessage]:
+        """dequeue the next message from the queue with its properties.
+        returns None if empty
+        """
+        items = self._dequeue_items(1)
+        return items[0] if items else None
+
+    def dequeue_bulk(self, max: int = None) -> List[str]:
+        """dequeue a list of messages from the queue in priority order.
+
+        return no more than max message from queue
+        returns all messages in the queue if max is not specified
+        returns an empty list if queue is empty
+        """
+        if max is not None and int(max) < 0:
+            raise ValueError("max can not be negative")
+        if max is None:
+            max = self.size()
+        return [item.message for item in self._dequeue_items(int(max))]
+
+    def _dequeue_items(self, max: int) -> List[QueuedMessage]:
+        if max <= 0:
+            return []
+        script = self.conn.register_script(_DEQUEUE_SCRIPT)
+        result = script(keys=self._lane_keys(), args=[max])
+        items = list()
+        for num in range(0, len(result), 3):
+            member = result[num + 1].decode("utf8")
+            items.append(
+                QueuedMessage(
+                    message=member.partition(":")[2],
+                    priority=self._priorities[int(result[num]) - 1],
+                    score=float(result[num + 2]),
+                    member=member,
+                )
+            )
+        return items
+
+    def requeue(self, item: QueuedMessage) -> None:
+        """puts a dequeued message back into the queue with its original position"""
+        self._validate_priority(item.priority)
+        self.conn.zadd(self._lane_key(item.priority), {item.member: item.score})
+
+    def move_all_to(self, other: "PriorityMQ") -> int:
+        """moves all messages from this queue to the other queue in one
+        atomic operation. Messages keep their priority and age.
+
+        returns number of moved messages
+        """
+        pipe = self.conn.pipeline()
+        for priority in self._priorities:
+            pipe.zcard(self._lane_key(priority))
+        for priority in self._priorities:
+            other._validate_priority(priority)
+            pipe.zunionstore(
+                other._lane_key(priority),
+                [other._lane_key(priority), self._lane_key(priority)],
+                aggregate="MIN",
+            )
+        pipe.delete(*self._lane_keys())
+        return sum(pipe.execute()[: len(self._priorities)])
+
+    def trim(self, max_size: int, oldest_first: bool = False) -> int:
+        """removes messages from the queue so it has no more then max_size messages.
+        By default removes the oldest messages of the lowest priority first.
+        When oldest_first is True removes the oldest messages regardless of priority.
+
+        returns number of removed messages
+        """
+        if int(max_size) < 0:
+            raise ValueError("max_size can not be negative")
+        script = self.conn.register_script(_TRIM_SCRIPT)
+        return int(
+            script(
+                keys=self._lane_keys(),
+                args=[int(max_size), "oldest" if oldest_first else "priority"],
+            )
+        )
+
+    def drop_stale(self, priority: int, max_age: float) -> int:
+        """drops messages from the lane of the given priority
+        which are older than max_age in seconds.
+
+        returns number of dropped messages
+        """
+        self._validate_priority(priority)
+        threshold = int((time() - max_age) * 1000) * 1000
+        return int(
+            self.conn.zremrangebyscore(self._lane_key(priority), "-inf", threshold)
+        )
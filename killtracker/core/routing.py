@@ -0,0 +1,40 @@
+"""Routing of tasks to Celery queues by pipeline stage
+
+All tasks run on the default queue unless a queue is configured for their stage,
+so that e.g. delivery and matching can be scaled with dedicated workers
+and storage can be kept away from the latency critical path.
+"""
+from typing import Optional
+
+from ..app_settings import KILLTRACKER_TASK_QUEUES
+
+
+class TaskStage:
+    """Stages of the pipeline tasks are grouped into"""
+
+    INGEST = "ingest"  # fetching killmails from ZKB
+    MATCH = "match"  # running trackers
+    RENDER = "render"  # generating messages
+    DELIVER = "deliver"  # sending messages to webhooks
+    STORAGE = "storage"  # storing and purging killmails
+    MAINTENANCE = "maintenance"  # periodic housekeeping
+
+    ALL = [INGEST, MATCH, RENDER, DELIVER, STORAGE, MAINTENANCE]
+
+
+def task_queue(stage: str) -> Optional[str]:
+    """returns name of the queue configured for a stage
+    or None for the default queue
+    """
+    if stage not in TaskStage.ALL:
+        raise ValueError(f"Invalid stage: {stage}")
+    queues = KILLTRACKER_TASK_QUEUES if KILLTRACKER_TASK_QUEUES else dict()
+    return queues.get(stage) or None
+
+
+def shard_queue(shard: int) -> Optional[str]:
+    """returns name of the queue for a tracker shard
+    or None for the default queue
+    """
+    match_queue = task_queue(TaskStage.MATCH)
+    return f"{match_queue}_{shard}" if match_queue else None
@@ -0,0 +1,86 @@
+"""Sharding of trackers across workers
+
+Trackers are assigned to shards by their explicit shard or by hashing their PK.
+Each shard worker keeps the enabled trackers of its shard with compiled clauses
+in memory, so matching a killmail needs no queries for the trackers.
+"""
+import threading
+from time import monotonic
+from typing import Dict, List, Tuple
+import zlib
+
+from allianceauth.services.hooks import get_extension_logger
+
+from .. import __title__
+from ..app_settings import (
+    KILLTRACKER_TASK_OBJECTS_CACHE_TIMEOUT,
+    KILLTRACKER_TRACKER_SHARDS,
+)
+from ..utils import LoggerAddTag
+
+logger = LoggerAddTag(get_extension_logger(__name__), __title__)
+
+
+def shard_count() -> int:
+    """returns the number of shards. 1 means sharding is disabled."""
+    return max(1, KILLTRACKER_TRACKER_SHARDS)
+
+
+def tracker_shard(tracker) -> int:
+    """returns the shard a tracker belongs to"""
+    if tracker.shard is not None:
+        return tracker.shard % shard_count()
+    return zlib.crc32(str(tracker.pk).encode("utf8")) % shard_count()
+
+
+class _ShardTrackers:
+    """Thread-safe cache of the trackers for each shard of this worker process"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._data: Dict[int, Tuple[float, list]] = dict()
+
+    def get(self, shard: int) -> list:
+        with self._lock:
+            loaded_at, trackers = self._data.get(shard, (None, None))
+        if (
+            loaded_at is None
+            or monotonic() - loaded_at > KILLTRACKER_TASK_OBJECTS_CACHE_TIMEOUT
+        ):
+            trackers = self._load(shard)
+            with self._lock:
+                self._data[shard] = (monotonic(), trackers)
+        return trackers
+
+    @staticmethod
+    def _load(shard: int) -> list:
+        from ..models import Tracker
+
+        trackers = [
+            tracker
+            for tracker in Tracker.objects.filter(is_enabled=True).select_related(
+                "webhook", "origin_solar_system"
+            )
+            if tracker_shard(tracker) == shard
+        ]
+        for tracker in trackers:
+            tracker.compile_clauses()
+        logger.info("Loaded %d trackers for shard %d", len(trackers), shard)
+        return trackers
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+_shard_trackers = _ShardTrackers()
+
+
+def shard_trackers(shard: int) -> List:
+    """returns the enabled trackers of a shard with compiled clauses"""
+    return _shard_trackers.get(shard)
+
+
+def clear_shard_trackers() -> None:
+    """clears the trackers cached by this worker process"""
+    _shard_trackers.clear()
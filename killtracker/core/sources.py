@@ -0,0 +1,200 @@
+"""Sources of killmails for the ingest
+
+All sources provide the same asynchronous stream of killmails,
+so deployments can pick the feed with the lowest latency
+and the rest of the pipeline does not depend on where killmails come from.
+
+Available sources:
+- redisq: long polling of ZKB RedisQ
+- websocket: the killstream of the ZKB websocket
+- file: replay of killmails from a file, e.g. for testing and load tests
+
+The websocket source requires websockets, which is an optional dependency.
+"""
+import asyncio
+from functools import partial
+import json
+from typing import AsyncIterator, Callable, Dict, Optional, Type
+
+from allianceauth.services.hooks import get_extension_logger
+
+from .. import __title__
+from ..exceptions import ServiceUnavailable
+from ..utils import LoggerAddTag, JSONDateTimeDecoder
+from .killmails import Killmail
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+logger = LoggerAddTag(get_extension_logger(__name__), __title__)
+
+ZKB_WEBSOCKET_URL = "wss://zkillboard.com/websocket/"
+RECONNECT_DELAY = 5
+
+
+def is_websocket_available() -> bool:
+    """returns True if websockets is installed and the websocket source can be used"""
+    return websockets is not None
+
+
+class KillmailSource:
+    """Base class for sources of killmails"""
+
+    name = ""
+
+    def stream(self) -> AsyncIterator[Killmail]:
+        """returns an asynchronous stream of received killmails"""
+        raise NotImplementedError()
+
+
+class RedisQSource(KillmailSource):
+    """Killmails from long polling ZKB RedisQ"""
+
+    name = "redisq"
+
+    def __init__(self, queue_id: str = None, retry_delay: int = RECONNECT_DELAY):
+        self.queue_id = queue_id
+        self.retry_delay = retry_delay
+
+    async def stream(self) -> AsyncIterator[Killmail]:
+        loop = asyncio.get_event_loop()
+        fetch = partial(Killmail.create_from_zkb_redisq, queue_id=self.queue_id)
+        while True:
+            try:
+                killmail = await loop.run_in_executor(None, fetch)
+            except ServiceUnavailable as ex:
+                logger.warning("ZKB is currently unavailable")
+                await asyncio.sleep(ex.retry_after)
+                continue
+            except OSError:
+                logger.warning(
+                    "Failed to fetch killmail from ZKB RedisQ", exc_info=True
+                )
+                await asyncio.sleep(self.retry_delay)
+                continue
+            if killmail:
+                yield killmail
+
+
+class WebsocketSource(KillmailSource):
+    """Killmails from the killstream of the ZKB websocket"""
+
+    name = "websocket"
+
+    def __init__(
+        self, url: str = ZKB_WEBSOCKET_URL, reconnect_delay: int = RECONNECT_DELAY
+    ):
+        if not is_websocket_available():
+            raise RuntimeError("The websocket source requires websockets")
+        self.url = url
+        self.reconnect_delay = reconnect_delay
+
+    async def stream(self) -> AsyncIterator[Killmail]:
+        while True:
+            try:
+                async with websockets.connect(self.url) as websocket:
+                    logger.info("Connected to websocket at %s", self.url)
+                    await websocket.send(
+                        json.dumps({"action": "sub", "channel": "killstream"})
+                    )
+                    async for message in websocket:
+                        killmail = self._parse(message)
+                        if killmail:
+                            yield killmail
+            except (OSError, websockets.WebSocketException):
+                logger.warning(
+                    "Lost connection to websocket at %s", self.url, exc_info=True
+                )
+            await asyncio.sleep(self.reconnect_delay)
+
+    @staticmethod
+    def _parse(message: str) -> Optional[Killmail]:
+        try:
+            data = json.loads(message)
+        except ValueError:
+            logger.warning("Received invalid message from websocket: %s", message)
+            return None
+        return Killmail.create_from_zkb_killstream(data)
+
+
+class FileSource(KillmailSource):
+    """Killmails replayed from a file with one killmail in JSON per line.
+
+    Each line is either a package as received from ZKB RedisQ
+    or a killmail as exported by Killmail.asjson().
+    """
+
+    name = "file"
+
+    def __init__(self, path: str, speed: float = 0) -> None:
+        """
+        Params:
+        - path: path of the file
+        - speed: replays with the original time between kills divided by speed,
+        or as fast as possible when 0
+        """
+        self.path = path
+        self.speed = speed
+
+    async def stream(self) -> AsyncIterator[Killmail]:
+        previous = None
+        with open(self.path, "r", encoding="utf-8") as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                killmail = self._parse(line)
+                if self.speed and previous and killmail.time and previous.time:
+                    delay = (killmail.time - previous.time).total_seconds()
+                    await asyncio.sleep(max(0, delay) / self.speed)
+                previous = killmail
+                yield killmail
+
+    @staticmethod
+    def _parse(line: str) -> Killmail:
+        data = json.loads(line, cls=JSONDateTimeDecoder)
+        if "killID" in data:
+            return Killmail._create_from_dict(data)
+        return Killmail.from_dict(data)
+
+
+SOURCES: Dict[str, Type[KillmailSource]] = {
+    obj.name: obj for obj in (RedisQSource, WebsocketSource, FileSource)
+}
+
+
+async def consume(
+    source: KillmailSource,
+    handler: Callable[[Killmail], None],
+    max_killmails: int = None,
+) -> int:
+    """calls the handler for each killmail received from a source
+    and returns the number of killmails received.
+
+    Runs until the stream ends or max killmails have been received.
+    """
+    count = 0
+    stream = source.stream()
+    try:
+        async for killmail in stream:
+            handler(killmail)
+            count += 1
+            if max_killmails and count >= max_killmails:
+                break
+    finally:
+        await stream.aclose()
+    return count
+
+
+def run_source(
+    source: KillmailSource,
+    handler: Callable[[Killmail], None],
+    max_killmails: int = None,
+) -> int:
+    """consumes a source in a new event loop, see consume()"""
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(consume(source, handler, max_killmails))
+    finally:
+        loop.close()
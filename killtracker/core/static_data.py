@@ -0,0 +1,117 @@
+"""Static data needed for matching killmails without calls to ESI
+
+In ESI-free mode killmails are only matched when all static data they need
+is already known locally. Other killmails are parked in Redis,
+while the missing data is fetched in the background.
+Parked killmails are released once their data is available,
+so that a slow ESI does not block matching of all other killmails.
+"""
+from dataclasses import dataclass, field
+import threading
+from typing import List, Set
+
+from django.core.cache import cache
+
+from eveuniverse.models import EveSolarSystem
+
+from .. import __title__
+from . import universe
+from .circuit_breaker import Service, breaker
+from .killmails import Killmail
+from .matching import ship_type_group_ids
+
+PARKED_KILLMAILS_KEY = f"{__title__}_parked_killmails"
+
+
+@dataclass
+class MissingStaticData:
+    """IDs of static data missing for matching a killmail"""
+
+    solar_system_ids: Set[int] = field(default_factory=set)
+    type_ids: Set[int] = field(default_factory=set)
+
+    def __bool__(self) -> bool:
+        return bool(self.solar_system_ids or self.type_ids)
+
+
+class _KnownSolarSystems:
+    """Thread-safe set of solar system IDs known to exist in this worker process"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._ids: Set[int] = set()
+
+    def __contains__(self, solar_system_id: int) -> bool:
+        with self._lock:
+            return solar_system_id in self._ids
+
+    def add(self, solar_system_id: int) -> None:
+        with self._lock:
+            self._ids.add(solar_system_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._ids.clear()
+
+
+_known_solar_systems = _KnownSolarSystems()
+
+
+def _is_solar_system_known(solar_system_id: int) -> bool:
+    if solar_system_id in _known_solar_systems:
+        return True
+    if (
+        universe.solar_system(solar_system_id)
+        or EveSolarSystem.objects.filter(id=solar_system_id).exists()
+    ):
+        _known_solar_systems.add(solar_system_id)
+        return True
+    return False
+
+
+def missing_static_data(killmail: Killmail) -> MissingStaticData:
+    """returns the static data missing locally for matching a killmail"""
+    missing = MissingStaticData()
+    if killmail.solar_system_id and not _is_solar_system_known(
+        killmail.solar_system_id
+    ):
+        missing.solar_system_ids.add(killmail.solar_system_id)
+    type_ids = {obj for obj in killmail.ship_type_ids() if obj}
+    known_ids = ship_type_group_ids(type_ids, load_from_esi=False).keys()
+    missing.type_ids = type_ids - set(known_ids)
+    return missing
+
+
+def load_static_data(missing: MissingStaticData) -> None:
+    """loads missing static data from ESI"""
+    for solar_system_id in missing.solar_system_ids:
+        with breaker(Service.ESI).guard():
+            EveSolarSystem.objects.get_or_create_esi(id=solar_system_id)
+    if missing.type_ids:
+        ship_type_group_ids(missing.type_ids)
+
+
+def park_killmail(killmail: Killmail) -> None:
+    """parks a killmail until its static data is available"""
+    cache.get_master_client().hset(PARKED_KILLMAILS_KEY, killmail.id, killmail.asjson())
+
+
+def parked_killmails() -> List[Killmail]:
+    """returns all parked killmails"""
+    data = cache.get_master_client().hgetall(PARKED_KILLMAILS_KEY)
+    return [Killmail.from_json(obj.decode("utf8")) for obj in data.values()]
+
+
+def unpark_killmails(killmail_ids: List[int]) -> None:
+    """removes killmails from the parked killmails"""
+    if killmail_ids:
+        cache.get_master_client().hdel(PARKED_KILLMAILS_KEY, *killmail_ids)
+
+
+def parked_killmails_count() -> int:
+    return cache.get_master_client().hlen(PARKED_KILLMAILS_KEY)
+
+
+def clear_parked_killmails() -> None:
+    cache.get_master_client().delete(PARKED_KILLMAILS_KEY)
+    _known_solar_systems.clear()
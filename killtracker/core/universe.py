@@ -0,0 +1,313 @@
+"""Static snapshot of the Eve universe for geography lookups
+
+The snapshot is a compact binary file with one fixed size record
+for each solar system and a block with all names. It is memory mapped,
+so lookups need no DB or network access and all worker processes
+on a server share the same pages.
+
+File layout:
+- header: magic, version, number of records
+- records: solar system ID, constellation ID, region ID, security status,
+  position x, y, z, offset and length of the name in the names block
+- names: UTF-8 encoded names of all solar systems
+
+Jumps from tracker origins are calculated from the stargates once
+and kept as jump tables in the shared cache.
+"""
+from dataclasses import dataclass
+import math
+import mmap
+import os
+import struct
+import threading
+from typing import Dict, Iterable, Optional
+
+from django.core.cache import cache
+
+from allianceauth.services.hooks import get_extension_logger
+from eveuniverse.models import EveStargate
+
+from .. import __title__
+from ..app_settings import KILLTRACKER_UNIVERSE_SNAPSHOT_PATH
+from ..utils import LoggerAddTag
+
+logger = LoggerAddTag(get_extension_logger(__name__), __title__)
+
+MAGIC = b"KTUV"
+VERSION = 1
+JUMP_TABLE_CACHE_TIMEOUT = 3600 * 24
+JUMP_TABLE_RETRY_TIMEOUT = 3600
+# min jumps covered by the jump table of a tracker's origin,
+# so that jumps shown on messages can be looked up too
+JUMP_TABLE_MIN_JUMPS = 10
+_HEADER = struct.Struct("<4sHI")
+_RECORD = struct.Struct("<IIIddddII")
+
+
+@dataclass(frozen=True)
+class SolarSystemInfo:
+    """Geography of a solar system"""
+
+    id: int
+    name: str
+    constellation_id: int
+    region_id: int
+    security_status: float
+    position_x: Optional[float] = None
+    position_y: Optional[float] = None
+    position_z: Optional[float] = None
+
+    @property
+    def is_high_sec(self) -> bool:
+        return self.security_status > 0.5
+
+    @property
+    def is_low_sec(self) -> bool:
+        return 0 < self.security_status <= 0.5
+
+    @property
+    def is_null_sec(self) -> bool:
+        return self.security_status <= 0 and not self.is_w_space
+
+    @property
+    def is_w_space(self) -> bool:
+        return 31000000 <= self.id < 32000000
+
+    def distance_to(self, destination: "SolarSystemInfo") -> Optional[float]:
+        """returns distance in meters to the given solar system
+        or None if it can not be calculated, e.g. for wormhole space
+        """
+        if self.is_w_space or destination.is_w_space:
+            return None
+        positions = [
+            self.position_x,
+            self.position_y,
+            self.position_z,
+            destination.position_x,
+            destination.position_y,
+            destination.position_z,
+        ]
+        if any(obj is None for obj in positions):
+            return None
+        return math.sqrt(
+            (destination.position_x - self.position_x) ** 2
+            + (destination.position_y - self.position_y) ** 2
+            + (destination.position_z - self.position_z) ** 2
+        )
+
+    @classmethod
+    def from_eve_solar_system(cls, obj) -> "SolarSystemInfo":
+        return cls(
+            id=obj.id,
+            name=obj.name,
+            constellation_id=obj.eve_constellation_id,
+            region_id=obj.eve_constellation.eve_region_id,
+            security_status=obj.security_status,
+            position_x=obj.position_x,
+            position_y=obj.position_y,
+            position_z=obj.position_z,
+        )
+
+
+def _float_or_nan(value: Optional[float]) -> float:
+    return value if value is not None else math.nan
+
+
+def _nan_to_none(value: float) -> Optional[float]:
+    return None if math.isnan(value) else value
+
+
+def write_snapshot(path: str, solar_systems: Iterable[SolarSystemInfo]) -> int:
+    """writes a snapshot with the given solar systems to a file
+    and returns the number of solar systems written.
+
+    The file is replaced atomically, so running workers keep their current mapping.
+    """
+    solar_systems = sorted(solar_systems, key=lambda obj: obj.id)
+    records = bytearray()
+    names = bytearray()
+    for obj in solar_systems:
+        name = obj.name.encode("utf8")
+        records += _RECORD.pack(
+            obj.id,
+            obj.constellation_id,
+            obj.region_id,
+            obj.security_status,
+            _float_or_nan(obj.position_x),
+            _float_or_nan(obj.position_y),
+            _float_or_nan(obj.position_z),
+            len(names),
+            len(name),
+        )
+        names += name
+
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as file:
+        file.write(_HEADER.pack(MAGIC, VERSION, len(solar_systems)))
+        file.write(records)
+        file.write(names)
+    os.replace(temp_path, path)
+    return len(solar_systems)
+
+
+class UniverseSnapshot:
+    """Read-only memory mapped universe snapshot"""
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a valid universe snapshot")
+        self._names_offset = _HEADER.size + count * _RECORD.size
+        self._index: Dict[int, int] = {
+            solar_system_id: _HEADER.size + num * _RECORD.size
+            for num, (solar_system_id,) in enumerate(
+                struct.iter_unpack(
+                    "<I" + "x" * (_RECORD.size - 4),
+                    self._mmap[_HEADER.size : self._names_offset],
+                )
+            )
+        }
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, solar_system_id: int) -> bool:
+        return solar_system_id in self._index
+
+    def solar_system(self, solar_system_id: int) -> Optional[SolarSystemInfo]:
+        """returns the solar system with given ID or None if not found"""
+        offset = self._index.get(solar_system_id)
+        if offset is None:
+            return None
+        (
+            obj_id,
+            constellation_id,
+            region_id,
+            security_status,
+            position_x,
+            position_y,
+            position_z,
+            name_offset,
+            name_length,
+        ) = _RECORD.unpack_from(self._mmap, offset)
+        start = self._names_offset + name_offset
+        return SolarSystemInfo(
+            id=obj_id,
+            name=self._mmap[start : start + name_length].decode("utf8"),
+            constellation_id=constellation_id,
+            region_id=region_id,
+            security_status=security_status,
+            position_x=_nan_to_none(position_x),
+            position_y=_nan_to_none(position_y),
+            position_z=_nan_to_none(position_z),
+        )
+
+    def close(self) -> None:
+        self._mmap.close()
+
+
+_lock = threading.Lock()
+_snapshot = None
+_is_snapshot_loaded = False
+
+
+def snapshot() -> Optional[UniverseSnapshot]:
+    """returns the universe snapshot of this process
+    or None if no snapshot is configured or it can not be loaded
+    """
+    global _snapshot, _is_snapshot_loaded
+    if not _is_snapshot_loaded:
+        with _lock:
+            if not _is_snapshot_loaded:
+                if KILLTRACKER_UNIVERSE_SNAPSHOT_PATH:
+                    try:
+                        _snapshot = UniverseSnapshot(KILLTRACKER_UNIVERSE_SNAPSHOT_PATH)
+                    except (OSError, ValueError, struct.error):
+                        logger.warning(
+                            "Failed to load universe snapshot from %s",
+                            KILLTRACKER_UNIVERSE_SNAPSHOT_PATH,
+                            exc_info=True,
+                        )
+                    else:
+                        logger.info(
+                            "Loaded universe snapshot with %d solar systems",
+                            len(_snapshot),
+                        )
+                _is_snapshot_loaded = True
+    return _snapshot
+
+
+def solar_system(solar_system_id: int) -> Optional[SolarSystemInfo]:
+    """returns the solar system with given ID from the snapshot
+    or None if it is not available
+    """
+    obj = snapshot()
+    return obj.solar_system(solar_system_id) if obj else None
+
+
+def reset_snapshot() -> None:
+    """closes the snapshot of this process, so it is loaded again on next use"""
+    global _snapshot, _is_snapshot_loaded
+    with _lock:
+        if _snapshot:
+            _snapshot.close()
+        _snapshot = None
+        _is_snapshot_loaded = False
+
+
+def _jump_table_key(origin_id: int, max_jumps: int) -> str:
+    return f"{__title__}_jump_table_{origin_id}_{max_jumps}"
+
+
+def _calc_jump_table(origin_id: int, max_jumps: int) -> Optional[Dict[int, int]]:
+    """calculates jumps from the origin for all solar systems within max jumps
+    by walking the stargates. Needs one query per jump.
+
+    returns None if stargates are not loaded for all systems on the way
+    """
+    jumps = {origin_id: 0}
+    frontier = {origin_id}
+    for distance in range(1, max_jumps + 1):
+        gates = list(
+            EveStargate.objects.filter(
+                eve_solar_system_id__in=frontier,
+                destination_eve_solar_system__isnull=False,
+            ).values_list("eve_solar_system_id", "destination_eve_solar_system_id")
+        )
+        if {source_id for source_id, _ in gates} != frontier:
+            return None
+        frontier = {
+            destination_id for _, destination_id in gates if destination_id not in jumps
+        }
+        for solar_system_id in frontier:
+            jumps[solar_system_id] = distance
+        if not frontier:
+            break
+    return jumps
+
+
+def tracker_jump_table_jumps(tracker) -> int:
+    """returns the max jumps covered by the jump table for a tracker's origin"""
+    return max(tracker.require_max_jumps or 0, JUMP_TABLE_MIN_JUMPS)
+
+
+def jump_table(origin_id: int, max_jumps: int) -> Optional[Dict[int, int]]:
+    """returns the jumps from the origin for all solar systems within max jumps.
+    Solar systems not in the table are more than max jumps away.
+
+    returns None if the table can not be calculated,
+    e.g. when stargates have not been loaded or the origin is in wormhole space
+    """
+    key = _jump_table_key(origin_id, max_jumps)
+    table = cache.get(key)
+    if table is None:
+        table = _calc_jump_table(origin_id, max_jumps) or False
+        cache.set(
+            key,
+            table,
+            timeout=JUMP_TABLE_CACHE_TIMEOUT if table else JUMP_TABLE_RETRY_TIMEOUT,
+        )
+    return table if table else None
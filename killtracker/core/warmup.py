@@ -0,0 +1,137 @@
+"""Preloading of static data the pipeline needs
+
+After a deploy the first killmails would be slow, because trackers and static data
+like ship types, solar systems and names are loaded lazily on first use.
+The warm-up loads all of them into the caches in advance.
+
+Most of the data is kept in caches shared by all workers, which only need to be
+warmed up once. Per-process data is loaded in each pool process of a worker.
+"""
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Callable, List
+
+from allianceauth.services.hooks import get_extension_logger
+
+from .. import __title__
+from ..app_settings import KILLTRACKER_TASK_OBJECTS_CACHE_TIMEOUT
+from ..constants import (
+    EVE_CATEGORY_ID_FIGHTER,
+    EVE_CATEGORY_ID_SHIP,
+    EVE_CATEGORY_ID_STRUCTURE,
+)
+from ..utils import LoggerAddTag
+from . import universe
+from .matching import preload_ship_type_groups
+from .names import resolve_names
+
+logger = LoggerAddTag(get_extension_logger(__name__), __title__)
+
+# clauses with IDs of organizations, which are shown on messages
+_ORGANIZATION_CLAUSES = [
+    "exclude_attacker_alliances",
+    "require_attacker_alliances",
+    "exclude_attacker_corporations",
+    "require_attacker_corporations",
+    "require_victim_alliances",
+    "require_victim_corporations",
+]
+
+
+@dataclass
+class WarmupStep:
+    """Result of a step of the warm-up"""
+
+    name: str
+    count: int
+    duration: float
+
+    def __str__(self) -> str:
+        return f"{self.name}: {self.count:,} loaded in {self.duration:.3f}s"
+
+
+def _trackers() -> list:
+    from ..models import Tracker
+
+    trackers = list(Tracker.objects.filter(is_enabled=True).select_related("webhook"))
+    for tracker in trackers:
+        Tracker.objects.get_cached(
+            pk=tracker.pk,
+            select_related="webhook",
+            timeout=KILLTRACKER_TASK_OBJECTS_CACHE_TIMEOUT,
+        )
+    return trackers
+
+
+def _ship_type_groups() -> int:
+    return preload_ship_type_groups(
+        [EVE_CATEGORY_ID_SHIP, EVE_CATEGORY_ID_STRUCTURE, EVE_CATEGORY_ID_FIGHTER]
+    )
+
+
+def _universe() -> int:
+    snapshot = universe.snapshot()
+    return len(snapshot) if snapshot else 0
+
+
+def _jump_tables(trackers: list) -> int:
+    origins = dict()
+    for tracker in trackers:
+        if tracker.origin_solar_system_id:
+            max_jumps = universe.tracker_jump_table_jumps(tracker)
+            origins[(tracker.origin_solar_system_id, max_jumps)] = True
+    return sum(
+        1
+        for origin_id, max_jumps in origins
+        if universe.jump_table(origin_id, max_jumps) is not None
+    )
+
+
+def _organization_names(trackers: list) -> int:
+    ids = set()
+    for tracker in trackers:
+        for name in _ORGANIZATION_CLAUSES:
+            field = "alliance_id" if "alliances" in name else "corporation_id"
+            ids |= set(getattr(tracker, name).values_list(field, flat=True))
+    resolve_names(ids)
+    return len(ids)
+
+
+def _run_step(name: str, func: Callable[[], int]) -> WarmupStep:
+    started = perf_counter()
+    count = func()
+    step = WarmupStep(name=name, count=count, duration=perf_counter() - started)
+    logger.info("Warm-up: %s", step)
+    return step
+
+
+def warmup_shared() -> List[WarmupStep]:
+    """loads trackers and static data into the caches shared by all processes
+    and returns the results of each step
+    """
+    trackers = []
+
+    def load_trackers() -> int:
+        trackers.extend(_trackers())
+        return len(trackers)
+
+    return [
+        _run_step("trackers", load_trackers),
+        _run_step("ship type groups", _ship_type_groups),
+        _run_step("jump tables", lambda: _jump_tables(trackers)),
+        _run_step("organization names", lambda: _organization_names(trackers)),
+    ]
+
+
+def warmup_process() -> List[WarmupStep]:
+    """loads static data into the caches of the current process
+    and returns the results of each step
+
+    Does not access the database, so it is safe to run right after a fork.
+    """
+    return [_run_step("universe snapshot", _universe)]
+
+
+def warmup() -> List[WarmupStep]:
+    """runs all steps of the warm-up and returns their results"""
+    return warmup_shared() + warmup_process()
@@ -20,3 +20,21 @@ class WebhookTooManyRequests(KilltrackerException):
     @property
     def retry_after(self) -> int:
         return self._reset_after
+
+
+class ServiceUnavailable(KilltrackerException):
+    """External service is considered down and is not called"""
+
+    def __init__(self, service: str, retry_after: int) -> None:
+        """
+        Parameters:
+        - service: name of the service
+        - retry_after: time in seconds until the service will be called again
+        """
+        super().__init__(f"{service} is currently unavailable")
+        self.service = service
+        self._retry_after = int(retry_after)
+
+    @property
+    def retry_after(self) -> int:
+        return self._retry_after
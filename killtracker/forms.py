@@ -11,7 +11,19 @@ def field_nice_display(name: str) -> str:
 
 
 class TrackerAdminKillmailIdForm(forms.Form):
-    killmail_id = forms.IntegerField()
+    killmail_ids = forms.CharField(
+        label="Killmail IDs", help_text="One or more IDs separated by commas or spaces"
+    )
+
+    def clean_killmail_ids(self):
+        text = self.cleaned_data["killmail_ids"]
+        try:
+            killmail_ids = [int(obj) for obj in text.replace(",", " ").split()]
+        except ValueError:
+            raise ValidationError(_("Please enter only numbers")) from None
+        if not killmail_ids:
+            raise ValidationError(_("Please enter at least one killmail ID"))
+        return killmail_ids
 
 
 class TrackerAdminForm(forms.ModelForm):
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from eveuniverse.models import EveSolarSystem
+
+from ...app_settings import KILLTRACKER_UNIVERSE_SNAPSHOT_PATH
+from ...core.universe import SolarSystemInfo, write_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Exports all solar systems from the local database into a universe snapshot "
+        "file for fast geography lookups"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path",
+            default=KILLTRACKER_UNIVERSE_SNAPSHOT_PATH,
+            help="Path of the snapshot file. Defaults to the configured path",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if not path:
+            raise CommandError(
+                "Please provide a path or configure KILLTRACKER_UNIVERSE_SNAPSHOT_PATH"
+            )
+        solar_systems = EveSolarSystem.objects.select_related("eve_constellation")
+        count = write_snapshot(
+            path, [SolarSystemInfo.from_eve_solar_system(obj) for obj in solar_systems]
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Exported {count:,} solar systems to {path}.")
+        )
+        self.stdout.write("Please restart your workers to use the new snapshot.")
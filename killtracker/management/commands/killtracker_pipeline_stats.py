@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+
+from ...core.metrics import Histogram, stage_stats
+from ...models import Tracker, Webhook
+
+
+class Command(BaseCommand):
+    help = "Shows latency statistics for each stage of the killtracker pipeline"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--clear", action="store_true", help="Clears all recorded statistics"
+        )
+        parser.add_argument(
+            "--details",
+            action="store_true",
+            help="Also show statistics per tracker and webhook",
+        )
+
+    def handle(self, *args, **options):
+        if options["clear"]:
+            Histogram.clear_all()
+            self.stdout.write(self.style.SUCCESS("Cleared all pipeline stats."))
+            return
+
+        names = {**Tracker.objects.label_names(), **Webhook.objects.label_names()}
+        self.stdout.write(
+            f"{'Stage':<30} {'Count':>8} {'Avg':>9} {'P50':>9} {'P95':>9} {'P99':>9}"
+        )
+        for stage, histograms in stage_stats().items():
+            for data in histograms:
+                if data.label and not options["details"]:
+                    continue
+                name = (
+                    f"{stage} / {names.get(data.label, data.label)}"
+                    if data.label
+                    else stage
+                )
+                self.stdout.write(
+                    f"{name[:30]:<30} {data.count:>8,} "
+                    f"{self._format_seconds(data.average):>9} "
+                    f"{self._format_seconds(data.percentile(50)):>9} "
+                    f"{self._format_seconds(data.percentile(95)):>9} "
+                    f"{self._format_seconds(data.percentile(99)):>9}"
+                )
+
+    @staticmethod
+    def _format_seconds(value) -> str:
+        return f"{value:,.3f}s" if value is not None else "-"
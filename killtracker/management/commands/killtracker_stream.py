@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...app_settings import KILLTRACKER_REDISQ_QUEUE_ID
+from ...core.ingest import is_new_killmail
+from ...core.killmails import Killmail
+from ...core.sources import (
+    SOURCES,
+    ZKB_WEBSOCKET_URL,
+    FileSource,
+    RedisQSource,
+    WebsocketSource,
+    is_websocket_available,
+    run_source,
+)
+from ...tasks import dispatch_killmail
+
+
+class Command(BaseCommand):
+    help = (
+        "Receives killmails continuously from a source "
+        "and starts running trackers for them"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--source",
+            choices=sorted(SOURCES.keys()),
+            default=WebsocketSource.name,
+            help="Source of killmails",
+        )
+        parser.add_argument(
+            "--url", default=ZKB_WEBSOCKET_URL, help="URL of the websocket source"
+        )
+        parser.add_argument("--path", help="Path of the file source")
+        parser.add_argument(
+            "--speed",
+            type=float,
+            default=0,
+            help="Replay speed of the file source. 0 replays as fast as possible",
+        )
+        parser.add_argument(
+            "--max", type=int, help="Stop after receiving this number of killmails"
+        )
+
+    def handle(self, *args, **options):
+        source_name = options["source"]
+        if source_name == WebsocketSource.name:
+            if not is_websocket_available():
+                raise CommandError(
+                    "Please install websockets to use the websocket source"
+                )
+            source = WebsocketSource(url=options["url"])
+        elif source_name == FileSource.name:
+            if not options["path"]:
+                raise CommandError("Please provide a path for the file source")
+            source = FileSource(path=options["path"], speed=options["speed"])
+        else:
+            source = RedisQSource(queue_id=KILLTRACKER_REDISQ_QUEUE_ID)
+
+        def handle_killmail(killmail: Killmail) -> None:
+            if is_new_killmail(killmail.id):
+                dispatch_killmail.delay(killmail_json=killmail.asjson())
+                self.stdout.write(f"Received killmail {killmail.id}")
+
+        self.stdout.write(f"Receiving killmails from {source_name}...")
+        try:
+            count = run_source(source, handle_killmail, max_killmails=options["max"])
+        except KeyboardInterrupt:
+            self.stdout.write("Stopped.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Received {count:,} killmails."))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from ...core.warmup import warmup
+
+
+class Command(BaseCommand):
+    help = "Preloads trackers and static data into the caches"
+
+    def handle(self, *args, **options):
+        steps = warmup()
+        self.stdout.write(f"{'Step':<20} {'Count':>8} {'Duration':>10}")
+        for step in steps:
+            self.stdout.write(
+                f"{step.name:<20} {step.count:>8,} {step.duration:>9.3f}s"
+            )
+        total = sum(step.duration for step in steps)
+        self.stdout.write(self.style.SUCCESS(f"Warm-up completed in {total:.3f}s."))
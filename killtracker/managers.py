@@ -12,6 +12,7 @@ from eveuniverse.models import EveEntity
 from . import __title__
 from .app_settings import KILLTRACKER_PURGE_KILLMAILS_AFTER_DAYS
 from .core.killmails import Killmail, _KillmailCharacter
+from .core.metrics import tracker_label, webhook_label
 from .utils import LoggerAddTag, ObjectCacheMixin
 
 logger = LoggerAddTag(get_extension_logger(__name__), __title__)
@@ -131,8 +132,12 @@ class EveKillmailManager(models.Manager):
 
 
 class TrackerManager(ObjectCacheMixin, models.Manager):
-    pass
+    def label_names(self) -> Dict[str, str]:
+        """returns map of stats labels to tracker names"""
+        return {tracker_label(pk): name for pk, name in self.values_list("pk", "name")}
 
 
 class WebhookManager(ObjectCacheMixin, models.Manager):
-    pass
+    def label_names(self) -> Dict[str, str]:
+        """returns map of stats labels to webhook names"""
+        return {webhook_label(pk): name for pk, name in self.values_list("pk", "name")}
@@ -0,0 +1,57 @@
+from time import time
+
+from django.core.cache import cache
+from django.db import migrations, models
+
+NORMAL_PRIORITY = 20
+
+
+def move_legacy_queues(apps, schema_editor):
+    """moves messages from the former list based webhook queues
+    into the normal priority lane of the new queues
+
+    Uses the Redis layout of the priority queues at the time of this migration,
+    i.e. sorted sets with members "<sequence>:<message>".
+    """
+    Webhook = apps.get_model("killtracker", "Webhook")
+    conn = cache.get_master_client()
+    for webhook_pk in Webhook.objects.values_list("pk", flat=True):
+        for suffix in ["main", "error"]:
+            name = f"Killtracker_webhook_{webhook_pk}_{suffix}"
+            legacy_key = f"REDIS_SIMPLE_MQ_{name}"
+            messages = [obj.decode("utf8") for obj in conn.lrange(legacy_key, 0, -1)]
+            if messages:
+                sequence_key = f"REDIS_PRIORITY_MQ_{name}_sequence"
+                last_sequence = conn.incrby(sequence_key, len(messages))
+                timestamp = int(time() * 1000)
+                members = dict()
+                for num, message in enumerate(messages):
+                    sequence = last_sequence - len(messages) + num + 1
+                    score = timestamp * 1000 + sequence % 1000
+                    members[f"{sequence}:{message}"] = score
+                lane_key = f"REDIS_PRIORITY_MQ_{name}_{NORMAL_PRIORITY}"
+                conn.zadd(lane_key, members)
+            conn.delete(legacy_key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("killtracker", "0002_fix_webhook_notes_field"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tracker",
+            name="priority",
+            field=models.PositiveSmallIntegerField(
+                choices=[(10, "low"), (20, "normal"), (30, "high")],
+                default=20,
+                help_text=(
+                    "messages with higher priority are sent first when a webhook "
+                    "has a backlog. High value kills are always sent with high priority"
+                ),
+            ),
+        ),
+        migrations.RunPython(move_legacy_queues, migrations.RunPython.noop),
+    ]
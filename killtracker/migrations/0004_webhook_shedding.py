@@ -0,0 +1,38 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("killtracker", "0003_tracker_priority"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="webhook",
+            name="max_queue_size",
+            field=models.PositiveIntegerField(
+                blank=True,
+                default=None,
+                help_text=(
+                    "max number of messages waiting to be sent to this webhook. "
+                    "Uses the default from settings when empty. Set to 0 for no limit"
+                ),
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="webhook",
+            name="shedding_policy",
+            field=models.CharField(
+                choices=[
+                    ("LP", "drop lowest priority"),
+                    ("OL", "drop oldest"),
+                    ("SU", "drop lowest priority and send summary"),
+                ],
+                default="LP",
+                help_text="which messages to drop when the queue is full",
+                max_length=2,
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("killtracker", "0004_webhook_shedding"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tracker",
+            name="digest_window",
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text=(
+                    "when set, matching killmails are not posted individually, "
+                    "but collected and posted as one summary every given number "
+                    "of seconds. Set to 0 to disable"
+                ),
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("killtracker", "0005_tracker_digest_window"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tracker",
+            name="battle_mode",
+            field=models.BooleanField(
+                default=False,
+                help_text=(
+                    "when enabled, posts only the first matching killmail of each "
+                    "battle. A battle is a series of killmails in the same or "
+                    "neighbouring solar systems without a longer pause"
+                ),
+            ),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("killtracker", "0006_tracker_battle_mode"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tracker",
+            name="shard",
+            field=models.PositiveSmallIntegerField(
+                blank=True,
+                default=None,
+                help_text=(
+                    "shard this tracker is evaluated on when sharding is enabled. "
+                    "Assigned automatically when empty"
+                ),
+                null=True,
+            ),
+        ),
+    ]
@@ -5,8 +5,7 @@ from typing import Optional, List
 from urllib.parse import urljoin
 
 import dhooks_lite
-from requests.exceptions import HTTPError
-from simple_mq import SimpleMQ
+import requests
 
 from django.core.cache import cache
 from django.contrib.auth.models import Group
@@ -18,9 +17,8 @@ from django.utils.timezone import now
 from allianceauth.eveonline.evelinks import eveimageserver, zkillboard, dotlan
 from allianceauth.eveonline.models import EveAllianceInfo, EveCorporationInfo
 from allianceauth.services.hooks import get_extension_logger
-from allianceauth.services.modules.discord.models import DiscordUser
 
-from eveuniverse.helpers import meters_to_ly, EveEntityNameResolver
+from eveuniverse.helpers import EveEntityNameResolver
 from eveuniverse.models import (
     EveConstellation,
     EveRegion,
@@ -32,10 +30,37 @@ from eveuniverse.models import (
 
 from . import __title__, APP_NAME, HOMEPAGE_URL, __version__
 from .app_settings import (
+    KILLTRACKER_EMBED_BASE_CACHE_TIMEOUT,
+    KILLTRACKER_HIGH_PRIORITY_MIN_VALUE,
     KILLTRACKER_KILLMAIL_MAX_AGE_FOR_TRACKER,
+    KILLTRACKER_WEBHOOK_LOW_PRIORITY_MAX_AGE,
+    KILLTRACKER_WEBHOOK_MAX_QUEUE_SIZE,
     KILLTRACKER_WEBHOOK_SET_AVATAR,
 )
-from .core.killmails import EntityCount, Killmail, TrackerInfo, ZKB_KILLMAIL_BASEURL
+from .core import battles, digests
+from .core.circuit_breaker import Service, breaker
+from .core.digests import Digest
+from .core.discord_roles import group_role_id
+from .core.killmails import (
+    EntityCount,
+    Killmail,
+    KillmailEmbedBase,
+    TrackerInfo,
+    ZKB_KILLMAIL_BASEURL,
+)
+from .core.matching import KillmailMatcher, compile_clauses
+from .core.metrics import (
+    Counter,
+    Stage,
+    increment_counter,
+    measure_stage,
+    record_stage,
+    tracker_label,
+    webhook_label,
+)
+from .core.names import resolve_names, solar_system_region_name
+from .core.profiling import Operation, profiled
+from .core.queues import PriorityMQ
 from .exceptions import WebhookTooManyRequests
 from .managers import EveKillmailManager, TrackerManager, WebhookManager
 from .utils import (
@@ -210,10 +235,21 @@ class Webhook(models.Model):
     """A webhook to receive messages"""
 
     HTTP_TOO_MANY_REQUESTS = 429
+    REQUESTS_TIMEOUT = (5, 30)
 
     class WebhookType(models.IntegerChoices):
         DISCORD = 1, _("Discord Webhook")
 
+    class MessagePriority(models.IntegerChoices):
+        LOW = 10, _("low")
+        NORMAL = 20, _("normal")
+        HIGH = 30, _("high")
+
+    class SheddingPolicy(models.TextChoices):
+        DROP_LOW_PRIORITY = "LP", _("drop lowest priority")
+        DROP_OLDEST = "OL", _("drop oldest")
+        SUMMARIZE = "SU", _("drop lowest priority and send summary")
+
     name = models.CharField(
         max_length=64, unique=True, help_text="short name to identify this webhook"
     )
@@ -239,6 +275,21 @@ class Webhook(models.Model):
         db_index=True,
         help_text="whether notifications are currently sent to this webhook",
     )
+    max_queue_size = models.PositiveIntegerField(
+        default=None,
+        null=True,
+        blank=True,
+        help_text=(
+            "max number of messages waiting to be sent to this webhook. "
+            "Uses the default from settings when empty. Set to 0 for no limit"
+        ),
+    )
+    shedding_policy = models.CharField(
+        max_length=2,
+        choices=SheddingPolicy.choices,
+        default=SheddingPolicy.DROP_LOW_PRIORITY,
+        help_text="which messages to drop when the queue is full",
+    )
     objects = WebhookManager()
 
     def __init__(self, *args, **kwargs) -> None:
@@ -279,10 +330,13 @@ class Webhook(models.Model):
             self.main_queue = self._create_queue("main")
             self.error_queue = self._create_queue("error")
 
-    def _create_queue(self, suffix: str) -> Optional[SimpleMQ]:
+    def _create_queue(self, suffix: str) -> Optional[PriorityMQ]:
         return (
-            SimpleMQ(
-                cache.get_master_client(), f"{__title__}_webhook_{self.pk}_{suffix}"
+            PriorityMQ(
+                conn=cache.get_master_client(),
+                name=f"{__title__}_webhook_{self.pk}_{suffix}",
+                priorities=self.MessagePriority.values,
+                default_priority=self.MessagePriority.NORMAL,
             )
             if self.pk
             else None
@@ -292,16 +346,89 @@ class Webhook(models.Model):
         """moves all messages from error queue into main queue.
         returns number of moved messages.
         """
-        counter = 0
-        while True:
-            message = self.error_queue.dequeue()
-            if message is None:
-                break
-            else:
-                self.main_queue.enqueue(message)
-                counter += 1
+        moved = self.error_queue.move_all_to(self.main_queue)
+        self._shed_messages()
+        return moved
 
-        return counter
+    @property
+    def queue_size_limit(self) -> int:
+        """max number of messages in the main queue or 0 if not limited"""
+        return (
+            self.max_queue_size
+            if self.max_queue_size is not None
+            else KILLTRACKER_WEBHOOK_MAX_QUEUE_SIZE
+        )
+
+    def _shed_messages(self) -> int:
+        """drops messages from the main queue according to the shedding policy
+        when it has more messages then allowed.
+        returns number of dropped messages.
+        """
+        if not self.queue_size_limit:
+            return 0
+        shed_count = self.main_queue.trim(
+            max_size=self.queue_size_limit,
+            oldest_first=self.shedding_policy == self.SheddingPolicy.DROP_OLDEST,
+        )
+        if shed_count:
+            logger.warning("%s: Queue is full. Dropped %d messages", self, shed_count)
+            increment_counter(
+                Counter.MESSAGES_SHED, webhook_label(self.pk), amount=shed_count
+            )
+            pipe = cache.get_master_client().pipeline()
+            pipe.incrby(self._shed_count_key(), shed_count)
+            if self.shedding_policy == self.SheddingPolicy.SUMMARIZE:
+                pipe.incrby(self._shed_summary_key(), shed_count)
+            pipe.execute()
+        return shed_count
+
+    def messages_shed(self) -> int:
+        """returns number of messages dropped because the queue was full"""
+        return int(cache.get_master_client().get(self._shed_count_key()) or 0)
+
+    def reset_messages_shed(self) -> None:
+        cache.get_master_client().delete(
+            self._shed_count_key(), self._shed_summary_key()
+        )
+
+    def enqueue_shed_summary(self) -> int:
+        """enqueues a summary of the messages dropped since the last summary.
+        returns number of dropped messages in the summary.
+        """
+        shed_count = int(
+            cache.get_master_client().getset(self._shed_summary_key(), 0) or 0
+        )
+        if shed_count:
+            self.main_queue.enqueue(
+                self._discord_message_asjson(
+                    content=(
+                        f"{shed_count:,} killmail messages were dropped, "
+                        "because too many messages were waiting "
+                        "to be sent to this channel."
+                    ),
+                    username=__title__ if KILLTRACKER_WEBHOOK_SET_AVATAR else None,
+                ),
+                priority=self.MessagePriority.HIGH,
+            )
+        return shed_count
+
+    def _shed_count_key(self) -> str:
+        return f"{__title__}_webhook_{self.pk}_shed_count"
+
+    def _shed_summary_key(self) -> str:
+        return f"{__title__}_webhook_{self.pk}_shed_summary"
+
+    def drop_stale_messages(self) -> int:
+        """drops low priority messages from the main queue,
+        which have been waiting longer then the configured max age.
+        returns number of dropped messages.
+        """
+        if not KILLTRACKER_WEBHOOK_LOW_PRIORITY_MAX_AGE:
+            return 0
+        return self.main_queue.drop_stale(
+            priority=self.MessagePriority.LOW,
+            max_age=KILLTRACKER_WEBHOOK_LOW_PRIORITY_MAX_AGE * 60,
+        )
 
     def enqueue_message(
         self,
@@ -310,23 +437,37 @@ class Webhook(models.Model):
         tts: bool = None,
         username: str = None,
         avatar_url: str = None,
+        priority: int = None,
+        meta: dict = None,
     ) -> int:
-        """Enqueues a message to be send with this webhook"""
+        """Enqueues a message to be send with this webhook
+
+        Messages with higher priority are sent first.
+        Uses normal priority if no priority is given.
+        Meta data is not sent, but used to process the response.
+        """
         username = __title__ if KILLTRACKER_WEBHOOK_SET_AVATAR else username
         brand_url = urljoin(
             get_site_base_url(),
             staticfiles_storage.url("killtracker/killtracker_logo.png"),
         )
         avatar_url = brand_url if KILLTRACKER_WEBHOOK_SET_AVATAR else avatar_url
-        return self.main_queue.enqueue(
-            self._discord_message_asjson(
-                content=content,
-                embeds=embeds,
-                tts=tts,
-                username=username,
-                avatar_url=avatar_url,
+        increment_counter(Counter.MESSAGES_ENQUEUED, webhook_label(self.pk))
+        with measure_stage(Stage.ENQUEUE, webhook_label(self.pk)):
+            size = self.main_queue.enqueue(
+                self._discord_message_asjson(
+                    content=content,
+                    embeds=embeds,
+                    tts=tts,
+                    username=username,
+                    avatar_url=avatar_url,
+                    meta=meta,
+                ),
+                priority=priority,
             )
-        )
+            if self.queue_size_limit and size > self.queue_size_limit:
+                size -= self._shed_messages()
+        return size
 
     @staticmethod
     def _discord_message_asjson(
@@ -335,6 +476,7 @@ class Webhook(models.Model):
         tts: bool = None,
         username: str = None,
         avatar_url: str = None,
+        meta: dict = None,
     ) -> str:
         """Converts a Discord message to JSON and returns it
 
@@ -359,6 +501,8 @@ class Webhook(models.Model):
             message["username"] = username
         if avatar_url:
             message["avatar_url"] = avatar_url
+        if meta:
+            message["meta"] = meta
 
         return json.dumps(message, cls=JSONDateTimeEncoder)
 
@@ -386,18 +530,83 @@ class Webhook(models.Model):
                 name=APP_NAME, url=HOMEPAGE_URL, version=__version__
             ),
         )
-        response = hook.execute(
-            content=message.get("content"),
-            embeds=embeds,
-            username=message.get("username"),
-            avatar_url=message.get("avatar_url"),
-            wait_for_response=True,
-            max_retries=0,  # we will handle retries ourselves
-        )
+        with measure_stage(Stage.SEND, webhook_label(self.pk)), breaker(
+            Service.DISCORD
+        ).guard() as call:
+            response = hook.execute(
+                content=message.get("content"),
+                embeds=embeds,
+                username=message.get("username"),
+                avatar_url=message.get("avatar_url"),
+                wait_for_response=True,
+                max_retries=0,  # we will handle retries ourselves
+            )
+            call.check_status(response.status_code)
         logger.debug("headers: %s", response.headers)
         logger.debug("status_code: %s", response.status_code)
         logger.debug("content: %s", response.content)
+        self._handle_too_many_requests(response)
+        if response.status_ok and embeds and embeds[0].timestamp:
+            record_stage(
+                Stage.END_TO_END,
+                (now() - embeds[0].timestamp).total_seconds(),
+                webhook_label(self.pk),
+            )
+
+        meta = message.get("meta")
+        if response.status_ok and meta and meta.get("battle_id") and response.content:
+            battles.set_message_id(
+                battle_id=meta["battle_id"],
+                tracker_pk=meta["tracker_pk"],
+                message_id=int(response.content["id"]),
+            )
+
+        return response
+
+    def edit_message(
+        self, message_id: int, content: str = None
+    ) -> dhooks_lite.WebhookResponse:
+        """Edit the content of a message previously sent with this webhook"""
+        timeout = cache.ttl(self._blocked_cache_key())
+        if timeout:
+            raise WebhookTooManyRequests(timeout)
+
+        user_agent = dhooks_lite.UserAgent(
+            name=APP_NAME, url=HOMEPAGE_URL, version=__version__
+        )
+        with measure_stage(Stage.SEND, webhook_label(self.pk)), breaker(
+            Service.DISCORD
+        ).guard() as call:
+            r = requests.patch(
+                url=f"{self.url}/messages/{message_id}",
+                headers={
+                    "Content-Type": "application/json",
+                    "User-Agent": str(user_agent),
+                },
+                data=json.dumps({"content": content}, cls=JSONDateTimeEncoder),
+                timeout=self.REQUESTS_TIMEOUT,
+            )
+            call.check_status(r.status_code)
+        try:
+            response_content = r.json()
+        except ValueError:
+            response_content = None
+        response = dhooks_lite.WebhookResponse(
+            headers=r.headers,
+            status_code=r.status_code,
+            content=response_content if isinstance(response_content, dict) else None,
+        )
+        logger.debug("status_code: %s", response.status_code)
+        logger.debug("content: %s", response.content)
+        self._handle_too_many_requests(response)
+        return response
+
+    def _handle_too_many_requests(self, response: dhooks_lite.WebhookResponse) -> None:
+        """blocks this webhook and raises exception
+        if response is a too many requests error
+        """
         if response.status_code == self.HTTP_TOO_MANY_REQUESTS:
+            increment_counter(Counter.WEBHOOK_RATE_LIMITED, webhook_label(self.pk))
             logger.error(
                 "%s: Received too many requests error from API: %s",
                 self,
@@ -405,15 +614,13 @@ class Webhook(models.Model):
             )
             try:
                 retry_after = int(response.content.get("retry_after")) + 2
-            except (ValueError, TypeError):
+            except (ValueError, TypeError, AttributeError):
                 retry_after = WebhookTooManyRequests.DEFAULT_RESET_AFTER
             cache.set(
                 key=self._blocked_cache_key(), value="BLOCKED", timeout=retry_after
             )
             raise WebhookTooManyRequests(retry_after)
 
-        return response
-
     def _blocked_cache_key(self) -> str:
         return f"{__title__}_webhook_{self.pk}_blocked"
 
@@ -665,6 +872,39 @@ class Tracker(models.Model):
     is_posting_name = models.BooleanField(
         default=True, help_text="whether posted messages include the tracker's name"
     )
+    priority = models.PositiveSmallIntegerField(
+        choices=Webhook.MessagePriority.choices,
+        default=Webhook.MessagePriority.NORMAL,
+        help_text=(
+            "messages with higher priority are sent first when a webhook "
+            "has a backlog. High value kills are always sent with high priority"
+        ),
+    )
+    battle_mode = models.BooleanField(
+        default=False,
+        help_text=(
+            "when enabled, posts only the first matching killmail of each battle. "
+            "A battle is a series of killmails in the same or neighbouring "
+            "solar systems without a longer pause"
+        ),
+    )
+    shard = models.PositiveSmallIntegerField(
+        default=None,
+        null=True,
+        blank=True,
+        help_text=(
+            "shard this tracker is evaluated on when sharding is enabled. "
+            "Assigned automatically when empty"
+        ),
+    )
+    digest_window = models.PositiveIntegerField(
+        default=0,
+        help_text=(
+            "when set, matching killmails are not posted individually, "
+            "but collected and posted as one summary every given number of seconds. "
+            "Set to 0 to disable"
+        ),
+    )
     is_enabled = models.BooleanField(
         default=True,
         db_index=True,
@@ -673,6 +913,8 @@ class Tracker(models.Model):
 
     objects = TrackerManager()
 
+    _compiled_clauses = None
+
     def __str__(self) -> str:
         return self.name
 
@@ -708,11 +950,27 @@ class Tracker(models.Model):
             or self.require_victim_ship_types.all()
         )
 
+    def compile_clauses(self) -> None:
+        """precompiles the clauses of this tracker for matching many killmails.
+        Later changes to the clauses are not reflected by this instance.
+        """
+        self._compiled_clauses = compile_clauses(self)
+
+    @property
+    def change_stamp(self) -> Optional[int]:
+        """returns a stamp of the state this tracker's clauses were compiled from
+        or None if they have not been compiled
+        """
+        return self._compiled_clauses.stamp if self._compiled_clauses else None
+
+    @profiled(Operation.PROCESS_KILLMAIL)
     def process_killmail(
         self, killmail: Killmail, ignore_max_age: bool = False
     ) -> Optional[Killmail]:
         """runs tracker on given killmail
 
+        Clauses are evaluated in order of their cost and learned rejection rate.
+
         returns new killmail amended with tracker info if killmail matches
         else returns None
         """
@@ -722,200 +980,23 @@ class Tracker(models.Model):
         if not ignore_max_age and killmail.time < threshold_date:
             return False
 
-        # pre-calculate shared information
-        solar_system = None
-        distance = None
-        jumps = None
-        is_high_sec = None
-        is_low_sec = None
-        is_null_sec = None
-        is_w_space = None
-        matching_ship_type_ids = None
-        if killmail.solar_system_id and (
-            self.origin_solar_system or self.has_localization_clause
-        ):
-            solar_system, _ = EveSolarSystem.objects.get_or_create_esi(
-                id=killmail.solar_system_id
-            )
-            is_high_sec = solar_system.is_high_sec
-            is_low_sec = solar_system.is_low_sec
-            is_null_sec = solar_system.is_null_sec
-            is_w_space = solar_system.is_w_space
-            if self.origin_solar_system:
-                distance = meters_to_ly(
-                    self.origin_solar_system.distance_to(solar_system)
-                )
-                jumps = self.origin_solar_system.jumps_to(solar_system)
-
-        # Make sure all ship types are in the local database
-        if self.has_type_clause:
-            EveType.objects.bulk_get_or_create_esi(ids=killmail.ship_type_ids())
-
-        # apply filters
-        is_matching = True
-        try:
-            if is_matching and self.exclude_high_sec:
-                is_matching = not is_high_sec
-
-            if is_matching and self.exclude_low_sec:
-                is_matching = not is_low_sec
-
-            if is_matching and self.exclude_null_sec:
-                is_matching = not is_null_sec
-
-            if is_matching and self.exclude_w_space:
-                is_matching = not is_w_space
-
-            if is_matching and self.require_min_attackers:
-                is_matching = len(killmail.attackers) >= self.require_min_attackers
-
-            if is_matching and self.require_max_attackers:
-                is_matching = len(killmail.attackers) <= self.require_max_attackers
-
-            if is_matching and self.exclude_npc_kills:
-                is_matching = not killmail.zkb.is_npc
-
-            if is_matching and self.require_npc_kills:
-                is_matching = killmail.zkb.is_npc
-
-            if is_matching and self.require_min_value:
-                is_matching = (
-                    killmail.zkb.total_value >= self.require_min_value * 1000000
-                )
-
-            if is_matching and self.require_max_distance:
-                is_matching = distance is not None and (
-                    distance <= self.require_max_distance
-                )
-
-            if is_matching and self.require_max_jumps:
-                is_matching = jumps is not None and (jumps <= self.require_max_jumps)
-
-            if is_matching and self.require_regions.exists():
-                is_matching = (
-                    solar_system
-                    and self.require_regions.filter(
-                        id=solar_system.eve_constellation.eve_region_id
-                    ).exists()
-                )
-
-            if is_matching and self.require_constellations.exists():
-                is_matching = (
-                    solar_system
-                    and self.require_constellations.filter(
-                        id=solar_system.eve_constellation_id
-                    ).exists()
-                )
-
-            if is_matching and self.require_solar_systems.exists():
-                is_matching = (
-                    solar_system
-                    and self.require_solar_systems.filter(id=solar_system.id).exists()
-                )
-
-            if is_matching and self.exclude_attacker_alliances.exists():
-                is_matching = self.exclude_attacker_alliances.exclude(
-                    alliance_id__in=killmail.attackers_alliance_ids()
-                ).exists()
-
-            if is_matching and self.require_attacker_alliances.exists():
-                is_matching = self.require_attacker_alliances.filter(
-                    alliance_id__in=killmail.attackers_alliance_ids()
-                ).exists()
-
-            if is_matching and self.exclude_attacker_corporations.exists():
-                is_matching = self.exclude_attacker_corporations.exclude(
-                    corporation_id__in=killmail.attackers_corporation_ids()
-                ).exists()
-
-            if is_matching and self.require_attacker_corporations.exists():
-                is_matching = self.require_attacker_corporations.filter(
-                    corporation_id__in=killmail.attackers_corporation_ids()
-                ).exists()
-
-            if is_matching and self.require_victim_alliances.exists():
-                is_matching = self.require_victim_alliances.filter(
-                    alliance_id=killmail.victim.alliance_id
-                ).exists()
-
-            if is_matching and self.require_victim_corporations.exists():
-                is_matching = self.require_victim_corporations.filter(
-                    corporation_id=killmail.victim.corporation_id
-                ).exists()
-
-            if is_matching and self.require_victim_ship_groups.exists():
-                ship_types_matching_qs = EveType.objects.filter(
-                    eve_group_id__in=list(
-                        self.require_victim_ship_groups.values_list("id", flat=True)
-                    ),
-                    id=killmail.victim.ship_type_id,
-                )
-                is_matching = ship_types_matching_qs.exists()
-                if is_matching:
-                    matching_ship_type_ids = list(
-                        ship_types_matching_qs.values_list("id", flat=True)
-                    )
-
-            if is_matching and self.require_victim_ship_types.exists():
-                ship_types_matching_qs = EveType.objects.filter(
-                    id__in=list(
-                        self.require_victim_ship_types.values_list("id", flat=True)
-                    ),
-                    id=killmail.victim.ship_type_id,
-                )
-                is_matching = ship_types_matching_qs.exists()
-                if is_matching:
-                    matching_ship_type_ids = list(
-                        ship_types_matching_qs.values_list("id", flat=True)
-                    )
-
-            if is_matching and self.require_attackers_ship_groups.exists():
-                attackers_ship_type_ids = killmail.attackers_ship_type_ids()
-                ship_types_matching_qs = EveType.objects.filter(
-                    id__in=attackers_ship_type_ids
-                ).filter(
-                    eve_group_id__in=list(
-                        self.require_attackers_ship_groups.values_list("id", flat=True)
-                    )
-                )
-                is_matching = ship_types_matching_qs.exists()
-                if is_matching:
-                    matching_ship_type_ids = list(
-                        ship_types_matching_qs.values_list("id", flat=True)
-                    )
-
-            if is_matching and self.require_attackers_ship_types.exists():
-                attackers_ship_type_ids = killmail.attackers_ship_type_ids()
-                ship_types_matching_qs = EveType.objects.filter(
-                    id__in=attackers_ship_type_ids
-                ).filter(
-                    id__in=list(
-                        self.require_attackers_ship_types.values_list("id", flat=True)
-                    )
-                )
-                is_matching = ship_types_matching_qs.exists()
-                if is_matching:
-                    matching_ship_type_ids = list(
-                        ship_types_matching_qs.values_list("id", flat=True)
-                    )
-
-        except AttributeError:
-            is_matching = False
-
-        if is_matching:
-            killmail_new = deepcopy(killmail)
-            killmail_new.tracker_info = TrackerInfo(
-                tracker_pk=self.pk,
-                jumps=jumps,
-                distance=distance,
-                main_org=self._killmail_main_attacker_org(killmail),
-                main_ship_group=self._killmail_main_attacker_ship_group(killmail),
-                matching_ship_type_ids=matching_ship_type_ids,
-            )
-            return killmail_new
-        else:
+        matcher = KillmailMatcher(
+            tracker=self, killmail=killmail, compiled=self._compiled_clauses
+        )
+        if not matcher.is_matching():
             return None
 
+        killmail_new = deepcopy(killmail)
+        killmail_new.tracker_info = TrackerInfo(
+            tracker_pk=self.pk,
+            jumps=matcher.jumps,
+            distance=matcher.distance,
+            main_org=self._killmail_main_attacker_org(killmail),
+            main_ship_group=self._killmail_main_attacker_ship_group(killmail),
+            matching_ship_type_ids=matcher.matching_ship_type_ids,
+        )
+        return killmail_new
+
     @classmethod
     def _killmail_main_attacker_org(cls, killmail) -> Optional[EntityCount]:
         """returns the main attacker group with count"""
@@ -1009,96 +1090,137 @@ class Tracker(models.Model):
 
         returns new queue size
         """
-        embed = self._create_embed(killmail)
-        content = self._create_content(intro_text)
-        return self.webhook.enqueue_message(content=content, embeds=[embed])
+        meta = None
+        if self.battle_mode and killmail.battle_info:
+            intro_text = intro_text if intro_text else "New battle detected"
+            meta = {
+                "battle_id": killmail.battle_info.battle_id,
+                "tracker_pk": self.pk,
+            }
+        with measure_stage(Stage.RENDER, tracker_label(self.pk)):
+            embed = self._create_embed(killmail)
+            content = self._create_content(intro_text)
+        return self.webhook.enqueue_message(
+            content=content,
+            embeds=[embed],
+            priority=self._message_priority(killmail),
+            meta=meta,
+        )
 
-    def _create_embed(self, killmail: Killmail) -> dhooks_lite.Embed:
-        resolver = EveEntity.objects.bulk_resolve_names(ids=killmail.entity_ids())
+    def update_battle_message(self, battle_id: int) -> bool:
+        """updates the message posted for a battle with its current state
 
-        # victim
-        if killmail.victim.alliance_id:
-            victim_organization = EveEntity.objects.get(id=killmail.victim.alliance_id)
-            victim_org_url = zkillboard.alliance_url(killmail.victim.alliance_id)
-        elif killmail.victim.corporation_id:
-            victim_organization = EveEntity.objects.get(
-                id=killmail.victim.corporation_id
-            )
-            victim_org_url = zkillboard.corporation_url(killmail.victim.corporation_id)
-        else:
-            victim_organization = None
-            victim_org_url = None
+        returns True if the message was updated
+        """
+        message_id = battles.message_id(battle_id=battle_id, tracker_pk=self.pk)
+        battle = battles.battle(battle_id)
+        if not message_id or not battle:
+            return False
 
-        if killmail.victim.corporation_id:
-            victim_corporation_zkb_link = self._corporation_zkb_link(
-                killmail.victim.corporation_id, resolver
+        resolver = resolve_names(obj for obj, _ in battle.solar_systems)
+        solar_systems_text = ", ".join(
+            resolver.to_name(obj) for obj, _ in battle.solar_systems
+        )
+        intro_text = (
+            f"Ongoing battle: **{battle.killmail_count:,}** kills worth "
+            f"**{humanize_value(battle.total_value)}** ISK in {solar_systems_text}. "
+            f"Last kill at {battle.last_kill:%H:%M} EVE time"
+        )
+        response = self.webhook.edit_message(
+            message_id=message_id, content=self._create_content(intro_text)
+        )
+        if not response.status_ok:
+            logger.warning(
+                "%s: Failed to update message for battle %d. "
+                "HTTP status code: %d, response: %s",
+                self,
+                battle_id,
+                response.status_code,
+                response.content,
             )
-        else:
-            victim_corporation_zkb_link = ""
+        return response.status_ok
 
-        if killmail.victim.character_id:
-            victim_character_zkb_link = self._character_zkb_link(
-                killmail.victim.character_id,
-                resolver,
-            )
-            victim_str = f"{victim_character_zkb_link} ({victim_corporation_zkb_link}) "
-        elif killmail.victim.corporation_id:
-            victim_str = victim_corporation_zkb_link
-        else:
-            victim_str = ""
+    def is_battle_alert_due(self, killmail: Killmail) -> bool:
+        """returns True if a matching killmail needs to be posted in battle mode,
+        i.e. it is the first killmail of a battle matched by this tracker
+        """
+        if not self.battle_mode or not killmail.battle_info:
+            return True
+        return battles.claim_alert(killmail.battle_info.battle_id, self.pk)
 
-        # final attacker
-        for attacker in killmail.attackers:
-            if attacker.is_final_blow:
-                final_attacker = attacker
-                break
-        else:
-            final_attacker = None
+    def add_to_digest(self, killmail: Killmail) -> bool:
+        """adds a matching killmail to the digest of this tracker
 
-        if final_attacker:
-            if final_attacker.corporation_id:
-                final_attacker_corporation_zkb_link = self._corporation_zkb_link(
-                    final_attacker.corporation_id, resolver
-                )
-            else:
-                final_attacker_corporation_zkb_link = ""
+        returns True if the killmail started a new digest
+        """
+        return digests.add_killmail(self.pk, killmail, window=self.digest_window)
 
-            if final_attacker.character_id and final_attacker.corporation_id:
-                final_attacker_character_zkb_link = self._character_zkb_link(
-                    final_attacker.character_id, resolver
-                )
-                final_attacker_str = (
-                    f"{final_attacker_character_zkb_link} "
-                    f"({final_attacker_corporation_zkb_link})"
-                )
-            elif final_attacker.corporation_id:
-                final_attacker_str = f"{final_attacker_corporation_zkb_link}"
-            elif final_attacker.faction_id:
-                final_attacker_str = (
-                    f"**{resolver.to_name(final_attacker.faction_id)}**"
-                )
-            else:
-                final_attacker_str = "(Unknown final_attacker)"
+    def generate_digest_message(self, digest: Digest) -> int:
+        """generate a summary message from given digest and enqueue for later sending
 
-            final_attacker_ship_type_name = resolver.to_name(
-                final_attacker.ship_type_id
+        returns new queue size
+        """
+        with measure_stage(Stage.RENDER, tracker_label(self.pk)):
+            embed = self._create_digest_embed(digest)
+            content = self._create_content(None)
+        return self.webhook.enqueue_message(
+            content=content, embeds=[embed], priority=self.priority
+        )
+
+    def _create_digest_embed(self, digest: Digest) -> dhooks_lite.Embed:
+        resolver = resolve_names(digest.entity_ids())
+        minutes = max(1, round((now() - digest.started).total_seconds() / 60))
+        description = (
+            f"**{digest.count:,}** killmails matched within the last "
+            f"{minutes} minutes with a total value of "
+            f"**{humanize_value(digest.total_value)}** ISK."
+        )
+        if digest.most_valuable_killmail:
+            killmail_id, value = digest.most_valuable_killmail
+            link = self.webhook.create_message_link(
+                name=f"{humanize_value(value)} ISK",
+                url=f"{ZKB_KILLMAIL_BASEURL}{killmail_id}/",
             )
+            description += f"\nMost valuable kill: {link}"
+
+        fields = list()
+        for name, top_list in [
+            ("Top ships lost", digest.top_ship_types),
+            ("Top attacker groups", digest.top_attacker_orgs),
+            ("Top systems", digest.top_solar_systems),
+        ]:
+            if top_list:
+                value = "\n".join(
+                    f"{resolver.to_name(entity_id)} ({count:,})"
+                    for entity_id, count in top_list
+                )
+                fields.append(dhooks_lite.Field(name=name, value=value))
 
-        else:
-            final_attacker_str = ""
-            final_attacker_ship_type_name = ""
+        return dhooks_lite.Embed(
+            title=f"Digest: {digest.count:,} kills",
+            description=description,
+            fields=fields,
+            timestamp=now(),
+            color=int(self.color[1:], 16) if self.color else None,
+        )
 
-        if killmail.solar_system_id:
-            solar_system, _ = EveSolarSystem.objects.get_or_create_esi(
-                id=killmail.solar_system_id
-            )
-            solar_system_link = self.webhook.create_message_link(
-                name=solar_system.name, url=dotlan.solar_system_url(solar_system.name)
-            )
-            region_name = solar_system.eve_constellation.eve_region.name
-            solar_system_text = f"{solar_system_link} ({region_name})"
-        else:
-            solar_system_text = ""
+    def _message_priority(self, killmail: Killmail) -> int:
+        """returns priority for the message of a killmail"""
+        if (
+            KILLTRACKER_HIGH_PRIORITY_MIN_VALUE
+            and killmail.zkb.total_value
+            and killmail.zkb.total_value >= KILLTRACKER_HIGH_PRIORITY_MIN_VALUE * 1e6
+        ):
+            return Webhook.MessagePriority.HIGH
+        return self.priority
+
+    @profiled(Operation.CREATE_EMBED)
+    def _create_embed(self, killmail: Killmail) -> dhooks_lite.Embed:
+        """creates an embed for a killmail from its cached base
+        with an overlay for this tracker
+        """
+        base = self._killmail_embed_base(killmail)
+        resolver = EveEntityNameResolver(base.names)
 
         # self info
         show_as_fleetkill = False
@@ -1172,59 +1294,172 @@ class Tracker(models.Model):
                     f"\nTracked ship types involved: **{ship_types_text}**"
                 )
 
-        victim_ship_type_name = resolver.to_name(killmail.victim.ship_type_id)
-
         description = (
-            f"{victim_str} lost their **{victim_ship_type_name}** "
-            f"in {solar_system_text} "
-            f"worth **{humanize_value(killmail.zkb.total_value)}** ISK.\n"
-            f"Final blow by {final_attacker_str} "
-            f"in a **{final_attacker_ship_type_name}**.\n"
-            f"Attackers: **{len(killmail.attackers):,}**{main_org_text}"
+            f"{base.description}{main_org_text}"
             f"{main_ship_group_text}"
             f"{tracked_ship_types_text}"
             f"{distance_text}"
         )
-
-        solar_system_name = resolver.to_name(killmail.solar_system_id)
-        if show_as_fleetkill:
-            title = f"{solar_system_name} | {main_org_name} | Fleetkill"
-        else:
-            title = f"{solar_system_name} | {victim_ship_type_name} | Killmail"
-
         if show_as_fleetkill:
+            title = f"{base.solar_system_name} | {main_org_name} | Fleetkill"
             thumbnail_url = main_org_icon_url
         else:
-            thumbnail_url = eveimageserver.type_icon_url(
-                killmail.victim.ship_type_id, size=self.ICON_SIZE
-            )
+            title = base.title
+            thumbnail_url = base.thumbnail_url
 
-        zkb_killmail_url = f"{ZKB_KILLMAIL_BASEURL}{killmail.id}/"
         # TODO This is a workaround for Embed.Author.name. Address in dhooks_lite
         author = (
             dhooks_lite.Author(
-                name=victim_organization.name if victim_organization.name else "?",
-                url=victim_org_url,
-                icon_url=victim_organization.icon_url(),
+                name=base.author_name if base.author_name else "?",
+                url=base.author_url,
+                icon_url=base.author_icon_url,
             )
-            if victim_organization and victim_org_url
+            if base.author_url
             else None
         )
-        zkb_icon_url = urljoin(
-            get_site_base_url(), staticfiles_storage.url("killtracker/zkb_icon.png")
-        )
         embed = dhooks_lite.Embed(
             author=author,
             description=description,
             title=title,
-            url=zkb_killmail_url,
+            url=base.url,
             thumbnail=dhooks_lite.Thumbnail(url=thumbnail_url),
-            footer=dhooks_lite.Footer(text="zKillboard", icon_url=zkb_icon_url),
+            footer=dhooks_lite.Footer(text="zKillboard", icon_url=base.footer_icon_url),
             timestamp=killmail.time,
             color=embed_color,
         )
         return embed
 
+    @classmethod
+    def _killmail_embed_base(cls, killmail: Killmail) -> KillmailEmbedBase:
+        """returns the embed base for a killmail, which is shared by all trackers"""
+        key = f"{__title__}_embed_base_{killmail.id}"
+        base = cache.get(key)
+        if not base:
+            base = cls._create_embed_base(killmail)
+            cache.set(key, base, timeout=KILLTRACKER_EMBED_BASE_CACHE_TIMEOUT)
+        return base
+
+    @classmethod
+    def _create_embed_base(cls, killmail: Killmail) -> KillmailEmbedBase:
+        resolver = resolve_names(killmail.entity_ids())
+
+        # victim
+        if killmail.victim.alliance_id:
+            victim_org_name = resolver.to_name(killmail.victim.alliance_id)
+            victim_org_icon_url = eveimageserver.alliance_logo_url(
+                killmail.victim.alliance_id, size=EveEntity.DEFAULT_ICON_SIZE
+            )
+            victim_org_url = zkillboard.alliance_url(killmail.victim.alliance_id)
+        elif killmail.victim.corporation_id:
+            victim_org_name = resolver.to_name(killmail.victim.corporation_id)
+            victim_org_icon_url = eveimageserver.corporation_logo_url(
+                killmail.victim.corporation_id, size=EveEntity.DEFAULT_ICON_SIZE
+            )
+            victim_org_url = zkillboard.corporation_url(killmail.victim.corporation_id)
+        else:
+            victim_org_name = None
+            victim_org_icon_url = None
+            victim_org_url = None
+
+        if killmail.victim.corporation_id:
+            victim_corporation_zkb_link = cls._corporation_zkb_link(
+                killmail.victim.corporation_id, resolver
+            )
+        else:
+            victim_corporation_zkb_link = ""
+
+        if killmail.victim.character_id:
+            victim_character_zkb_link = cls._character_zkb_link(
+                killmail.victim.character_id,
+                resolver,
+            )
+            victim_str = f"{victim_character_zkb_link} ({victim_corporation_zkb_link}) "
+        elif killmail.victim.corporation_id:
+            victim_str = victim_corporation_zkb_link
+        else:
+            victim_str = ""
+
+        # final attacker
+        for attacker in killmail.attackers:
+            if attacker.is_final_blow:
+                final_attacker = attacker
+                break
+        else:
+            final_attacker = None
+
+        if final_attacker:
+            if final_attacker.corporation_id:
+                final_attacker_corporation_zkb_link = cls._corporation_zkb_link(
+                    final_attacker.corporation_id, resolver
+                )
+            else:
+                final_attacker_corporation_zkb_link = ""
+
+            if final_attacker.character_id and final_attacker.corporation_id:
+                final_attacker_character_zkb_link = cls._character_zkb_link(
+                    final_attacker.character_id, resolver
+                )
+                final_attacker_str = (
+                    f"{final_attacker_character_zkb_link} "
+                    f"({final_attacker_corporation_zkb_link})"
+                )
+            elif final_attacker.corporation_id:
+                final_attacker_str = f"{final_attacker_corporation_zkb_link}"
+            elif final_attacker.faction_id:
+                final_attacker_str = (
+                    f"**{resolver.to_name(final_attacker.faction_id)}**"
+                )
+            else:
+                final_attacker_str = "(Unknown final_attacker)"
+
+            final_attacker_ship_type_name = resolver.to_name(
+                final_attacker.ship_type_id
+            )
+
+        else:
+            final_attacker_str = ""
+            final_attacker_ship_type_name = ""
+
+        if killmail.solar_system_id:
+            solar_system_name = resolver.to_name(killmail.solar_system_id)
+            solar_system_link = Webhook.create_message_link(
+                name=solar_system_name, url=dotlan.solar_system_url(solar_system_name)
+            )
+            region_name = solar_system_region_name(killmail.solar_system_id)
+            solar_system_text = f"{solar_system_link} ({region_name})"
+        else:
+            solar_system_text = ""
+
+        victim_ship_type_name = resolver.to_name(killmail.victim.ship_type_id)
+        description = (
+            f"{victim_str} lost their **{victim_ship_type_name}** "
+            f"in {solar_system_text} "
+            f"worth **{humanize_value(killmail.zkb.total_value)}** ISK.\n"
+            f"Final blow by {final_attacker_str} "
+            f"in a **{final_attacker_ship_type_name}**.\n"
+            f"Attackers: **{len(killmail.attackers):,}**"
+        )
+        solar_system_name = resolver.to_name(killmail.solar_system_id)
+        return KillmailEmbedBase(
+            description=description,
+            title=f"{solar_system_name} | {victim_ship_type_name} | Killmail",
+            solar_system_name=solar_system_name,
+            thumbnail_url=eveimageserver.type_icon_url(
+                killmail.victim.ship_type_id, size=cls.ICON_SIZE
+            ),
+            url=f"{ZKB_KILLMAIL_BASEURL}{killmail.id}/",
+            footer_icon_url=urljoin(
+                get_site_base_url(), staticfiles_storage.url("killtracker/zkb_icon.png")
+            ),
+            author_name=victim_org_name,
+            author_url=victim_org_url,
+            author_icon_url=victim_org_icon_url,
+            names={
+                entity_id: resolver.to_name(entity_id)
+                for entity_id in killmail.entity_ids()
+            },
+        )
+
     def _create_content(self, intro_text) -> str:
         intro_parts = []
 
@@ -1236,16 +1471,9 @@ class Tracker(models.Model):
         if self.ping_groups.exists():
             if "discord" in app_labels():
                 for group in self.ping_groups.all():
-                    try:
-                        role = DiscordUser.objects.group_to_role(group)
-                    except HTTPError:
-                        logger.warning(
-                            "Failed to get Discord roles. Can not ping groups.",
-                            exc_info=True,
-                        )
-                    else:
-                        if role:
-                            intro_parts.append(f"<@&{role['id']}>")
+                    role_id = group_role_id(group)
+                    if role_id:
+                        intro_parts.append(f"<@&{role_id}>")
 
             else:
                 logger.warning(
@@ -1264,23 +1492,24 @@ class Tracker(models.Model):
 
         return "\n".join(intro_parts_2)
 
+    @classmethod
     def _character_zkb_link(
-        self, entity_id: int, resolver: EveEntityNameResolver
+        cls, entity_id: int, resolver: EveEntityNameResolver
     ) -> str:
-        return self.webhook.create_message_link(
+        return Webhook.create_message_link(
             name=resolver.to_name(entity_id), url=zkillboard.character_url(entity_id)
         )
 
+    @classmethod
     def _corporation_zkb_link(
-        self, entity_id: int, resolver: EveEntityNameResolver
+        cls, entity_id: int, resolver: EveEntityNameResolver
     ) -> str:
-        return self.webhook.create_message_link(
+        return Webhook.create_message_link(
             name=resolver.to_name(entity_id), url=zkillboard.corporation_url(entity_id)
         )
 
-    def _alliance_zkb_link(
-        self, entity_id: int, resolver: EveEntityNameResolver
-    ) -> str:
-        return self.webhook.create_message_link(
+    @classmethod
+    def _alliance_zkb_link(cls, entity_id: int, resolver: EveEntityNameResolver) -> str:
+        return Webhook.create_message_link(
             name=resolver.to_name(entity_id), url=zkillboard.alliance_url(entity_id)
         )
@@ -0,0 +1,82 @@
+from time import perf_counter
+
+from celery.signals import (
+    task_postrun,
+    task_prerun,
+    worker_process_init,
+    worker_ready,
+)
+
+from django.contrib.auth.models import Group
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_save
+from django.dispatch import receiver
+
+from allianceauth.services.hooks import get_extension_logger
+
+from . import __title__
+from .app_settings import KILLTRACKER_WARMUP_ON_WORKER_READY
+from .core.metrics import flush_counters, record_task_duration
+from .models import Tracker
+from .utils import LoggerAddTag
+
+logger = LoggerAddTag(get_extension_logger(__name__), __title__)
+
+_task_started = dict()
+
+
+@task_prerun.connect
+def task_prerun_handler(task_id, task, **kwargs):
+    if task.name.startswith(f"{__package__}."):
+        _task_started[task_id] = perf_counter()
+
+
+@task_postrun.connect
+def task_postrun_handler(task_id, task, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        record_task_duration(task.name, perf_counter() - started)
+        flush_counters()
+
+
+@worker_ready.connect
+def worker_ready_handler(**kwargs):
+    if KILLTRACKER_WARMUP_ON_WORKER_READY:
+        from .core.warmup import warmup_shared
+
+        try:
+            warmup_shared()
+        except Exception:
+            logger.warning("Warm-up of shared caches failed", exc_info=True)
+
+
+@worker_process_init.connect
+def worker_process_init_handler(**kwargs):
+    if KILLTRACKER_WARMUP_ON_WORKER_READY:
+        from .core.warmup import warmup_process
+
+        try:
+            warmup_process()
+        except Exception:
+            logger.warning("Warm-up of process caches failed", exc_info=True)
+
+
+def _schedule_discord_group_roles_update():
+    from .tasks import update_discord_group_roles
+
+    transaction.on_commit(lambda: update_discord_group_roles.delay())
+
+
+@receiver(m2m_changed, sender=Tracker.ping_groups.through)
+def tracker_ping_groups_changed_handler(action, **kwargs):
+    if action in {"post_add", "post_remove", "post_clear"}:
+        _schedule_discord_group_roles_update()
+
+
+@receiver(post_save, sender=Group)
+def group_saved_handler(instance, created, **kwargs):
+    if (
+        not created
+        and Tracker.ping_groups.through.objects.filter(group_id=instance.pk).exists()
+    ):
+        _schedule_discord_group_roles_update()
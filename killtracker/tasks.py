@@ -1,10 +1,13 @@
+from datetime import timedelta
+from typing import Optional
+
 from celery import shared_task, chain
 
+from django.contrib.auth.models import Group
 from django.db import IntegrityError
 from django.utils.dateparse import parse_datetime
 from django.utils.timezone import now
 
-from eveuniverse.core.esitools import is_esi_online
 from eveuniverse.tasks import update_unresolved_eve_entities
 
 from allianceauth.services.hooks import get_extension_logger
@@ -17,24 +20,53 @@ from .app_settings import (
     KILLTRACKER_STORING_KILLMAILS_ENABLED,
     KILLTRACKER_PURGE_KILLMAILS_AFTER_DAYS,
     KILLTRACKER_TASKS_TIMEOUT,
+    KILLTRACKER_BATTLE_UPDATE_THROTTLE,
     KILLTRACKER_DISCORD_SEND_DELAY,
+    KILLTRACKER_ESI_FREE_MODE,
+    KILLTRACKER_KILLMAIL_MAX_AGE_FOR_TRACKER,
+    KILLTRACKER_REDISQ_CONCURRENCY,
+    KILLTRACKER_REDISQ_QUEUE_ID,
     KILLTRACKER_GENERATE_MESSAGE_MAX_RETRIES,
     KILLTRACKER_GENERATE_MESSAGE_RETRY_COUNTDOWN,
     KILLTRACKER_TASK_OBJECTS_CACHE_TIMEOUT,
 )
+from .core import battles, static_data
+from .core.circuit_breaker import Service, is_service_available
+from .core.digests import pop_digest
+from .core.discord_roles import refresh_group_roles
+from .core.engine import is_engine_enabled, shard_engine
+from .core.ingest import fetch_killmails
 from .core.killmails import Killmail
-from .exceptions import WebhookTooManyRequests
+from .core.metrics import (
+    Counter,
+    Stage,
+    increment_counter,
+    measure_stage,
+    tracker_label,
+    webhook_label,
+)
+from .core.routing import TaskStage, shard_queue, task_queue
+from .core.shards import shard_count, shard_trackers
+from .core.static_data import (
+    MissingStaticData,
+    missing_static_data,
+    park_killmail,
+    parked_killmails,
+    parked_killmails_count,
+    unpark_killmails,
+)
+from .exceptions import ServiceUnavailable, WebhookTooManyRequests
 from .models import (
     EveKillmail,
     Tracker,
     Webhook,
 )
-from .utils import LoggerAddTag, cached_queryset
+from .utils import LoggerAddTag, app_labels, cached_queryset
 
 logger = LoggerAddTag(get_extension_logger(__name__), __title__)
 
 
-@shared_task(timeout=KILLTRACKER_TASKS_TIMEOUT)
+@shared_task(timeout=KILLTRACKER_TASKS_TIMEOUT, queue=task_queue(TaskStage.INGEST))
 def run_killtracker(
     killmails_max: int = KILLTRACKER_MAX_KILLMAILS_PER_RUN,
     killmails_count: int = 0,
@@ -49,8 +81,12 @@ def run_killtracker(
     - killmails_count: internal parameter
     - started_str: internal parameter
     """
-    if not is_esi_online():
-        logger.warning("ESI is currently offline. Aborting")
+    if not is_service_available(Service.ZKB):
+        logger.warning("ZKB is currently unavailable. Aborting")
+        return
+
+    if not KILLTRACKER_ESI_FREE_MODE and not is_service_available(Service.ESI):
+        logger.warning("ESI is currently unavailable. Aborting")
         return
 
     if killmails_count == 0:
@@ -62,37 +98,36 @@ def run_killtracker(
         )
         for webhook in qs:
             webhook.reset_failed_messages()
+            dropped = webhook.drop_stale_messages()
+            if dropped:
+                logger.warning(
+                    "%s: Dropped %d stale low priority messages", webhook, dropped
+                )
+            webhook.enqueue_shed_summary()
+        if KILLTRACKER_ESI_FREE_MODE and parked_killmails_count():
+            release_parked_killmails.delay()
 
     started = now() if not started_str else parse_datetime(started_str)
     duration = (now() - started).total_seconds()
     if duration > KILLTRACKER_MAX_DURATION_PER_RUN:
         # need to ensure this run finishes before CRON starts the next
         logger.info("Soft timeout reached. Aborting run.")
-        killmail = None
+        killmails = []
+    elif KILLTRACKER_REDISQ_CONCURRENCY > 1:
+        killmails = fetch_killmails(
+            concurrency=KILLTRACKER_REDISQ_CONCURRENCY,
+            queue_id=KILLTRACKER_REDISQ_QUEUE_ID,
+        )
     else:
-        killmail = Killmail.create_from_zkb_redisq()
+        killmail = Killmail.create_from_zkb_redisq(queue_id=KILLTRACKER_REDISQ_QUEUE_ID)
+        killmails = [killmail] if killmail else []
 
-    if killmail:
+    for killmail in killmails:
         killmails_count += 1
-        killmail_json = killmail.asjson()
-        qs = cached_queryset(
-            Tracker.objects.filter(is_enabled=True),
-            key=f"{APP_NAME}_enabled_trackers",
-            timeout=KILLTRACKER_TASK_OBJECTS_CACHE_TIMEOUT,
-        )
-        for tracker in qs:
-            run_tracker.delay(
-                tracker_pk=tracker.pk,
-                killmail_json=killmail_json,
-            )
-
-        if KILLTRACKER_STORING_KILLMAILS_ENABLED:
-            chain(
-                store_killmail.si(killmail_json=killmail_json),
-                update_unresolved_eve_entities.si(),
-            ).delay()
+        increment_counter(Counter.KILLMAILS_RECEIVED)
+        _dispatch_killmail(killmail)
 
-    if killmail and killmails_count < killmails_max:
+    if killmails and killmails_count < killmails_max:
         run_killtracker.delay(
             killmails_max=killmails_max,
             killmails_count=killmails_count,
@@ -113,7 +148,97 @@ def run_killtracker(
     )
 
 
-@shared_task(timeout=KILLTRACKER_TASKS_TIMEOUT)
+@shared_task(timeout=KILLTRACKER_TASKS_TIMEOUT, queue=task_queue(TaskStage.INGEST))
+def dispatch_killmail(killmail_json: str) -> None:
+    """start running trackers for a killmail received from a streaming source"""
+    increment_counter(Counter.KILLMAILS_RECEIVED)
+    _dispatch_killmail(Killmail.from_json(killmail_json))
+
+
+def _dispatch_killmail(killmail: Killmail) -> None:
+    """start running trackers for a new killmail and storing it.
+    In ESI-free mode killmails with missing static data are parked instead.
+    """
+    if KILLTRACKER_ESI_FREE_MODE:
+        missing = missing_static_data(killmail)
+        if missing:
+            logger.info("Parking killmail %d until static data is loaded", killmail.id)
+            park_killmail(killmail)
+            increment_counter(Counter.KILLMAILS_PARKED)
+            load_static_data.delay(
+                solar_system_ids=sorted(missing.solar_system_ids),
+                type_ids=sorted(missing.type_ids),
+            )
+            return
+
+    qs = cached_queryset(
+        Tracker.objects.filter(is_enabled=True),
+        key=f"{APP_NAME}_enabled_trackers",
+        timeout=KILLTRACKER_TASK_OBJECTS_CACHE_TIMEOUT,
+    )
+    if any(tracker.battle_mode for tracker in qs):
+        killmail.battle_info = battles.assign_battle(killmail)
+    killmail_json = killmail.asjson()
+    if shard_count() > 1 or is_engine_enabled():
+        for shard in range(shard_count()):
+            run_tracker_shard.apply_async(
+                kwargs={"shard": shard, "killmail_json": killmail_json},
+                queue=shard_queue(shard),
+            )
+    else:
+        for tracker in qs:
+            run_tracker.delay(
+                tracker_pk=tracker.pk,
+                killmail_json=killmail_json,
+            )
+
+    if KILLTRACKER_STORING_KILLMAILS_ENABLED:
+        chain(
+            store_killmail.si(killmail_json=killmail_json),
+            update_unresolved_eve_entities.si(),
+        ).delay()
+
+
+@shared_task(timeout=KILLTRACKER_TASKS_TIMEOUT, queue=task_queue(TaskStage.MAINTENANCE))
+def load_static_data(solar_system_ids: list, type_ids: list) -> None:
+    """load missing static data from ESI and release parked killmails"""
+    static_data.load_static_data(
+        MissingStaticData(
+            solar_system_ids=set(solar_system_ids), type_ids=set(type_ids)
+        )
+    )
+    release_parked_killmails.delay()
+
+
+@shared_task(
+    base=QueueOnce,
+    once={"graceful": True},
+    timeout=KILLTRACKER_TASKS_TIMEOUT,
+    queue=task_queue(TaskStage.INGEST),
+)
+def release_parked_killmails() -> None:
+    """start running trackers for parked killmails with all static data available
+    and drop parked killmails, which are too old for trackers
+    """
+    threshold = now() - timedelta(minutes=KILLTRACKER_KILLMAIL_MAX_AGE_FOR_TRACKER)
+    released_ids = []
+    dropped_ids = []
+    for killmail in parked_killmails():
+        if killmail.time < threshold:
+            dropped_ids.append(killmail.id)
+        elif not missing_static_data(killmail):
+            _dispatch_killmail(killmail)
+            released_ids.append(killmail.id)
+    unpark_killmails(released_ids + dropped_ids)
+    if released_ids or dropped_ids:
+        logger.info(
+            "Released %d parked killmails and dropped %d",
+            len(released_ids),
+            len(dropped_ids),
+        )
+
+
+@shared_task(timeout=KILLTRACKER_TASKS_TIMEOUT, queue=task_queue(TaskStage.MATCH))
 def run_tracker(
     tracker_pk: int, killmail_json: str, ignore_max_age: bool = False
 ) -> None:
@@ -126,18 +251,71 @@ def run_tracker(
     )
     logger.info("%s: Started running tracker", tracker)
     killmail = Killmail.from_json(killmail_json)
-    killmail_new = tracker.process_killmail(
-        killmail=killmail, ignore_max_age=ignore_max_age
-    )
-    if killmail_new:
-        generate_killmail_message.delay(
-            tracker_pk=tracker_pk, killmail_json=killmail_new.asjson()
+    _run_tracker(tracker=tracker, killmail=killmail, ignore_max_age=ignore_max_age)
+
+
+@shared_task(timeout=KILLTRACKER_TASKS_TIMEOUT, queue=task_queue(TaskStage.MATCH))
+def run_tracker_shard(shard: int, killmail_json: str) -> None:
+    """run all enabled trackers of a shard for given killmail"""
+    trackers = shard_trackers(shard)
+    logger.info("Started running %d trackers of shard %d", len(trackers), shard)
+    killmail = Killmail.from_json(killmail_json)
+    if is_engine_enabled():
+        [results] = shard_engine(shard, trackers).match([killmail])
+        for tracker, killmail_new in zip(trackers, results):
+            _handle_tracker_result(tracker=tracker, killmail_new=killmail_new)
+    else:
+        for tracker in trackers:
+            _run_tracker(tracker=tracker, killmail=killmail)
+
+
+def _run_tracker(
+    tracker: Tracker, killmail: Killmail, ignore_max_age: bool = False
+) -> None:
+    """run a tracker for given killmail and trigger sending if needed"""
+    with measure_stage(Stage.MATCH, tracker_label(tracker.pk)):
+        killmail_new = tracker.process_killmail(
+            killmail=killmail, ignore_max_age=ignore_max_age
         )
+    _handle_tracker_result(tracker=tracker, killmail_new=killmail_new)
+
+
+def _handle_tracker_result(tracker: Tracker, killmail_new: Optional[Killmail]) -> None:
+    """trigger generating a message for a matching killmail
+    or sending of pending messages
+    """
+    if killmail_new and not tracker.is_battle_alert_due(killmail_new):
+        battle_id = killmail_new.battle_info.battle_id
+        logger.info("%s: Already alerted for battle %d", tracker, battle_id)
+        if battles.claim_update(
+            battle_id=battle_id,
+            tracker_pk=tracker.pk,
+            throttle=KILLTRACKER_BATTLE_UPDATE_THROTTLE,
+        ):
+            update_battle_message.apply_async(
+                kwargs={"tracker_pk": tracker.pk, "battle_id": battle_id},
+                countdown=KILLTRACKER_BATTLE_UPDATE_THROTTLE,
+            )
+        killmail_new = None
+    if killmail_new:
+        increment_counter(Counter.KILLMAILS_MATCHED, tracker_label(tracker.pk))
+        if tracker.digest_window:
+            if tracker.add_to_digest(killmail_new):
+                send_tracker_digest.apply_async(
+                    kwargs={"tracker_pk": tracker.pk},
+                    countdown=tracker.digest_window,
+                )
+        else:
+            generate_killmail_message.delay(
+                tracker_pk=tracker.pk, killmail_json=killmail_new.asjson()
+            )
     elif tracker.webhook.main_queue.size():
         send_messages_to_webhook.delay(webhook_pk=tracker.webhook.pk)
 
 
-@shared_task(bind=True, timeout=KILLTRACKER_TASKS_TIMEOUT)
+@shared_task(
+    bind=True, timeout=KILLTRACKER_TASKS_TIMEOUT, queue=task_queue(TaskStage.RENDER)
+)
 def generate_killmail_message(self, tracker_pk: int, killmail_json: str) -> None:
     """generate and enqueue message from given killmail and start sending"""
 
@@ -168,7 +346,61 @@ def generate_killmail_message(self, tracker_pk: int, killmail_json: str) -> None
         send_messages_to_webhook.delay(webhook_pk=tracker.webhook.pk)
 
 
-@shared_task(timeout=KILLTRACKER_TASKS_TIMEOUT)
+@shared_task(
+    bind=True, timeout=KILLTRACKER_TASKS_TIMEOUT, queue=task_queue(TaskStage.DELIVER)
+)
+def update_battle_message(self, tracker_pk: int, battle_id: int) -> None:
+    """update the message posted by a tracker for a battle"""
+    tracker = Tracker.objects.get_cached(
+        pk=tracker_pk,
+        select_related="webhook",
+        timeout=KILLTRACKER_TASK_OBJECTS_CACHE_TIMEOUT,
+    )
+    try:
+        is_updated = tracker.update_battle_message(battle_id)
+    except (WebhookTooManyRequests, ServiceUnavailable) as ex:
+        logger.warning(
+            "%s: Webhook currently blocked. Will retry update for battle %d",
+            tracker,
+            battle_id,
+        )
+        self.retry(
+            max_retries=KILLTRACKER_GENERATE_MESSAGE_MAX_RETRIES,
+            countdown=ex.retry_after,
+            exc=ex,
+        )
+    else:
+        if is_updated:
+            logger.info("%s: Updated message for battle %d", tracker, battle_id)
+        else:
+            logger.info(
+                "%s: Message for battle %d not yet known or battle over",
+                tracker,
+                battle_id,
+            )
+
+
+@shared_task(timeout=KILLTRACKER_TASKS_TIMEOUT, queue=task_queue(TaskStage.RENDER))
+def send_tracker_digest(tracker_pk: int) -> None:
+    """generate and enqueue summary message from digest of a tracker
+    and start sending
+    """
+    tracker = Tracker.objects.get_cached(
+        pk=tracker_pk,
+        select_related="webhook",
+        timeout=KILLTRACKER_TASK_OBJECTS_CACHE_TIMEOUT,
+    )
+    digest = pop_digest(tracker_pk)
+    if not digest:
+        logger.debug("%s: No digest to send", tracker)
+        return
+
+    logger.info("%s: Generating digest for %d killmails", tracker, digest.count)
+    tracker.generate_digest_message(digest)
+    send_messages_to_webhook.delay(webhook_pk=tracker.webhook.pk)
+
+
+@shared_task(timeout=KILLTRACKER_TASKS_TIMEOUT, queue=task_queue(TaskStage.STORAGE))
 def store_killmail(killmail_json: str) -> None:
     """stores killmail as EveKillmail object"""
     killmail = Killmail.from_json(killmail_json)
@@ -182,7 +414,7 @@ def store_killmail(killmail_json: str) -> None:
         logger.info("%s: Stored killmail", killmail.id)
 
 
-@shared_task(timeout=KILLTRACKER_TASKS_TIMEOUT)
+@shared_task(timeout=KILLTRACKER_TASKS_TIMEOUT, queue=task_queue(TaskStage.STORAGE))
 def delete_stale_killmails() -> None:
     """deleted all EveKillmail objects that are considered stale"""
     _, details = EveKillmail.objects.delete_stale()
@@ -194,6 +426,7 @@ def delete_stale_killmails() -> None:
     bind=True,
     base=QueueOnce,  # celery_once locks stay intact during retries
     timeout=KILLTRACKER_TASKS_TIMEOUT,
+    queue=task_queue(TaskStage.DELIVER),
     retry_backoff=False,
     max_retries=None,
 )
@@ -208,22 +441,34 @@ def send_messages_to_webhook(self, webhook_pk: int) -> None:
         logger.info("%s: Webhook is disabled - aborting", webhook)
         return
 
-    message = webhook.main_queue.dequeue()
-    if message:
+    item = webhook.main_queue.dequeue_item()
+    if item:
         logger.info("%s: Sending message to webhook", webhook)
         try:
-            response = webhook.send_message_to_webhook(message)
+            response = webhook.send_message_to_webhook(item.message)
         except WebhookTooManyRequests as ex:
-            webhook.main_queue.enqueue(message)
+            webhook.main_queue.requeue(item)
             logger.warning(
                 "%s: Too many requests for webhook. Blocked for %s seconds. Aborting.",
                 webhook,
                 ex.retry_after,
             )
             return
+        except ServiceUnavailable as ex:
+            webhook.main_queue.requeue(item)
+            logger.warning(
+                "%s: Discord is currently unavailable. Will retry in %s seconds.",
+                webhook,
+                ex.retry_after,
+            )
+            self.retry(countdown=ex.retry_after)
+            return
 
-        if not response.status_ok:
-            webhook.error_queue.enqueue(message)
+        if response.status_ok:
+            increment_counter(Counter.MESSAGES_SENT, webhook_label(webhook.pk))
+        else:
+            increment_counter(Counter.MESSAGES_FAILED, webhook_label(webhook.pk))
+            webhook.error_queue.requeue(item)
             logger.warning(
                 "%s: Failed to send message to webhook, will retry. "
                 "HTTP status code: %d, response: %s",
@@ -237,7 +482,26 @@ def send_messages_to_webhook(self, webhook_pk: int) -> None:
         logger.debug("%s: No more messages to send for webhook", webhook)
 
 
-@shared_task(timeout=KILLTRACKER_TASKS_TIMEOUT)
+@shared_task(
+    base=QueueOnce,
+    once={"graceful": True},
+    timeout=KILLTRACKER_TASKS_TIMEOUT,
+    queue=task_queue(TaskStage.MAINTENANCE),
+)
+def update_discord_group_roles() -> None:
+    """updates the cached Discord roles for all groups pinged by trackers"""
+    if "discord" not in app_labels():
+        logger.debug("Discord service not installed - skipping role update")
+        return
+
+    groups = Group.objects.filter(
+        pk__in=Tracker.ping_groups.through.objects.values("group_id")
+    )
+    mapping = refresh_group_roles(groups)
+    logger.info("Updated Discord roles for %d groups", len(mapping))
+
+
+@shared_task(timeout=KILLTRACKER_TASKS_TIMEOUT, queue=task_queue(TaskStage.DELIVER))
 def send_test_message_to_webhook(webhook_pk: int, count: int = 1) -> None:
     """send a test message to given webhook.
     Optional inform user about result if user ok is given
@@ -35,3 +35,9 @@ class CacheStub:
 
     def set(self, key, value, timeout=None):
         return None
+
+    def get_many(self, keys, version=None):
+        return {}
+
+    def set_many(self, data, timeout=None, version=None):
+        return []
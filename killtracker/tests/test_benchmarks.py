@@ -0,0 +1,187 @@
+"""Benchmarks for the hot paths of the killtracker
+
+The benchmarks run with a small scale by default as part of the normal test suite
+and fail when a hot path exceeds its query budget.
+Timings are written to the log file of this module.
+
+To run them with more killmails and trackers set the environment variable
+KILLTRACKER_BENCHMARK_SCALE, e.g. to 10.
+"""
+from dataclasses import dataclass
+import os
+from time import perf_counter
+from typing import Callable, Iterable
+from unittest import skipIf
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from ..core import batch_matching
+from ..core.killmails import Killmail
+from ..models import EveKillmail
+from .testdata.helpers import LoadTestDataMixin
+from .testdata.synthetic import SyntheticKillmailGenerator, create_synthetic_trackers
+from ..utils import set_test_logger
+
+
+MODULE_PATH = "killtracker.tests.test_benchmarks"
+logger = set_test_logger(MODULE_PATH, __file__)
+
+BENCHMARK_SCALE = int(os.environ.get("KILLTRACKER_BENCHMARK_SCALE", 1))
+
+# Max. average number of DB queries per call
+QUERY_BUDGET_PROCESS_KILLMAIL = 25
+QUERY_BUDGET_CREATE_EMBED = 15
+QUERY_BUDGET_CREATE_FROM_KILLMAIL_BASE = 20
+QUERY_BUDGET_CREATE_FROM_KILLMAIL_PER_ATTACKER = 12
+QUERY_BUDGET_BATCH_MATCHING_BASE = 10
+QUERY_BUDGET_BATCH_MATCHING_PER_TRACKER = 10
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    calls: int
+    duration: float
+    queries: int
+
+    @property
+    def calls_per_second(self) -> float:
+        return self.calls / self.duration if self.duration else 0
+
+    @property
+    def queries_per_call(self) -> float:
+        return self.queries / self.calls if self.calls else 0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.name}: {self.calls:,} calls in {self.duration:.3f}s "
+            f"= {self.calls_per_second:,.1f} calls/s, "
+            f"{self.queries_per_call:.1f} queries/call"
+        )
+
+
+def run_benchmark(name: str, func: Callable, args_list: Iterable) -> BenchmarkResult:
+    """calls func with each args tuple from args_list
+    and returns the measured duration and query count
+    """
+    args_list = list(args_list)
+    with CaptureQueriesContext(connection) as context:
+        started = perf_counter()
+        for args in args_list:
+            func(*args)
+        duration = perf_counter() - started
+
+    result = BenchmarkResult(
+        name=name,
+        calls=len(args_list),
+        duration=duration,
+        queries=len(context.captured_queries),
+    )
+    logger.info("%s", result)
+    return result
+
+
+class TestBenchmarks(LoadTestDataMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.killmails = SyntheticKillmailGenerator().generate(
+            count=20 * BENCHMARK_SCALE, attackers_min=1, attackers_max=30
+        )
+        cls.trackers = create_synthetic_trackers(
+            count=10 * BENCHMARK_SCALE, webhook=cls.webhook_1
+        )
+
+    def test_process_killmail(self):
+        result = run_benchmark(
+            "Tracker.process_killmail",
+            lambda tracker, killmail: tracker.process_killmail(killmail),
+            [
+                (tracker, killmail)
+                for tracker in self.trackers
+                for killmail in self.killmails
+            ],
+        )
+        self.assertLessEqual(result.queries_per_call, QUERY_BUDGET_PROCESS_KILLMAIL)
+
+    @skipIf(not batch_matching.is_available(), "NumPy not installed")
+    def test_batch_matching(self):
+        result_per_object = run_benchmark(
+            "Tracker.process_killmail for batch",
+            lambda: [
+                [tracker.process_killmail(killmail) for tracker in self.trackers]
+                for killmail in self.killmails
+            ],
+            [()],
+        )
+        result_batch = run_benchmark(
+            "BatchMatcher.match_matrix",
+            lambda: batch_matching.BatchMatcher(self.killmails).match_matrix(
+                self.trackers
+            ),
+            [()],
+        )
+        logger.info(
+            "Batch matching speedup: %.1fx",
+            result_per_object.duration / result_batch.duration
+            if result_batch.duration
+            else 0,
+        )
+        budget = (
+            QUERY_BUDGET_BATCH_MATCHING_BASE
+            + QUERY_BUDGET_BATCH_MATCHING_PER_TRACKER * len(self.trackers)
+        )
+        self.assertLessEqual(result_batch.queries, budget)
+
+    def test_create_embed(self):
+        matches = list()
+        for tracker in self.trackers:
+            for killmail in self.killmails:
+                killmail_new = tracker.process_killmail(killmail)
+                if killmail_new:
+                    matches.append((tracker, killmail_new))
+
+        self.assertTrue(matches)
+        result = run_benchmark(
+            "Tracker._create_embed",
+            lambda tracker, killmail: tracker._create_embed(killmail),
+            matches,
+        )
+        self.assertLessEqual(result.queries_per_call, QUERY_BUDGET_CREATE_EMBED)
+
+    def test_killmail_json_roundtrip(self):
+        result_asjson = run_benchmark(
+            "Killmail.asjson",
+            lambda killmail: killmail.asjson(),
+            [(killmail,) for killmail in self.killmails * 10],
+        )
+        killmails_json = [killmail.asjson() for killmail in self.killmails]
+        result_from_json = run_benchmark(
+            "Killmail.from_json",
+            Killmail.from_json,
+            [(killmail_json,) for killmail_json in killmails_json * 10],
+        )
+        self.assertEqual(result_asjson.queries, 0)
+        self.assertEqual(result_from_json.queries, 0)
+        self.assertEqual(
+            Killmail.from_json(killmails_json[0]).asjson(), killmails_json[0]
+        )
+
+    def test_create_from_killmail(self):
+        EveKillmail.objects.all().delete()
+        result = run_benchmark(
+            "EveKillmailManager.create_from_killmail",
+            lambda killmail: EveKillmail.objects.create_from_killmail(
+                killmail, resolve_ids=False
+            ),
+            [(killmail,) for killmail in self.killmails],
+        )
+        attackers_count = sum(len(killmail.attackers) for killmail in self.killmails)
+        budget = (
+            QUERY_BUDGET_CREATE_FROM_KILLMAIL_BASE * len(self.killmails)
+            + QUERY_BUDGET_CREATE_FROM_KILLMAIL_PER_ATTACKER * attackers_count
+        )
+        self.assertLessEqual(result.queries, budget)
+        self.assertEqual(EveKillmail.objects.count(), len(self.killmails))
@@ -0,0 +1,82 @@
+from unittest import skipIf
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from ..core.batch_matching import BatchMatcher, is_available, match_killmails
+from ..core.circuit_breaker import Service
+from ..models import Tracker
+from .testdata.helpers import LoadTestDataMixin, load_killmail
+from .testdata.synthetic import SyntheticKillmailGenerator, create_synthetic_trackers
+
+
+@skipIf(not is_available(), "NumPy not installed")
+class TestBatchMatcher(LoadTestDataMixin, TestCase):
+    @patch("killtracker.core.batch_matching.breaker")
+    def test_should_load_unknown_solar_systems_guarded_by_breaker(self, mock_breaker):
+        # given
+        with patch(
+            "killtracker.core.batch_matching.EveSolarSystem.objects.get_or_create_esi"
+        ) as mock_get_or_create_esi:
+            mock_get_or_create_esi.return_value = ("dummy", True)
+            # when
+            result = BatchMatcher._solar_systems({30004984, 30099999})
+        # then
+        self.assertEqual(result[30004984].id, 30004984)
+        self.assertEqual(result[30099999], "dummy")
+        mock_get_or_create_esi.assert_called_once_with(id=30099999)
+        mock_breaker.assert_called_with(Service.ESI)
+        self.assertTrue(mock_breaker.return_value.guard.called)
+
+    def test_should_match_same_as_per_object_path(self):
+        # given
+        killmails = SyntheticKillmailGenerator().generate(
+            count=30, attackers_min=1, attackers_max=30
+        )
+        trackers = create_synthetic_trackers(count=20, webhook=self.webhook_1)
+        # when
+        matrix = BatchMatcher(killmails).match_matrix(trackers)
+        # then
+        expected = [
+            [bool(tracker.process_killmail(killmail)) for tracker in trackers]
+            for killmail in killmails
+        ]
+        self.assertEqual(matrix.shape, (30, 20))
+        self.assertListEqual(matrix.tolist(), expected)
+
+    def test_should_apply_attacker_clauses(self):
+        # given
+        tracker_1 = Tracker.objects.create(name="Require", webhook=self.webhook_1)
+        tracker_1.require_attacker_alliances.add(self.alliance_3011)
+        tracker_2 = Tracker.objects.create(name="Exclude", webhook=self.webhook_1)
+        tracker_2.exclude_attacker_alliances.add(self.alliance_3011)
+        killmails = [load_killmail(10000001), load_killmail(10000002)]
+        # when
+        matrix = BatchMatcher(killmails).match_matrix(
+            [tracker_1, tracker_2], ignore_max_age=True
+        )
+        # then
+        expected = [
+            [
+                bool(tracker.process_killmail(killmail, ignore_max_age=True))
+                for tracker in [tracker_1, tracker_2]
+            ]
+            for killmail in killmails
+        ]
+        self.assertListEqual(matrix.tolist(), expected)
+
+    def test_should_return_processed_killmails_of_matching_trackers(self):
+        # given
+        tracker_1 = Tracker.objects.create(
+            name="All", webhook=self.webhook_1, require_min_value=None
+        )
+        tracker_2 = Tracker.objects.create(
+            name="Expensive", webhook=self.webhook_1, require_min_value=100
+        )
+        killmail = load_killmail(10000001)
+        # when
+        results = match_killmails([tracker_1, tracker_2], [killmail], True)
+        # then
+        killmail_new, no_match = results[0]
+        self.assertEqual(killmail_new.tracker_info.tracker_pk, tracker_1.pk)
+        self.assertIsNone(no_match)
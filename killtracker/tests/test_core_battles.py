@@ -0,0 +1,117 @@
+from time import sleep
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from ..core.battles import (
+    _battle_trackers_key,
+    assign_battle,
+    battle,
+    claim_alert,
+    clear_battles,
+    message_id,
+    neighbour_solar_system_ids,
+    set_message_id,
+)
+from .testdata.helpers import LoadTestDataMixin, load_killmail
+
+MODULE_PATH = "killtracker.core.battles"
+
+
+@patch(MODULE_PATH + ".neighbour_solar_system_ids", lambda _: set())
+class TestAssignBattle(LoadTestDataMixin, TestCase):
+    def setUp(self) -> None:
+        clear_battles()
+
+    def test_should_start_new_battle(self):
+        # when
+        result = assign_battle(load_killmail(10000001))
+        # then
+        self.assertTrue(result.is_new)
+        self.assertEqual(result.killmail_count, 1)
+
+    def test_should_add_killmail_in_same_system_to_battle(self):
+        # given
+        killmail_1 = load_killmail(10000001)
+        killmail_2 = load_killmail(10000001)
+        killmail_2.id = 10000099
+        battle_info_1 = assign_battle(killmail_1)
+        # when
+        battle_info_2 = assign_battle(killmail_2)
+        # then
+        self.assertFalse(battle_info_2.is_new)
+        self.assertEqual(battle_info_1.battle_id, battle_info_2.battle_id)
+        self.assertEqual(battle_info_2.killmail_count, 2)
+        obj = battle(battle_info_2.battle_id)
+        self.assertEqual(obj.killmail_count, 2)
+        self.assertEqual(obj.total_value, 20000)
+        self.assertListEqual(obj.solar_systems, [(30004984, 2)])
+
+    def test_should_start_separate_battles_in_unrelated_systems(self):
+        # when
+        battle_info_1 = assign_battle(load_killmail(10000001))
+        battle_info_2 = assign_battle(load_killmail(10000002))
+        # then
+        self.assertNotEqual(battle_info_1.battle_id, battle_info_2.battle_id)
+
+    def test_should_add_killmail_in_neighbouring_system_to_battle(self):
+        # given
+        battle_info_1 = assign_battle(load_killmail(10000001))
+        # when
+        with patch(MODULE_PATH + ".neighbour_solar_system_ids", lambda _: {30004984}):
+            battle_info_2 = assign_battle(load_killmail(10000002))
+        # then
+        self.assertEqual(battle_info_1.battle_id, battle_info_2.battle_id)
+        self.assertEqual(len(battle(battle_info_2.battle_id).solar_systems), 2)
+
+    def test_should_claim_alert_once_per_tracker(self):
+        # given
+        battle_info = assign_battle(load_killmail(10000001))
+        # when/then
+        self.assertTrue(claim_alert(battle_info.battle_id, 1))
+        self.assertFalse(claim_alert(battle_info.battle_id, 1))
+        self.assertTrue(claim_alert(battle_info.battle_id, 2))
+
+    def test_should_keep_alert_claim_while_battle_is_ongoing(self):
+        # given
+        battle_info = assign_battle(load_killmail(10000001))
+        claim_alert(battle_info.battle_id, 1)
+        conn = cache.get_master_client()
+        conn.expire(_battle_trackers_key(battle_info.battle_id), 1)
+        killmail = load_killmail(10000001)
+        killmail.id = 10000099
+        # when
+        assign_battle(killmail)
+        # then
+        self.assertGreater(conn.ttl(_battle_trackers_key(battle_info.battle_id)), 1)
+        self.assertFalse(claim_alert(battle_info.battle_id, 1))
+
+
+@patch(MODULE_PATH + ".neighbour_solar_system_ids", lambda _: set())
+@patch(MODULE_PATH + "._window_seconds", lambda: 1)
+class TestLongBattle(LoadTestDataMixin, TestCase):
+    def setUp(self) -> None:
+        clear_battles()
+
+    def test_should_keep_alert_and_message_beyond_twice_the_window(self):
+        # given
+        battle_id = assign_battle(load_killmail(10000001)).battle_id
+        claim_alert(battle_id, 1)
+        set_message_id(battle_id, 1, 12345)
+        # when
+        for killmail_id in range(10000100, 10000105):
+            sleep(0.6)
+            killmail = load_killmail(10000001)
+            killmail.id = killmail_id
+            battle_info = assign_battle(killmail)
+        # then
+        self.assertEqual(battle_info.battle_id, battle_id)
+        self.assertFalse(claim_alert(battle_id, 1))
+        self.assertEqual(message_id(battle_id, 1), 12345)
+
+
+class TestNeighbourSolarSystemIds(LoadTestDataMixin, TestCase):
+    def test_should_return_empty_set_without_stargates(self):
+        cache.clear()
+        self.assertSetEqual(neighbour_solar_system_ids(30004984), set())
@@ -0,0 +1,151 @@
+from unittest.mock import Mock
+
+import requests
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from ..core.circuit_breaker import (
+    CircuitBreaker,
+    Service,
+    is_service_available,
+    is_service_failure,
+    reset_breakers,
+)
+from ..exceptions import ServiceUnavailable
+
+
+def _http_error(status_code: int) -> requests.HTTPError:
+    return requests.HTTPError(response=Mock(status_code=status_code))
+
+
+class TestIsServiceFailure(TestCase):
+    def test_should_detect_failures(self):
+        self.assertTrue(is_service_failure(requests.ConnectionError()))
+        self.assertTrue(is_service_failure(requests.Timeout()))
+        self.assertTrue(is_service_failure(_http_error(502)))
+
+    def test_should_ignore_client_errors(self):
+        self.assertFalse(is_service_failure(_http_error(404)))
+        self.assertFalse(is_service_failure(ValueError()))
+
+
+class TestCircuitBreaker(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.breaker = CircuitBreaker(Service.ZKB, failure_threshold=2)
+
+    def _fail(self):
+        with self.assertRaises(requests.ConnectionError):
+            with self.breaker.guard():
+                raise requests.ConnectionError()
+
+    def test_should_be_available_initially(self):
+        self.assertTrue(self.breaker.is_available())
+        self.assertTrue(is_service_available(Service.ZKB))
+
+    def test_should_open_after_reaching_failure_threshold(self):
+        # when
+        self._fail()
+        self._fail()
+        # then
+        self.assertFalse(self.breaker.is_available())
+        self.assertFalse(is_service_available(Service.ZKB))
+        self.assertTrue(is_service_available(Service.ESI))
+        self.assertGreater(self.breaker.retry_after(), 0)
+
+    def test_should_stay_closed_below_failure_threshold(self):
+        # when
+        self._fail()
+        # then
+        self.assertTrue(self.breaker.is_available())
+        self.assertEqual(self.breaker.failures(), 1)
+
+    def test_should_refuse_calls_when_open(self):
+        # given
+        self._fail()
+        self._fail()
+        func = Mock()
+        # when
+        with self.assertRaises(ServiceUnavailable) as cm:
+            with self.breaker.guard():
+                func()
+        # then
+        self.assertFalse(func.called)
+        self.assertEqual(cm.exception.service, Service.ZKB)
+
+    def test_should_reset_failures_after_success(self):
+        # given
+        self._fail()
+        # when
+        with self.breaker.guard():
+            pass
+        # then
+        self.assertEqual(self.breaker.failures(), 0)
+
+    def test_should_reopen_when_trial_call_fails(self):
+        # given
+        self._fail()
+        self._fail()
+        cache.delete(self.breaker._open_key)  # reset timeout has passed
+        self.assertTrue(self.breaker.is_available())
+        # when
+        self._fail()
+        # then
+        self.assertFalse(self.breaker.is_available())
+
+    def test_should_let_only_one_trial_call_through_when_half_open(self):
+        # given
+        self._fail()
+        self._fail()
+        cache.delete(self.breaker._open_key)  # reset timeout has passed
+        func = Mock()
+        # when
+        with self.breaker.guard():
+            self.assertFalse(self.breaker.is_available())
+            with self.assertRaises(ServiceUnavailable):
+                with self.breaker.guard():
+                    func()
+        # then
+        self.assertFalse(func.called)
+        self.assertTrue(self.breaker.is_available())
+        self.assertEqual(self.breaker.failures(), 0)
+
+    def test_should_allow_new_trial_after_trial_call_without_outcome(self):
+        # given
+        self._fail()
+        self._fail()
+        cache.delete(self.breaker._open_key)  # reset timeout has passed
+        with self.assertRaises(requests.HTTPError):
+            with self.breaker.guard():
+                raise _http_error(404)
+        # when
+        with self.breaker.guard():
+            pass
+        # then
+        self.assertTrue(self.breaker.is_available())
+        self.assertEqual(self.breaker.failures(), 0)
+
+    def test_should_not_count_client_errors(self):
+        # when
+        with self.assertRaises(requests.HTTPError):
+            with self.breaker.guard():
+                raise _http_error(404)
+        # then
+        self.assertEqual(self.breaker.failures(), 0)
+
+    def test_should_count_calls_marked_as_failed(self):
+        # when
+        with self.breaker.guard() as call:
+            call.check_status(503)
+        # then
+        self.assertEqual(self.breaker.failures(), 1)
+
+    def test_should_reset_all_breakers(self):
+        # given
+        self._fail()
+        self._fail()
+        # when
+        reset_breakers()
+        # then
+        self.assertTrue(self.breaker.is_available())
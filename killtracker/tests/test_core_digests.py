@@ -0,0 +1,40 @@
+from django.test import TestCase
+
+from ..core.digests import add_killmail, clear_digest, pop_digest
+from .testdata.helpers import load_killmail
+
+
+class TestDigests(TestCase):
+    def setUp(self) -> None:
+        clear_digest(1)
+
+    def test_should_report_new_digest_for_first_killmail_only(self):
+        self.assertTrue(add_killmail(1, load_killmail(10000001), window=60))
+        self.assertFalse(add_killmail(1, load_killmail(10000002), window=60))
+
+    def test_should_aggregate_killmails(self):
+        # given
+        add_killmail(1, load_killmail(10000001), window=60)
+        add_killmail(1, load_killmail(10000002), window=60)
+        add_killmail(1, load_killmail(10000004), window=60)
+        # when
+        digest = pop_digest(1)
+        # then
+        self.assertEqual(digest.count, 3)
+        self.assertEqual(digest.total_value, 1000020000)
+        self.assertEqual(digest.most_valuable_killmail, (10000004, 1000000000))
+        self.assertEqual(sum(count for _, count in digest.top_ship_types), 3)
+        self.assertEqual(sum(count for _, count in digest.top_solar_systems), 3)
+
+    def test_should_start_new_digest_after_pop(self):
+        # given
+        add_killmail(1, load_killmail(10000001), window=60)
+        pop_digest(1)
+        # when
+        result = add_killmail(1, load_killmail(10000002), window=60)
+        # then
+        self.assertTrue(result)
+        self.assertEqual(pop_digest(1).count, 1)
+
+    def test_should_return_none_when_no_digest(self):
+        self.assertIsNone(pop_digest(1))
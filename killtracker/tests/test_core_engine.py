@@ -0,0 +1,107 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from ..core.engine import (
+    TrackerEngine,
+    _init_worker,
+    shard_engine,
+    shutdown_engines,
+)
+from .testdata.helpers import load_killmail
+
+MODULE_PATH = "killtracker.core.engine"
+
+
+class FakeTracker:
+    """Tracker matching killmails of one solar system only"""
+
+    def __init__(self, pk: int, solar_system_id: int, change_stamp: int = 0) -> None:
+        self.pk = pk
+        self.solar_system_id = solar_system_id
+        self.change_stamp = change_stamp
+
+    def process_killmail(self, killmail):
+        return killmail if killmail.solar_system_id == self.solar_system_id else None
+
+
+def thread_pool_executor(max_workers: int, **kwargs) -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=max_workers)
+
+
+@patch(MODULE_PATH + ".ProcessPoolExecutor", thread_pool_executor)
+class TestTrackerEngine(TestCase):
+    def test_should_return_results_for_all_trackers_in_order(self):
+        # given
+        trackers = [
+            FakeTracker(1, 30004984),
+            FakeTracker(2, 30004976),
+            FakeTracker(3, 30004984),
+        ]
+        engine = TrackerEngine(trackers, pool_size=2)
+        killmail_1 = load_killmail(10000001)
+        killmail_2 = load_killmail(10000002)
+        # when
+        results = engine.match([killmail_1, killmail_2])
+        engine.shutdown()
+        # then
+        self.assertListEqual(
+            [[obj.id if obj else None for obj in row] for row in results],
+            [[10000001, None, 10000001], [None, 10000002, None]],
+        )
+
+    def test_should_return_empty_results_when_no_trackers(self):
+        # given
+        engine = TrackerEngine([], pool_size=2)
+        # when
+        results = engine.match([load_killmail(10000001)])
+        engine.shutdown()
+        # then
+        self.assertListEqual(results, [[]])
+
+
+class TestTrackerEngineWithProcesses(TestCase):
+    def test_should_pass_trackers_to_forked_processes(self):
+        # given
+        engine = TrackerEngine([FakeTracker(1, 30004984)], pool_size=1)
+        # when
+        results = engine.match([load_killmail(10000001)])
+        engine.shutdown()
+        # then
+        self.assertEqual(results[0][0].id, 10000001)
+
+
+@patch(MODULE_PATH + ".ProcessPoolExecutor", thread_pool_executor)
+class TestShardEngine(TestCase):
+    def tearDown(self) -> None:
+        shutdown_engines()
+
+    def test_should_keep_engine_when_reloaded_trackers_are_unchanged(self):
+        # given
+        engine_1 = shard_engine(0, [FakeTracker(1, 30004984)])
+        # when
+        engine_2 = shard_engine(0, [FakeTracker(1, 30004984)])
+        # then
+        self.assertIs(engine_1, engine_2)
+
+    def test_should_start_new_engine_when_trackers_changed(self):
+        # given
+        engine_1 = shard_engine(0, [FakeTracker(1, 30004984)])
+        # when
+        engine_2 = shard_engine(0, [FakeTracker(1, 30004984, change_stamp=1)])
+        engine_3 = shard_engine(0, [FakeTracker(2, 30004984, change_stamp=1)])
+        # then
+        self.assertIsNot(engine_1, engine_2)
+        self.assertIsNot(engine_2, engine_3)
+
+
+class TestInitWorker(TestCase):
+    @patch(MODULE_PATH + "._worker_pid", None)
+    @patch(MODULE_PATH + ".connections")
+    def test_should_close_inherited_db_connections_once(self, mock_connections):
+        # when
+        _init_worker()
+        _init_worker()
+        # then
+        self.assertEqual(mock_connections.close_all.call_count, 1)
@@ -0,0 +1,65 @@
+import datetime as dt
+from unittest.mock import patch
+
+import requests
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils.timezone import now
+
+from ..core.ingest import fetch_killmails, is_new_killmail
+from .testdata.helpers import load_killmail
+
+MODULE_PATH = "killtracker.core.ingest"
+
+
+@patch(MODULE_PATH + ".Killmail.create_from_zkb_redisq")
+class TestFetchKillmails(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_should_return_new_killmails_ordered_by_time(self, mock_fetch):
+        # given
+        killmail_1 = load_killmail(10000001)
+        killmail_1.time = now()
+        killmail_2 = load_killmail(10000002)
+        killmail_2.time = now() - dt.timedelta(minutes=5)
+        mock_fetch.side_effect = [killmail_1, None, killmail_2]
+        # when
+        result = fetch_killmails(concurrency=3, queue_id="dummy")
+        # then
+        self.assertListEqual([obj.id for obj in result], [10000002, 10000001])
+        _, kwargs = mock_fetch.call_args
+        self.assertEqual(kwargs["queue_id"], "dummy")
+
+    def test_should_drop_duplicates(self, mock_fetch):
+        # given
+        mock_fetch.side_effect = [load_killmail(10000001), load_killmail(10000001)]
+        # when
+        result = fetch_killmails(concurrency=2)
+        # then
+        self.assertListEqual([obj.id for obj in result], [10000001])
+
+    def test_should_drop_killmails_received_before(self, mock_fetch):
+        # given
+        is_new_killmail(10000001)
+        mock_fetch.side_effect = [load_killmail(10000001), None]
+        # when
+        result = fetch_killmails(concurrency=2)
+        # then
+        self.assertListEqual(result, [])
+
+    def test_should_ignore_failed_requests_when_killmails_received(self, mock_fetch):
+        # given
+        mock_fetch.side_effect = [load_killmail(10000001), requests.Timeout()]
+        # when
+        result = fetch_killmails(concurrency=2)
+        # then
+        self.assertListEqual([obj.id for obj in result], [10000001])
+
+    def test_should_raise_when_all_requests_failed(self, mock_fetch):
+        # given
+        mock_fetch.side_effect = [requests.Timeout(), requests.Timeout()]
+        # when/then
+        with self.assertRaises(requests.Timeout):
+            fetch_killmails(concurrency=2)
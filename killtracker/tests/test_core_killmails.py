@@ -1,6 +1,6 @@
 from datetime import timedelta
 import unittest
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 import requests_mock
 
@@ -8,7 +8,13 @@ from django.utils.dateparse import parse_datetime
 from django.utils.timezone import now
 
 from . import CacheStub, BravadoOperationStub
-from ..core.killmails import Killmail, EntityCount, ZKB_REDISQ_URL, ZKB_API_URL
+from ..core.killmails import (
+    Killmail,
+    EntityCount,
+    ZKB_API_CACHE_TIMEOUT,
+    ZKB_REDISQ_URL,
+    ZKB_API_URL,
+)
 from .testdata.helpers import killmails_data, load_killmail
 from ..utils import NoSocketsTestCase
 
@@ -17,6 +23,7 @@ MODULE_PATH = "killtracker.core.killmails"
 unittest.util._MAX_LENGTH = 1000
 
 
+@patch(MODULE_PATH + ".breaker", MagicMock())
 @requests_mock.Mocker()
 class TestCreateFromZkbRedisq(NoSocketsTestCase):
     def test_normal(self, requests_mocker):
@@ -159,6 +166,7 @@ class TestEntityCount(NoSocketsTestCase):
         self.assertTrue(corporation.is_corporation)
 
 
+@patch(MODULE_PATH + ".breaker", MagicMock())
 @patch(MODULE_PATH + ".cache", CacheStub())
 @patch(MODULE_PATH + ".esi")
 @requests_mock.Mocker()
@@ -211,3 +219,84 @@ class TestCreateFromZkbApi(NoSocketsTestCase):
         self.assertFalse(killmail.zkb.is_npc)
         self.assertFalse(killmail.zkb.is_solo)
         self.assertFalse(killmail.zkb.is_awox)
+
+
+@patch(MODULE_PATH + ".breaker", MagicMock())
+@patch(MODULE_PATH + ".cache")
+@patch(MODULE_PATH + ".esi")
+@requests_mock.Mocker()
+class TestCreateFromZkbApiBulk(NoSocketsTestCase):
+    def setUp(self) -> None:
+        self.esi_data = dict()
+
+    def _register_killmail(self, requests_mocker, killmail_id: int):
+        killmail_data = killmails_data()[killmail_id]
+        requests_mocker.register_uri(
+            "GET",
+            f"{ZKB_API_URL}killID/{killmail_id}/",
+            status_code=200,
+            json=[{"killmail_id": killmail_id, "zkb": killmail_data["zkb"]}],
+        )
+        killmail_data["killmail"]["killmail_time"] = parse_datetime(
+            killmail_data["killmail"]["killmail_time"]
+        )
+        self.esi_data[killmail_id] = killmail_data["killmail"]
+
+    def _esi_get_killmail(self, killmail_id, killmail_hash):
+        return BravadoOperationStub(self.esi_data[killmail_id])
+
+    def test_should_fetch_missing_killmails_and_cache_them(
+        self, mock_esi, mock_cache, requests_mocker
+    ):
+        # given
+        mock_cache.get_many.return_value = {}
+        mock_esi.client.Killmails.get_killmails_killmail_id_killmail_hash.side_effect = (
+            self._esi_get_killmail
+        )
+        self._register_killmail(requests_mocker, 10000001)
+        self._register_killmail(requests_mocker, 10000002)
+        requests_mocker.register_uri(
+            "GET", f"{ZKB_API_URL}killID/10000099/", status_code=200, json=[]
+        )
+        # when
+        result = Killmail.create_from_zkb_api_bulk([10000001, 10000002, 10000099])
+        # then
+        self.assertSetEqual(set(result.keys()), {10000001, 10000002})
+        self.assertEqual(result[10000002].id, 10000002)
+        self.assertEqual(mock_cache.get_many.call_count, 1)
+        args, kwargs = mock_cache.set_many.call_args
+        self.assertEqual(len(args[0]), 2)
+        self.assertEqual(kwargs["timeout"], ZKB_API_CACHE_TIMEOUT)
+
+    def test_should_return_other_killmails_when_fetching_one_fails(
+        self, mock_esi, mock_cache, requests_mocker
+    ):
+        # given
+        mock_cache.get_many.return_value = {}
+        mock_esi.client.Killmails.get_killmails_killmail_id_killmail_hash.side_effect = (
+            self._esi_get_killmail
+        )
+        self._register_killmail(requests_mocker, 10000001)
+        self._register_killmail(requests_mocker, 10000002)
+        requests_mocker.register_uri(
+            "GET", f"{ZKB_API_URL}killID/10000099/", status_code=500
+        )
+        # when
+        result = Killmail.create_from_zkb_api_bulk([10000001, 10000099, 10000002])
+        # then
+        self.assertSetEqual(set(result.keys()), {10000001, 10000002})
+        args, _ = mock_cache.set_many.call_args
+        self.assertEqual(len(args[0]), 2)
+
+    def test_should_use_cached_killmails(self, mock_esi, mock_cache, requests_mocker):
+        # given
+        killmail = load_killmail(10000001)
+        mock_cache.get_many.return_value = {
+            "KILLTRACKER_KILLMAIL_10000001": killmail.asjson()
+        }
+        # when
+        result = Killmail.create_from_zkb_api_bulk([10000001])
+        # then
+        self.assertEqual(result[10000001].id, 10000001)
+        self.assertFalse(requests_mocker.called)
+        self.assertFalse(mock_cache.set_many.called)
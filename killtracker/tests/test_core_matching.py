@@ -0,0 +1,163 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from ..core.matching import (
+    CLAUSES,
+    KillmailMatcher,
+    _clause_stats,
+    clause_stats,
+    clear_clause_stats,
+    compile_clauses,
+    order_clauses,
+)
+from ..models import Tracker
+from .testdata.helpers import LoadTestDataMixin, load_killmail
+
+
+MODULE_PATH = "killtracker.core.matching"
+
+
+def _clause(name: str):
+    return next(clause for clause in CLAUSES if clause.name == name)
+
+
+class TestOrderClauses(TestCase):
+    def setUp(self) -> None:
+        clear_clause_stats(1)
+
+    def test_should_order_by_cost_when_no_stats(self):
+        # given
+        clauses = [
+            _clause("require_attackers_ship_types"),
+            _clause("require_regions"),
+            _clause("require_min_value"),
+        ]
+        # when
+        result = order_clauses(1, clauses)
+        # then
+        self.assertListEqual(
+            [obj.name for obj in result],
+            [
+                "require_min_value",
+                "require_regions",
+                "require_attackers_ship_types",
+            ],
+        )
+
+    @patch(MODULE_PATH + ".KILLTRACKER_CLAUSE_STATS_REFRESH_INTERVAL", 0)
+    def test_should_put_selective_clauses_first(self):
+        # given
+        for _ in range(100):
+            _clause_stats.record(1, "require_min_value", is_rejected=False)
+            _clause_stats.record(1, "require_regions", is_rejected=True)
+        clauses = [_clause("require_min_value"), _clause("require_regions")]
+        # when
+        result = order_clauses(1, clauses)
+        # then
+        self.assertListEqual(
+            [obj.name for obj in result], ["require_regions", "require_min_value"]
+        )
+        self.assertDictEqual(
+            clause_stats(1),
+            {
+                "require_min_value": {"evaluated": 100, "rejected": 0},
+                "require_regions": {"evaluated": 100, "rejected": 100},
+            },
+        )
+
+    @patch(MODULE_PATH + ".KILLTRACKER_CLAUSE_STATS_REFRESH_INTERVAL", 0)
+    def test_should_clear_stats_of_given_tracker_only(self):
+        # given
+        clear_clause_stats(2)
+        _clause_stats.record(1, "require_regions", is_rejected=True)
+        _clause_stats.record(2, "require_regions", is_rejected=True)
+        # when
+        clear_clause_stats(1)
+        # then
+        order_clauses(1, [])
+        order_clauses(2, [])
+        self.assertDictEqual(clause_stats(1), {})
+        self.assertDictEqual(
+            clause_stats(2), {"require_regions": {"evaluated": 1, "rejected": 1}}
+        )
+
+
+class TestKillmailMatcher(LoadTestDataMixin, TestCase):
+    def setUp(self) -> None:
+        self.tracker = Tracker.objects.create(name="Test", webhook=self.webhook_1)
+        clear_clause_stats(self.tracker.pk)
+
+    def test_should_report_active_clauses(self):
+        # given
+        self.tracker.require_min_value = 10
+        self.tracker.save()
+        self.tracker.require_victim_ship_types.add(self.type_svipul)
+        matcher = KillmailMatcher(self.tracker, load_killmail(10000001))
+        # when
+        result = matcher.active_clauses()
+        # then
+        self.assertListEqual(
+            [obj.name for obj in result],
+            ["require_min_value", "require_victim_ship_types"],
+        )
+
+    def test_should_not_load_solar_system_when_rejected_by_scalar_clause(self):
+        # given
+        self.tracker.require_min_attackers = 1000
+        self.tracker.exclude_high_sec = True
+        self.tracker.save()
+        matcher = KillmailMatcher(self.tracker, load_killmail(10000001))
+        # when
+        with patch(MODULE_PATH + ".EveSolarSystem.objects.get_or_create_esi") as mock:
+            result = matcher.is_matching()
+        # then
+        self.assertFalse(result)
+        self.assertFalse(mock.called)
+
+    def test_should_compile_clauses(self):
+        # given
+        self.tracker.require_min_value = 10
+        self.tracker.save()
+        self.tracker.require_victim_ship_types.add(self.type_svipul)
+        # when
+        result = compile_clauses(self.tracker)
+        # then
+        self.assertListEqual(
+            [obj.name for obj in result.active_clauses],
+            ["require_min_value", "require_victim_ship_types"],
+        )
+        self.assertDictEqual(
+            result.related_ids, {"require_victim_ship_types": {self.type_svipul.id}}
+        )
+
+    def test_should_match_with_compiled_clauses_without_queries(self):
+        # given
+        self.tracker.require_victim_ship_types.add(self.type_merlin)
+        compiled = compile_clauses(self.tracker)
+        matcher = KillmailMatcher(
+            self.tracker, load_killmail(10000001), compiled=compiled
+        )
+        # when
+        with self.assertNumQueries(0):
+            result = matcher.is_matching()
+        # then
+        self.assertTrue(result)
+
+
+class TestCompileClauses(LoadTestDataMixin, TestCase):
+    def test_should_change_stamp_only_when_tracker_changed(self):
+        # given
+        tracker = Tracker.objects.create(name="Test", webhook=self.webhook_1)
+        stamp_1 = compile_clauses(tracker).stamp
+        # when
+        stamp_reloaded = compile_clauses(Tracker.objects.get(pk=tracker.pk)).stamp
+        tracker.require_min_value = 10
+        tracker.save()
+        stamp_2 = compile_clauses(tracker).stamp
+        tracker.require_victim_ship_types.add(self.type_svipul)
+        stamp_3 = compile_clauses(tracker).stamp
+        # then
+        self.assertEqual(stamp_1, stamp_reloaded)
+        self.assertNotEqual(stamp_1, stamp_2)
+        self.assertNotEqual(stamp_2, stamp_3)
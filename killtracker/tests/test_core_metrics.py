@@ -0,0 +1,187 @@
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from ..core.metrics import (
+    Counter,
+    Histogram,
+    Stage,
+    clear_counters,
+    counter_values,
+    flush_counters,
+    increment_counter,
+    measure_stage,
+    prometheus_text,
+    record_stage,
+    stage_stats,
+    tracker_label,
+)
+from ..models import Tracker
+from .testdata.helpers import LoadTestDataMixin
+
+
+MODULE_PATH = "killtracker.core.metrics"
+
+
+class TestHistogram(TestCase):
+    def setUp(self) -> None:
+        Histogram.clear_all()
+
+    def test_should_record_observations(self):
+        # given
+        histogram = Histogram("dummy", buckets=(1, 2, float("inf")))
+        # when
+        histogram.observe(0.5)
+        histogram.observe(1.5)
+        histogram.observe(1.7)
+        histogram.observe(3)
+        # then
+        data = histogram.data()
+        self.assertEqual(data.count, 4)
+        self.assertAlmostEqual(data.sum, 6.7)
+        self.assertEqual(data.buckets, [(1, 1), (2, 2), (float("inf"), 1)])
+        self.assertAlmostEqual(data.average, 1.675)
+        self.assertEqual(data.percentile(50), 2)
+        self.assertEqual(data.percentile(99), float("inf"))
+
+    def test_should_return_empty_data(self):
+        data = Histogram("dummy").data()
+        self.assertEqual(data.count, 0)
+        self.assertIsNone(data.average)
+        self.assertIsNone(data.percentile(50))
+
+    def test_should_list_all_histograms(self):
+        # given
+        Histogram("alpha").observe(1)
+        Histogram("alpha", "label").observe(1)
+        Histogram("bravo").observe(1)
+        # when
+        result = {(obj.name, obj.label) for obj in Histogram.all()}
+        # then
+        self.assertSetEqual(
+            result, {("alpha", None), ("alpha", "label"), ("bravo", None)}
+        )
+
+    def test_should_clear_all_histograms(self):
+        # given
+        Histogram("alpha").observe(1)
+        # when
+        Histogram.clear_all()
+        # then
+        self.assertEqual(Histogram.all(), [])
+        self.assertEqual(Histogram("alpha").data().count, 0)
+
+
+class TestRecordStage(TestCase):
+    def setUp(self) -> None:
+        Histogram.clear_all()
+
+    @patch(MODULE_PATH + ".KILLTRACKER_PIPELINE_STATS_ENABLED", True)
+    def test_should_record_total_and_label(self):
+        # when
+        record_stage(Stage.MATCH, 0.2, "tracker_1")
+        # then
+        self.assertEqual(Histogram(Stage.MATCH).data().count, 1)
+        self.assertEqual(Histogram(Stage.MATCH, "tracker_1").data().count, 1)
+
+    @patch(MODULE_PATH + ".KILLTRACKER_PIPELINE_STATS_ENABLED", False)
+    def test_should_not_record_when_disabled(self):
+        # when
+        record_stage(Stage.MATCH, 0.2)
+        # then
+        self.assertEqual(Histogram(Stage.MATCH).data().count, 0)
+
+    @patch(MODULE_PATH + ".KILLTRACKER_PIPELINE_STATS_ENABLED", True)
+    def test_should_measure_block(self):
+        # when
+        with measure_stage(Stage.RENDER):
+            pass
+        # then
+        stats = stage_stats()
+        self.assertEqual(stats[Stage.RENDER][0].count, 1)
+        self.assertEqual(stats[Stage.SEND], [])
+
+
+class TestPipelineStatsCommand(LoadTestDataMixin, TestCase):
+    def setUp(self) -> None:
+        Histogram.clear_all()
+
+    @patch(MODULE_PATH + ".KILLTRACKER_PIPELINE_STATS_ENABLED", True)
+    def test_should_show_stats_with_tracker_names(self):
+        # given
+        tracker = Tracker.objects.create(name="My Tracker", webhook=self.webhook_1)
+        record_stage(Stage.MATCH, 0.2, tracker_label(tracker.pk))
+        out = StringIO()
+        # when
+        call_command("killtracker_pipeline_stats", "--details", stdout=out)
+        # then
+        self.assertIn("match / My Tracker", out.getvalue())
+
+    def test_should_clear_stats(self):
+        # given
+        Histogram(Stage.MATCH).observe(1)
+        # when
+        call_command("killtracker_pipeline_stats", "--clear", stdout=StringIO())
+        # then
+        self.assertEqual(Histogram(Stage.MATCH).data().count, 0)
+
+
+@patch(MODULE_PATH + ".KILLTRACKER_METRICS_FLUSH_INTERVAL", 3600)
+@patch(MODULE_PATH + ".KILLTRACKER_METRICS_ENABLED", True)
+class TestCounters(TestCase):
+    def setUp(self) -> None:
+        flush_counters()
+        clear_counters()
+        Histogram.clear_all()
+
+    def test_should_aggregate_counters_in_redis_after_flush(self):
+        # given
+        increment_counter(Counter.KILLMAILS_RECEIVED)
+        increment_counter(Counter.KILLMAILS_RECEIVED)
+        increment_counter(Counter.KILLMAILS_MATCHED, "tracker_1", 3)
+        self.assertEqual(counter_values(), dict())
+        # when
+        flush_counters()
+        # then
+        self.assertDictEqual(
+            counter_values(),
+            {
+                (Counter.KILLMAILS_RECEIVED, None): 2,
+                (Counter.KILLMAILS_MATCHED, "tracker_1"): 3,
+            },
+        )
+
+    def test_should_render_prometheus_text(self):
+        # given
+        increment_counter(Counter.KILLMAILS_MATCHED, "tracker_1", 3)
+        flush_counters()
+        Histogram(Stage.MATCH, "tracker_1", buckets=(1, float("inf"))).observe(0.5)
+        # when
+        text = prometheus_text(
+            label_names={"tracker_1": 'My "Tracker"'},
+            gauges=[("queue_size", "Queue size", {"queue": "main"}, 5)],
+        )
+        # then
+        self.assertIn(
+            'killtracker_killmails_matched_total{tracker_id="1",'
+            'tracker="My \\"Tracker\\""} 3',
+            text,
+        )
+        self.assertIn("killtracker_killmails_received_total 0", text)
+        self.assertIn('killtracker_queue_size{queue="main"} 5', text)
+        self.assertIn(
+            'killtracker_stage_match_duration_seconds_bucket{tracker_id="1",'
+            'tracker="My \\"Tracker\\"",le="+Inf"} 1',
+            text,
+        )
+        self.assertIn("# TYPE killtracker_stage_match_duration_seconds histogram", text)
+
+    def test_should_not_count_when_disabled(self):
+        # when
+        with patch(MODULE_PATH + ".KILLTRACKER_METRICS_ENABLED", False):
+            increment_counter(Counter.KILLMAILS_RECEIVED)
+            flush_counters()
+        # then
+        self.assertEqual(counter_values(), dict())
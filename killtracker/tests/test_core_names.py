@@ -0,0 +1,72 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from eveuniverse.models import EveEntity
+
+from ..core.names import (
+    clear_local_cache,
+    resolve_names,
+    solar_system_region_name,
+)
+from .testdata.helpers import LoadTestDataMixin
+
+
+MODULE_PATH = "killtracker.core.names"
+
+
+class TestResolveNames(LoadTestDataMixin, TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        clear_local_cache()
+
+    def test_should_resolve_names(self):
+        # when
+        resolver = resolve_names([1001, 2001, 3001])
+        # then
+        self.assertEqual(resolver.to_name(1001), "Bruce Wayne")
+        self.assertEqual(resolver.to_name(2001), "Wayne Technologies")
+        self.assertEqual(resolver.to_name(3001), "Wayne Enterprise")
+
+    def test_should_resolve_from_cache_after_first_call(self):
+        # given
+        resolve_names([1001, 2001])
+        # when
+        with patch(MODULE_PATH + ".EveEntity.objects.bulk_resolve_names") as mock:
+            resolver = resolve_names([1001, 2001])
+        # then
+        self.assertFalse(mock.called)
+        self.assertEqual(resolver.to_name(1001), "Bruce Wayne")
+
+    def test_should_resolve_from_shared_cache_in_new_worker(self):
+        # given
+        resolve_names([1001])
+        clear_local_cache()
+        # when
+        with patch(MODULE_PATH + ".EveEntity.objects.bulk_resolve_names") as mock:
+            resolver = resolve_names([1001])
+        # then
+        self.assertFalse(mock.called)
+        self.assertEqual(resolver.to_name(1001), "Bruce Wayne")
+
+    def test_should_resolve_only_missing_ids(self):
+        # given
+        resolve_names([1001])
+        # when
+        with patch(
+            MODULE_PATH + ".EveEntity.objects.bulk_resolve_names",
+            wraps=EveEntity.objects.bulk_resolve_names,
+        ) as mock:
+            resolve_names([1001, 2001])
+        # then
+        self.assertSetEqual(set(mock.call_args[1]["ids"]), {2001})
+
+
+class TestSolarSystemRegionName(LoadTestDataMixin, TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        clear_local_cache()
+
+    def test_should_return_region_name(self):
+        self.assertEqual(solar_system_region_name(30004984), "Essence")
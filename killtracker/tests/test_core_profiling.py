@@ -0,0 +1,138 @@
+from unittest.mock import MagicMock, patch
+
+import requests
+from requests.adapters import BaseAdapter
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from ..core.profiling import (
+    Operation,
+    ProfileResult,
+    profile,
+    record_profile,
+    tracker_profile,
+)
+from ..models import Tracker
+from .testdata.helpers import LoadTestDataMixin, load_killmail
+
+
+MODULE_PATH = "killtracker.core.profiling"
+
+
+class FakeAdapter(BaseAdapter):
+    def send(self, request, **kwargs):
+        response = requests.Response()
+        response.status_code = 200
+        response.request = request
+        response.url = request.url
+        return response
+
+    def close(self):
+        pass
+
+
+def create_esi_provider() -> MagicMock:
+    session = requests.Session()
+    session.mount("https://", FakeAdapter())
+    provider = MagicMock()
+    provider._client.swagger_spec.http_client.session = session
+    return provider
+
+
+class TestProfile(TestCase):
+    def test_should_count_queries(self):
+        # when
+        with profile() as result:
+            list(Tracker.objects.all())
+            list(Tracker.objects.all())
+        # then
+        self.assertEqual(result.queries, 2)
+        self.assertEqual(result.esi_calls, 0)
+        self.assertGreater(result.duration, 0)
+
+    def test_should_count_calls_of_esi_clients_only(self):
+        # given
+        provider = create_esi_provider()
+        session = provider._client.swagger_spec.http_client.session
+        other_session = requests.Session()
+        other_session.mount("https://", FakeAdapter())
+        # when
+        with patch(MODULE_PATH + ".ESI_PROVIDERS", [provider]):
+            with profile() as result:
+                session.get("https://esi.evetech.net/latest/status/")
+                session.get("https://esi.evetech.net/latest/status/")
+                other_session.get("https://esi.evetech.net/latest/status/")
+        # then
+        self.assertEqual(result.esi_calls, 2)
+
+    def test_should_not_count_esi_calls_outside_profile(self):
+        # given
+        provider = create_esi_provider()
+        session = provider._client.swagger_spec.http_client.session
+        # when
+        with patch(MODULE_PATH + ".ESI_PROVIDERS", [provider]):
+            with profile() as result:
+                pass
+            session.get("https://esi.evetech.net/latest/status/")
+        # then
+        self.assertEqual(result.esi_calls, 0)
+
+    def test_should_ignore_esi_clients_not_yet_created(self):
+        # given
+        provider = MagicMock(_client=None)
+        # when
+        with patch(MODULE_PATH + ".ESI_PROVIDERS", [provider]):
+            with profile() as result:
+                pass
+        # then
+        self.assertEqual(result.esi_calls, 0)
+
+
+class TestRecordProfile(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_should_aggregate_profiles(self):
+        # given
+        record_profile(
+            1, Operation.PROCESS_KILLMAIL, ProfileResult(queries=4, duration=0.1)
+        )
+        record_profile(
+            1,
+            Operation.PROCESS_KILLMAIL,
+            ProfileResult(queries=2, esi_calls=2, duration=0.3),
+        )
+        record_profile(2, Operation.PROCESS_KILLMAIL, ProfileResult(queries=10))
+        # when
+        result = tracker_profile(1)
+        # then
+        summary = result[Operation.PROCESS_KILLMAIL]
+        self.assertEqual(summary.count, 2)
+        self.assertEqual(summary.avg_queries, 3)
+        self.assertEqual(summary.avg_esi_calls, 1)
+        self.assertAlmostEqual(summary.avg_duration, 0.2)
+        self.assertEqual(result[Operation.CREATE_EMBED].count, 0)
+        self.assertEqual(str(result[Operation.CREATE_EMBED]), "-")
+
+
+class TestProfiledTracker(LoadTestDataMixin, TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.tracker = Tracker.objects.create(name="Test", webhook=self.webhook_1)
+
+    @patch(MODULE_PATH + ".KILLTRACKER_PROFILING_ENABLED", True)
+    def test_should_record_profile_when_enabled(self):
+        # when
+        self.tracker.process_killmail(load_killmail(10000001))
+        # then
+        result = tracker_profile(self.tracker.pk)
+        self.assertEqual(result[Operation.PROCESS_KILLMAIL].count, 1)
+
+    @patch(MODULE_PATH + ".KILLTRACKER_PROFILING_ENABLED", False)
+    def test_should_not_record_profile_when_disabled(self):
+        # when
+        self.tracker.process_killmail(load_killmail(10000001))
+        # then
+        result = tracker_profile(self.tracker.pk)
+        self.assertEqual(result[Operation.PROCESS_KILLMAIL].count, 0)
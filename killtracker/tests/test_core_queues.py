@@ -0,0 +1,114 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from ..core.queues import PriorityMQ
+
+MODULE_PATH = "killtracker.core.queues"
+
+
+class TestPriorityMQ(TestCase):
+    def setUp(self) -> None:
+        self.queue_1 = PriorityMQ(
+            cache.get_master_client(), "killtracker_test_1", priorities=[10, 20, 30]
+        )
+        self.queue_2 = PriorityMQ(
+            cache.get_master_client(), "killtracker_test_2", priorities=[10, 20, 30]
+        )
+        self.queue_1.clear()
+        self.queue_2.clear()
+
+    def test_should_dequeue_by_priority_then_in_order(self):
+        # given
+        self.queue_1.enqueue("alpha", 10)
+        self.queue_1.enqueue("bravo")
+        self.queue_1.enqueue("charlie", 30)
+        self.queue_1.enqueue("delta")
+        # when
+        result = self.queue_1.dequeue_bulk()
+        # then
+        self.assertListEqual(result, ["charlie", "bravo", "delta", "alpha"])
+        self.assertEqual(self.queue_1.size(), 0)
+
+    def test_should_keep_duplicate_messages(self):
+        # when
+        self.queue_1.enqueue("alpha")
+        result = self.queue_1.enqueue("alpha")
+        # then
+        self.assertEqual(result, 2)
+        self.assertListEqual(self.queue_1.dequeue_bulk(), ["alpha", "alpha"])
+
+    def test_should_return_none_when_empty(self):
+        self.assertIsNone(self.queue_1.dequeue())
+
+    def test_should_reject_unknown_priority(self):
+        with self.assertRaises(ValueError):
+            self.queue_1.enqueue("alpha", 15)
+
+    def test_should_requeue_message_at_original_position(self):
+        # given
+        self.queue_1.enqueue_bulk(["alpha", "bravo"])
+        item = self.queue_1.dequeue_item()
+        # when
+        self.queue_1.requeue(item)
+        # then
+        self.assertEqual(item.message, "alpha")
+        self.assertEqual(item.priority, 20)
+        self.assertListEqual(self.queue_1.dequeue_bulk(), ["alpha", "bravo"])
+
+    def test_should_move_all_messages_keeping_priority(self):
+        # given
+        self.queue_1.enqueue("alpha", 10)
+        self.queue_1.enqueue("bravo", 30)
+        self.queue_2.enqueue("charlie", 20)
+        # when
+        result = self.queue_1.move_all_to(self.queue_2)
+        # then
+        self.assertEqual(result, 2)
+        self.assertEqual(self.queue_1.size(), 0)
+        self.assertListEqual(self.queue_2.dequeue_bulk(), ["bravo", "charlie", "alpha"])
+
+    def test_should_drop_stale_messages_of_given_priority_only(self):
+        # given
+        self.queue_1.enqueue("alpha", 10)
+        self.queue_1.enqueue("bravo", 20)
+        # when
+        result = self.queue_1.drop_stale(10, max_age=-1)
+        # then
+        self.assertEqual(result, 1)
+        self.assertListEqual(self.queue_1.dequeue_bulk(), ["bravo"])
+
+    def test_should_trim_lowest_priority_first(self):
+        # given
+        self.queue_1.enqueue("alpha", 30)
+        self.queue_1.enqueue("bravo", 10)
+        self.queue_1.enqueue("charlie", 20)
+        self.queue_1.enqueue("delta", 10)
+        # when
+        result = self.queue_1.trim(2)
+        # then
+        self.assertEqual(result, 2)
+        self.assertListEqual(self.queue_1.dequeue_bulk(), ["alpha", "charlie"])
+
+    def test_should_trim_oldest_first(self):
+        # given
+        with patch(MODULE_PATH + ".time", lambda: 1000):
+            self.queue_1.enqueue("alpha", 30)
+        with patch(MODULE_PATH + ".time", lambda: 1001):
+            self.queue_1.enqueue("bravo", 10)
+            self.queue_1.enqueue("charlie", 20)
+        # when
+        result = self.queue_1.trim(2, oldest_first=True)
+        # then
+        self.assertEqual(result, 1)
+        self.assertListEqual(self.queue_1.dequeue_bulk(), ["charlie", "bravo"])
+
+    def test_should_not_trim_when_below_max_size(self):
+        # given
+        self.queue_1.enqueue("alpha")
+        # when
+        result = self.queue_1.trim(2)
+        # then
+        self.assertEqual(result, 0)
+        self.assertEqual(self.queue_1.size(), 1)
@@ -0,0 +1,30 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from ..core.routing import TaskStage, task_queue
+from ..tasks import run_tracker, send_messages_to_webhook
+
+MODULE_PATH = "killtracker.core.routing"
+
+
+class TestTaskQueue(TestCase):
+    @patch(MODULE_PATH + ".KILLTRACKER_TASK_QUEUES", {"deliver": "discord"})
+    def test_should_return_configured_queue(self):
+        self.assertEqual(task_queue(TaskStage.DELIVER), "discord")
+
+    @patch(MODULE_PATH + ".KILLTRACKER_TASK_QUEUES", {"deliver": "discord"})
+    def test_should_return_none_for_default_queue(self):
+        self.assertIsNone(task_queue(TaskStage.MATCH))
+
+    @patch(MODULE_PATH + ".KILLTRACKER_TASK_QUEUES", None)
+    def test_should_return_none_when_not_configured(self):
+        self.assertIsNone(task_queue(TaskStage.MATCH))
+
+    def test_should_raise_error_for_invalid_stage(self):
+        with self.assertRaises(ValueError):
+            task_queue("invalid")
+
+    def test_tasks_run_on_default_queue_by_default(self):
+        self.assertIsNone(run_tracker.queue)
+        self.assertIsNone(send_messages_to_webhook.queue)
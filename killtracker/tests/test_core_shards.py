@@ -0,0 +1,64 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from ..core.shards import clear_shard_trackers, shard_trackers, tracker_shard
+from ..models import Tracker
+from .testdata.helpers import LoadTestDataMixin
+
+MODULE_PATH = "killtracker.core.shards"
+
+
+@patch(MODULE_PATH + ".KILLTRACKER_TRACKER_SHARDS", 4)
+class TestTrackerShard(LoadTestDataMixin, TestCase):
+    def test_should_use_explicit_shard(self):
+        # given
+        tracker = Tracker.objects.create(name="A", webhook=self.webhook_1, shard=2)
+        # when/then
+        self.assertEqual(tracker_shard(tracker), 2)
+
+    def test_should_wrap_explicit_shard_above_count(self):
+        # given
+        tracker = Tracker.objects.create(name="A", webhook=self.webhook_1, shard=5)
+        # when/then
+        self.assertEqual(tracker_shard(tracker), 1)
+
+    def test_should_assign_shard_by_pk_when_not_set(self):
+        # given
+        tracker = Tracker.objects.create(name="A", webhook=self.webhook_1)
+        # when
+        result = tracker_shard(tracker)
+        # then
+        self.assertIn(result, range(4))
+        self.assertEqual(tracker_shard(tracker), result)
+
+
+@patch(MODULE_PATH + ".KILLTRACKER_TRACKER_SHARDS", 2)
+class TestShardTrackers(LoadTestDataMixin, TestCase):
+    def setUp(self) -> None:
+        clear_shard_trackers()
+        self.tracker_1 = Tracker.objects.create(
+            name="A", webhook=self.webhook_1, shard=0
+        )
+        self.tracker_2 = Tracker.objects.create(
+            name="B", webhook=self.webhook_1, shard=1
+        )
+        Tracker.objects.create(
+            name="C", webhook=self.webhook_1, shard=0, is_enabled=False
+        )
+
+    def test_should_return_enabled_trackers_of_shard_with_compiled_clauses(self):
+        # when
+        result = shard_trackers(0)
+        # then
+        self.assertListEqual(result, [self.tracker_1])
+        self.assertIsNotNone(result[0]._compiled_clauses)
+
+    def test_should_cache_trackers(self):
+        # given
+        shard_trackers(1)
+        # when
+        with self.assertNumQueries(0):
+            result = shard_trackers(1)
+        # then
+        self.assertListEqual(result, [self.tracker_2])
@@ -0,0 +1,106 @@
+import asyncio
+import json
+import tempfile
+from unittest import skipIf
+from unittest.mock import patch
+
+import requests
+
+from django.test import TestCase
+
+from ..core.sources import (
+    FileSource,
+    RedisQSource,
+    WebsocketSource,
+    consume,
+    is_websocket_available,
+    run_source,
+)
+from .testdata.helpers import load_killmail, load_killmail_package
+
+MODULE_PATH = "killtracker.core.sources"
+
+
+def _killstream_message(killmail_id: int) -> dict:
+    package = load_killmail_package(killmail_id)
+    message = dict(package["killmail"])
+    message["zkb"] = package["zkb"]
+    return message
+
+
+@patch(MODULE_PATH + ".Killmail.create_from_zkb_redisq")
+class TestRedisQSource(TestCase):
+    def test_should_stream_received_killmails(self, mock_fetch):
+        # given
+        mock_fetch.side_effect = [
+            None,
+            load_killmail(10000001),
+            requests.ConnectionError(),
+            load_killmail(10000002),
+        ]
+        received = []
+        # when
+        count = run_source(
+            RedisQSource(queue_id="dummy", retry_delay=0),
+            received.append,
+            max_killmails=2,
+        )
+        # then
+        self.assertEqual(count, 2)
+        self.assertListEqual([obj.id for obj in received], [10000001, 10000002])
+        _, kwargs = mock_fetch.call_args
+        self.assertEqual(kwargs["queue_id"], "dummy")
+
+
+class TestFileSource(TestCase):
+    def test_should_replay_killmails_from_file(self):
+        # given
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as file:
+            file.write(json.dumps(load_killmail_package(10000001)) + "\n")
+            file.write("\n")
+            file.write(load_killmail(10000002).asjson() + "\n")
+        received = []
+        # when
+        count = run_source(FileSource(path=file.name), received.append)
+        # then
+        self.assertEqual(count, 2)
+        self.assertListEqual([obj.id for obj in received], [10000001, 10000002])
+
+
+@skipIf(not is_websocket_available(), "websockets not installed")
+class TestWebsocketSource(TestCase):
+    def test_should_stream_killmails_from_killstream(self):
+        # given
+        from .testdata.stub_server import KillstreamStub
+
+        stub = KillstreamStub(
+            [
+                _killstream_message(10000001),
+                {"action": "tqStatus", "tqStatus": "ONLINE"},
+                _killstream_message(10000002),
+            ]
+        )
+        received = []
+
+        async def run():
+            url = await stub.start()
+            try:
+                return await consume(
+                    WebsocketSource(url=url), received.append, max_killmails=2
+                )
+            finally:
+                await stub.stop()
+
+        # when
+        loop = asyncio.new_event_loop()
+        try:
+            count = loop.run_until_complete(run())
+        finally:
+            loop.close()
+        # then
+        self.assertEqual(count, 2)
+        self.assertListEqual([obj.id for obj in received], [10000001, 10000002])
+        self.assertListEqual(
+            stub.subscriptions, [{"action": "sub", "channel": "killstream"}]
+        )
+        self.assertIsNotNone(received[0].zkb.hash)
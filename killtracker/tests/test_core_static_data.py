@@ -0,0 +1,52 @@
+from django.test import TestCase
+
+from ..core.static_data import (
+    clear_parked_killmails,
+    missing_static_data,
+    park_killmail,
+    parked_killmails,
+    parked_killmails_count,
+    unpark_killmails,
+)
+from .testdata.helpers import LoadTestDataMixin, load_killmail
+
+
+class TestMissingStaticData(LoadTestDataMixin, TestCase):
+    def setUp(self) -> None:
+        clear_parked_killmails()
+
+    def test_should_report_nothing_missing_when_all_data_known(self):
+        # given
+        killmail = load_killmail(10000001)
+        # when
+        result = missing_static_data(killmail)
+        # then
+        self.assertFalse(result)
+
+    def test_should_report_unknown_solar_system_and_types(self):
+        # given
+        killmail = load_killmail(10000001)
+        killmail.solar_system_id = 30000142
+        killmail.victim.ship_type_id = 670
+        # when
+        result = missing_static_data(killmail)
+        # then
+        self.assertSetEqual(result.solar_system_ids, {30000142})
+        self.assertSetEqual(result.type_ids, {670})
+
+
+class TestParkedKillmails(TestCase):
+    def setUp(self) -> None:
+        clear_parked_killmails()
+
+    def test_should_park_and_unpark_killmails(self):
+        # given
+        park_killmail(load_killmail(10000001))
+        park_killmail(load_killmail(10000002))
+        park_killmail(load_killmail(10000001))
+        # when
+        killmail_ids = {obj.id for obj in parked_killmails()}
+        unpark_killmails([10000001])
+        # then
+        self.assertSetEqual(killmail_ids, {10000001, 10000002})
+        self.assertEqual(parked_killmails_count(), 1)
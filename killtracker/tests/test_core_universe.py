@@ -0,0 +1,69 @@
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from eveuniverse.models import EveSolarSystem
+
+from ..core import universe
+from ..core.matching import KillmailMatcher
+from ..models import Tracker
+from .testdata.helpers import LoadTestDataMixin, load_killmail
+
+MODULE_PATH = "killtracker.core.universe"
+
+
+class TestUniverseSnapshot(LoadTestDataMixin, TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "universe.bin")
+        universe.reset_snapshot()
+
+    def tearDown(self) -> None:
+        universe.reset_snapshot()
+        self.temp_dir.cleanup()
+
+    def test_should_export_and_load_all_solar_systems(self):
+        # when
+        call_command("killtracker_export_universe", "--path", self.path)
+        # then
+        snapshot = universe.UniverseSnapshot(self.path)
+        self.assertEqual(len(snapshot), EveSolarSystem.objects.count())
+        for obj in EveSolarSystem.objects.select_related("eve_constellation"):
+            self.assertEqual(
+                snapshot.solar_system(obj.id),
+                universe.SolarSystemInfo.from_eve_solar_system(obj),
+            )
+        self.assertIsNone(snapshot.solar_system(1))
+        snapshot.close()
+
+    def test_should_reject_invalid_file(self):
+        # given
+        with open(self.path, "wb") as file:
+            file.write(b"invalid file content")
+        # when/then
+        with self.assertRaises(ValueError):
+            universe.UniverseSnapshot(self.path)
+
+    def test_should_return_none_when_not_configured(self):
+        with patch(MODULE_PATH + ".KILLTRACKER_UNIVERSE_SNAPSHOT_PATH", None):
+            self.assertIsNone(universe.solar_system(30004984))
+
+    def test_should_match_geography_without_queries(self):
+        # given
+        call_command("killtracker_export_universe", "--path", self.path)
+        tracker = Tracker.objects.create(
+            name="Test", webhook=self.webhook_1, exclude_high_sec=True
+        )
+        tracker.compile_clauses()
+        matcher = KillmailMatcher(
+            tracker, load_killmail(10000001), compiled=tracker._compiled_clauses
+        )
+        # when
+        with patch(MODULE_PATH + ".KILLTRACKER_UNIVERSE_SNAPSHOT_PATH", self.path):
+            with self.assertNumQueries(0):
+                result = matcher.is_matching()
+        # then
+        self.assertTrue(result)
@@ -0,0 +1,211 @@
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+
+from ..core.circuit_breaker import Service
+from ..core.matching import KillmailMatcher, clear_ship_type_groups
+from ..core.warmup import warmup, warmup_process
+from ..exceptions import ServiceUnavailable
+from ..models import Tracker
+from ..signals import worker_process_init_handler, worker_ready_handler
+from .testdata.helpers import LoadTestDataMixin, load_killmail
+
+MODULE_PATH = "killtracker.core.warmup"
+
+
+class TestWarmup(LoadTestDataMixin, TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        clear_ship_type_groups()
+        self.tracker = Tracker.objects.create(name="Test", webhook=self.webhook_1)
+
+    def test_should_run_all_steps(self):
+        # when
+        steps = warmup()
+        # then
+        counts = {step.name: step.count for step in steps}
+        self.assertEqual(counts["trackers"], 1)
+        self.assertGreater(counts["ship type groups"], 0)
+        self.assertEqual(counts["jump tables"], 0)
+        self.assertIn("universe snapshot", counts)
+
+    def test_should_not_access_database_when_warming_up_process(self):
+        # when
+        with self.assertNumQueries(0):
+            steps = warmup_process()
+        # then
+        self.assertEqual([step.name for step in steps], ["universe snapshot"])
+
+    def test_should_resolve_ship_types_without_queries_after_warmup(self):
+        # given
+        warmup()
+        self.tracker.require_victim_ship_groups.add(self.type_merlin.eve_group)
+        self.tracker.compile_clauses()
+        matcher = KillmailMatcher(
+            self.tracker, load_killmail(10000001), self.tracker._compiled_clauses
+        )
+        # when
+        with self.assertNumQueries(0):
+            result = matcher.is_matching()
+        # then
+        self.assertTrue(result)
+
+    @patch(MODULE_PATH + ".resolve_names")
+    def test_should_resolve_names_of_organizations(self, mock_resolve_names):
+        # given
+        self.tracker.require_attacker_alliances.add(self.alliance_3011)
+        # when
+        warmup()
+        # then
+        args, _ = mock_resolve_names.call_args
+        self.assertSetEqual(args[0], {3011})
+
+    def test_command_should_show_timings(self):
+        # given
+        out = StringIO()
+        # when
+        call_command("killtracker_warmup", stdout=out)
+        # then
+        self.assertIn("ship type groups", out.getvalue())
+
+
+@patch("killtracker.core.warmup.warmup_process")
+@patch("killtracker.core.warmup.warmup_shared")
+class TestWorkerSignals(TestCase):
+    @patch("killtracker.signals.KILLTRACKER_WARMUP_ON_WORKER_READY", True)
+    def test_should_warm_up_shared_caches_when_worker_ready(
+        self, mock_warmup_shared, mock_warmup_process
+    ):
+        # when
+        worker_ready_handler()
+        # then
+        self.assertTrue(mock_warmup_shared.called)
+        self.assertFalse(mock_warmup_process.called)
+
+    @patch("killtracker.signals.KILLTRACKER_WARMUP_ON_WORKER_READY", True)
+    def test_should_warm_up_process_caches_when_process_starts(
+        self, mock_warmup_shared, mock_warmup_process
+    ):
+        # when
+        worker_process_init_handler()
+        # then
+        self.assertFalse(mock_warmup_shared.called)
+        self.assertTrue(mock_warmup_process.called)
+
+    @patch("killtracker.signals.KILLTRACKER_WARMUP_ON_WORKER_READY", False)
+    def test_should_not_warm_up_when_disabled(
+        self, mock_warmup_shared, mock_warmup_process
+    ):
+        # when
+        worker_ready_handler()
+        worker_process_init_handler()
+        # then
+        self.assertFalse(mock_warmup_shared.called)
+        self.assertFalse(mock_warmup_process.called)
+
+
+class TestMaxJumpsWithJumpTable(LoadTestDataMixin, TestCase):
+    @patch("killtracker.core.universe.jump_table")
+    def test_should_match_jumps_from_jump_table_without_esi(self, mock_jump_table):
+        # given
+        mock_jump_table.return_value = {30003067: 0, 30004984: 2}
+        tracker = Tracker.objects.create(
+            name="Test",
+            origin_solar_system_id=30003067,
+            require_max_jumps=3,
+            webhook=self.webhook_1,
+        )
+        matcher = KillmailMatcher(tracker, load_killmail(10000001))
+        # when
+        with patch("eveuniverse.models.esi") as mock_esi:
+            result = matcher.is_matching()
+        # then
+        self.assertTrue(result)
+        self.assertEqual(matcher.jumps, 2)
+        self.assertFalse(mock_esi.client.Routes.get_route_origin_destination.called)
+
+    @patch("killtracker.core.universe.jump_table")
+    def test_should_reject_systems_not_in_jump_table(self, mock_jump_table):
+        # given
+        mock_jump_table.return_value = {30003067: 0}
+        tracker = Tracker.objects.create(
+            name="Test",
+            origin_solar_system_id=30003067,
+            require_max_jumps=3,
+            webhook=self.webhook_1,
+        )
+        matcher = KillmailMatcher(tracker, load_killmail(10000001))
+        # when
+        with patch("eveuniverse.models.esi") as mock_esi:
+            result = matcher.is_matching()
+        # then
+        self.assertFalse(result)
+        self.assertFalse(mock_esi.client.Routes.get_route_origin_destination.called)
+
+    @patch("killtracker.core.universe.jump_table")
+    def test_should_show_jumps_from_jump_table_without_max_jumps(self, mock_jump_table):
+        # given
+        mock_jump_table.return_value = {30003067: 0, 30004984: 5}
+        tracker = Tracker.objects.create(
+            name="Test", origin_solar_system_id=30003067, webhook=self.webhook_1
+        )
+        matcher = KillmailMatcher(tracker, load_killmail(10000001))
+        # when
+        with patch("eveuniverse.models.esi") as mock_esi:
+            result = matcher.jumps
+        # then
+        self.assertEqual(result, 5)
+        self.assertFalse(mock_esi.client.Routes.get_route_origin_destination.called)
+
+    @patch("killtracker.core.matching.KILLTRACKER_ESI_FREE_MODE", True)
+    @patch("killtracker.core.universe.jump_table", lambda *args: None)
+    def test_should_not_request_route_from_esi_in_esi_free_mode(self):
+        # given
+        tracker = Tracker.objects.create(
+            name="Test", origin_solar_system_id=30003067, webhook=self.webhook_1
+        )
+        matcher = KillmailMatcher(tracker, load_killmail(10000001))
+        # when
+        with patch("eveuniverse.models.esi") as mock_esi:
+            result = matcher.jumps
+        # then
+        self.assertIsNone(result)
+        self.assertFalse(mock_esi.client.Routes.get_route_origin_destination.called)
+
+    @patch("killtracker.core.matching.breaker")
+    @patch("killtracker.core.universe.jump_table", lambda *args: None)
+    def test_should_request_route_from_esi_guarded_by_breaker(self, mock_breaker):
+        # given
+        tracker = Tracker.objects.create(
+            name="Test", origin_solar_system_id=30003067, webhook=self.webhook_1
+        )
+        matcher = KillmailMatcher(tracker, load_killmail(10000001))
+        # when
+        with patch("eveuniverse.models.EveSolarSystem.jumps_to") as mock_jumps_to:
+            mock_jumps_to.return_value = 7
+            result = matcher.jumps
+        # then
+        self.assertEqual(result, 7)
+        mock_breaker.assert_called_with(Service.ESI)
+        self.assertTrue(mock_breaker.return_value.guard.called)
+
+    @patch("killtracker.core.matching.breaker")
+    @patch("killtracker.core.universe.jump_table", lambda *args: None)
+    def test_should_not_request_route_from_esi_while_esi_is_down(self, mock_breaker):
+        # given
+        mock_breaker.return_value.guard.side_effect = ServiceUnavailable(
+            Service.ESI, 60
+        )
+        tracker = Tracker.objects.create(
+            name="Test", origin_solar_system_id=30003067, webhook=self.webhook_1
+        )
+        matcher = KillmailMatcher(tracker, load_killmail(10000001))
+        # when
+        with patch("eveuniverse.models.esi") as mock_esi:
+            result = matcher.jumps
+        # then
+        self.assertIsNone(result)
+        self.assertFalse(mock_esi.client.Routes.get_route_origin_destination.called)
@@ -25,6 +25,9 @@ from eveuniverse.models import (
 from killtracker.core.killmails import EntityCount
 
 from . import BravadoOperationStub
+from ..core import battles
+from ..core.digests import clear_digest, pop_digest
+from ..core.discord_roles import clear_group_roles, refresh_group_roles
 from ..core.killmails import Killmail
 from ..exceptions import WebhookTooManyRequests
 from ..models import EveKillmail, EveKillmailCharacter, Tracker, Webhook
@@ -78,6 +81,72 @@ class TestWebhookQueue(LoadTestDataMixin, TestCase):
         self.assertEqual(self.webhook_1.error_queue.size(), 0)
         self.assertEqual(self.webhook_1.main_queue.size(), 2)
 
+    @patch(MODULE_PATH + ".KILLTRACKER_WEBHOOK_LOW_PRIORITY_MAX_AGE", 60)
+    def test_should_drop_stale_low_priority_messages(self):
+        # given
+        with patch("killtracker.core.queues.time", lambda: 1_000_000):
+            self.webhook_1.main_queue.enqueue("alpha", Webhook.MessagePriority.LOW)
+            self.webhook_1.main_queue.enqueue("bravo", Webhook.MessagePriority.NORMAL)
+        # when
+        result = self.webhook_1.drop_stale_messages()
+        # then
+        self.assertEqual(result, 1)
+        self.assertListEqual(self.webhook_1.main_queue.dequeue_bulk(), ["bravo"])
+
+    def test_should_shed_messages_when_queue_is_full(self):
+        # given
+        self.webhook_1.max_queue_size = 2
+        self.webhook_1.reset_messages_shed()
+        self.webhook_1.enqueue_message(
+            content="alpha", priority=Webhook.MessagePriority.LOW
+        )
+        self.webhook_1.enqueue_message(content="bravo")
+        # when
+        result = self.webhook_1.enqueue_message(content="charlie")
+        # then
+        self.assertEqual(result, 2)
+        self.assertEqual(self.webhook_1.messages_shed(), 1)
+        self.assertEqual(self.webhook_1.main_queue.size(Webhook.MessagePriority.LOW), 0)
+
+    def test_should_shed_messages_after_reset(self):
+        # given
+        self.webhook_1.max_queue_size = 1
+        self.webhook_1.reset_messages_shed()
+        self.webhook_1.error_queue.enqueue("alpha")
+        self.webhook_1.error_queue.enqueue("bravo")
+        # when
+        self.webhook_1.reset_failed_messages()
+        # then
+        self.assertEqual(self.webhook_1.main_queue.size(), 1)
+        self.assertEqual(self.webhook_1.messages_shed(), 1)
+
+    def test_should_enqueue_summary_for_shed_messages(self):
+        # given
+        self.webhook_1.max_queue_size = 1
+        self.webhook_1.shedding_policy = Webhook.SheddingPolicy.SUMMARIZE
+        self.webhook_1.reset_messages_shed()
+        self.webhook_1.enqueue_message(content="alpha")
+        self.webhook_1.enqueue_message(content="bravo")
+        self.webhook_1.enqueue_message(content="charlie")
+        # when
+        result = self.webhook_1.enqueue_shed_summary()
+        # then
+        self.assertEqual(result, 2)
+        message = json.loads(self.webhook_1.main_queue.dequeue())
+        self.assertIn("2 killmail messages were dropped", message["content"])
+        self.assertEqual(self.webhook_1.enqueue_shed_summary(), 0)
+
+    @patch(MODULE_PATH + ".KILLTRACKER_WEBHOOK_LOW_PRIORITY_MAX_AGE", 0)
+    def test_should_not_drop_stale_messages_when_disabled(self):
+        # given
+        with patch("killtracker.core.queues.time", lambda: 1_000_000):
+            self.webhook_1.main_queue.enqueue("alpha", Webhook.MessagePriority.LOW)
+        # when
+        result = self.webhook_1.drop_stale_messages()
+        # then
+        self.assertEqual(result, 0)
+        self.assertEqual(self.webhook_1.main_queue.size(), 1)
+
     def test_discord_message_asjson_normal(self):
         embed = dhooks_lite.Embed(description="my_description")
         result = Webhook._discord_message_asjson(
@@ -685,6 +754,7 @@ class TestTrackerCalculateTrackerInfo(LoadTestDataMixin, NoSocketsTestCase):
 
 class TestTrackerEnqueueKillmail(LoadTestDataMixin, TestCase):
     def setUp(self) -> None:
+        cache.clear()
         self.tracker = Tracker.objects.create(name="My Tracker", webhook=self.webhook_1)
         self.webhook_1.main_queue.clear()
 
@@ -851,6 +921,119 @@ class TestTrackerEnqueueKillmail(LoadTestDataMixin, TestCase):
 
         self.assertEqual(self.webhook_1.main_queue.size(), 1)
 
+    def test_should_reuse_embed_base_for_other_trackers(self):
+        tracker_2 = Tracker.objects.create(
+            name="Other Tracker", webhook=self.webhook_1, color="#ff0000"
+        )
+        killmail_1 = self.tracker.process_killmail(load_killmail(10000001))
+        killmail_2 = tracker_2.process_killmail(load_killmail(10000001))
+        embed_1 = self.tracker._create_embed(killmail_1)
+
+        with patch(
+            MODULE_PATH + ".Tracker._create_embed_base",
+            wraps=Tracker._create_embed_base,
+        ) as mock:
+            embed_2 = tracker_2._create_embed(killmail_2)
+
+        self.assertFalse(mock.called)
+        self.assertEqual(embed_1.description, embed_2.description)
+        self.assertEqual(embed_1.title, embed_2.title)
+        self.assertIsNone(embed_1.color)
+        self.assertEqual(embed_2.color, 0xFF0000)
+
+    @patch(MODULE_PATH + ".Webhook.edit_message")
+    def test_should_update_battle_message(self, mock_edit_message):
+        mock_edit_message.return_value = dhooks_lite.WebhookResponse(
+            dict(), status_code=200
+        )
+        battles.clear_battles()
+        battle_info = battles.assign_battle(load_killmail(10000001))
+        battles.assign_battle(load_killmail(10000001))
+        battles.set_message_id(battle_info.battle_id, self.tracker.pk, 12345)
+
+        result = self.tracker.update_battle_message(battle_info.battle_id)
+
+        self.assertTrue(result)
+        _, kwargs = mock_edit_message.call_args
+        self.assertEqual(kwargs["message_id"], 12345)
+        self.assertIn("**2** kills", kwargs["content"])
+
+    @patch(MODULE_PATH + ".Webhook.edit_message")
+    def test_should_not_update_battle_message_when_not_yet_sent(
+        self, mock_edit_message
+    ):
+        battles.clear_battles()
+        battle_info = battles.assign_battle(load_killmail(10000001))
+
+        result = self.tracker.update_battle_message(battle_info.battle_id)
+
+        self.assertFalse(result)
+        self.assertFalse(mock_edit_message.called)
+
+    def test_should_generate_digest_message(self):
+        clear_digest(self.tracker.pk)
+        self.tracker.add_to_digest(load_killmail(10000001))
+        self.tracker.add_to_digest(load_killmail(10000004))
+
+        self.tracker.generate_digest_message(pop_digest(self.tracker.pk))
+
+        self.assertEqual(self.webhook_1.main_queue.size(), 1)
+        message = json.loads(self.webhook_1.main_queue.dequeue())
+        embed = message["embeds"][0]
+        self.assertEqual(embed["title"], "Digest: 2 kills")
+        self.assertIn("1.00b", embed["description"])
+        self.assertIn("Top ships lost", [field["name"] for field in embed["fields"]])
+
+    @patch(MODULE_PATH + ".KILLTRACKER_HIGH_PRIORITY_MIN_VALUE", 100)
+    def test_should_enqueue_with_tracker_priority(self):
+        self.tracker.priority = Webhook.MessagePriority.LOW
+        self.tracker.save()
+        killmail = self.tracker.process_killmail(load_killmail(10000001))
+
+        self.tracker.generate_killmail_message(killmail)
+
+        self.assertEqual(self.webhook_1.main_queue.size(Webhook.MessagePriority.LOW), 1)
+
+    @patch(MODULE_PATH + ".KILLTRACKER_HIGH_PRIORITY_MIN_VALUE", 100)
+    def test_should_enqueue_high_value_kills_with_high_priority(self):
+        self.tracker.priority = Webhook.MessagePriority.LOW
+        self.tracker.save()
+        killmail = self.tracker.process_killmail(load_killmail(10000004))
+
+        self.tracker.generate_killmail_message(killmail)
+
+        self.assertEqual(
+            self.webhook_1.main_queue.size(Webhook.MessagePriority.HIGH), 1
+        )
+
+
+@patch(MODULE_PATH + ".requests.patch")
+class TestWebhookEditMessage(LoadTestDataMixin, TestCase):
+    def setUp(self) -> None:
+        cache.delete(self.webhook_1._blocked_cache_key())
+
+    def test_should_edit_message(self, mock_patch):
+        mock_patch.return_value = Mock(
+            status_code=200, headers={}, **{"json.return_value": {"id": "12345"}}
+        )
+
+        response = self.webhook_1.edit_message(12345, content="Updated")
+
+        self.assertTrue(response.status_ok)
+        _, kwargs = mock_patch.call_args
+        self.assertEqual(kwargs["url"], f"{self.webhook_1.url}/messages/12345")
+        self.assertDictEqual(json.loads(kwargs["data"]), {"content": "Updated"})
+
+    def test_should_raise_when_too_many_requests(self, mock_patch):
+        mock_patch.return_value = Mock(
+            status_code=429, headers={}, **{"json.return_value": {"retry_after": 10}}
+        )
+
+        with self.assertRaises(WebhookTooManyRequests):
+            self.webhook_1.edit_message(12345, content="Updated")
+
+        self.assertTrue(cache.ttl(self.webhook_1._blocked_cache_key()))
+
 
 @patch(MODULE_PATH + ".dhooks_lite.Webhook.execute")
 class TestWebhookSendMessage(LoadTestDataMixin, TestCase):
@@ -866,6 +1049,20 @@ class TestWebhookSendMessage(LoadTestDataMixin, TestCase):
         self.assertTrue(response.status_ok)
         self.assertTrue(mock_execute.called)
 
+    def test_should_store_message_id_for_battle(self, mock_execute):
+        mock_execute.return_value = dhooks_lite.WebhookResponse(
+            dict(), status_code=200, content={"id": "12345"}
+        )
+        message = Webhook._discord_message_asjson(
+            content="Test message", meta={"battle_id": 7, "tracker_pk": 3}
+        )
+
+        self.webhook_1.send_message_to_webhook(message)
+
+        self.assertEqual(battles.message_id(battle_id=7, tracker_pk=3), 12345)
+        _, kwargs = mock_execute.call_args
+        self.assertNotIn("meta", kwargs)
+
     def test_when_send_not_ok_returns_false(self, mock_execute):
         mock_execute.return_value = dhooks_lite.WebhookResponse(dict(), status_code=404)
 
@@ -923,7 +1120,7 @@ class TestWebhookSendMessage(LoadTestDataMixin, TestCase):
 
 if "discord" in app_labels():
 
-    @patch(MODULE_PATH + ".DiscordUser", spec=True)
+    @patch("killtracker.core.discord_roles.DiscordUser", spec=True)
     class TestGroupPings(LoadTestDataMixin, TestCase):
         @classmethod
         def setUpClass(cls):
@@ -932,6 +1129,7 @@ if "discord" in app_labels():
             cls.group_2 = Group.objects.create(name="Dummy Group 2")
 
         def setUp(self):
+            clear_group_roles()
             self.tracker = Tracker.objects.create(
                 name="My Tracker",
                 webhook=self.webhook_1,
@@ -949,13 +1147,15 @@ if "discord" in app_labels():
         def test_can_ping_one_group(self, mock_DiscordUser):
             mock_DiscordUser.objects.group_to_role.side_effect = self._my_group_to_role
             self.tracker.ping_groups.add(self.group_1)
+            refresh_group_roles([self.group_1])
+            mock_DiscordUser.objects.group_to_role.reset_mock()
             killmail = self.tracker.process_killmail(load_killmail(10000101))
 
             self.tracker.generate_killmail_message(
                 Killmail.from_json(killmail.asjson())
             )
 
-            self.assertTrue(mock_DiscordUser.objects.group_to_role.called)
+            self.assertFalse(mock_DiscordUser.objects.group_to_role.called)
             self.assertEqual(self.webhook_1.main_queue.size(), 1)
             message = json.loads(self.webhook_1.main_queue.dequeue())
             self.assertIn(f"<@&{self.group_1.pk}>", message["content"])
@@ -964,13 +1164,13 @@ if "discord" in app_labels():
             mock_DiscordUser.objects.group_to_role.side_effect = self._my_group_to_role
             self.tracker.ping_groups.add(self.group_1)
             self.tracker.ping_groups.add(self.group_2)
+            refresh_group_roles([self.group_1, self.group_2])
 
             killmail = self.tracker.process_killmail(load_killmail(10000101))
             self.tracker.generate_killmail_message(
                 Killmail.from_json(killmail.asjson())
             )
 
-            self.assertTrue(mock_DiscordUser.objects.group_to_role.called)
             self.assertEqual(self.webhook_1.main_queue.size(), 1)
             message = json.loads(self.webhook_1.main_queue.dequeue())
             self.assertIn(f"<@&{self.group_1.pk}>", message["content"])
@@ -981,20 +1181,22 @@ if "discord" in app_labels():
             self.tracker.ping_groups.add(self.group_1)
             self.tracker.ping_type = Tracker.ChannelPingType.HERE
             self.tracker.save()
+            refresh_group_roles([self.group_1])
 
             killmail = self.tracker.process_killmail(load_killmail(10000101))
             self.tracker.generate_killmail_message(
                 Killmail.from_json(killmail.asjson())
             )
 
-            self.assertTrue(mock_DiscordUser.objects.group_to_role.called)
             self.assertEqual(self.webhook_1.main_queue.size(), 1)
             message = json.loads(self.webhook_1.main_queue.dequeue())
             self.assertIn(f"<@&{self.group_1.pk}>", message["content"])
             self.assertIn("@here", message["content"])
 
-        def test_can_handle_error_from_discord(self, mock_DiscordUser):
-            mock_DiscordUser.objects.group_to_role.side_effect = HTTPError
+        @patch("killtracker.tasks.update_discord_group_roles")
+        def test_should_skip_unknown_group_and_request_update(
+            self, mock_update_discord_group_roles, mock_DiscordUser
+        ):
             self.tracker.ping_groups.add(self.group_1)
 
             killmail = self.tracker.process_killmail(load_killmail(10000101))
@@ -1002,11 +1204,30 @@ if "discord" in app_labels():
                 Killmail.from_json(killmail.asjson())
             )
 
-            self.assertTrue(mock_DiscordUser.objects.group_to_role.called)
+            self.assertFalse(mock_DiscordUser.objects.group_to_role.called)
+            self.assertTrue(mock_update_discord_group_roles.delay.called)
             self.assertEqual(self.webhook_1.main_queue.size(), 1)
             message = json.loads(self.webhook_1.main_queue.dequeue())
             self.assertNotIn(f"<@&{self.group_1.pk}>", message["content"])
 
+        def test_should_keep_last_known_role_on_error_from_discord(
+            self, mock_DiscordUser
+        ):
+            mock_DiscordUser.objects.group_to_role.side_effect = self._my_group_to_role
+            self.tracker.ping_groups.add(self.group_1)
+            refresh_group_roles([self.group_1])
+            mock_DiscordUser.objects.group_to_role.side_effect = HTTPError
+            refresh_group_roles([self.group_1])
+
+            killmail = self.tracker.process_killmail(load_killmail(10000101))
+            self.tracker.generate_killmail_message(
+                Killmail.from_json(killmail.asjson())
+            )
+
+            self.assertEqual(self.webhook_1.main_queue.size(), 1)
+            message = json.loads(self.webhook_1.main_queue.dequeue())
+            self.assertIn(f"<@&{self.group_1.pk}>", message["content"])
+
 
 class TestEveKillmail(LoadTestDataMixin, NoSocketsTestCase):
     @classmethod
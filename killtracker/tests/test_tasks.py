@@ -1,22 +1,39 @@
-from unittest.mock import patch
+import datetime as dt
+from unittest.mock import call, patch
 
 import dhooks_lite
 
+from django.contrib.auth.models import Group
 from django.core.cache import cache
 from django.test import TestCase
 from django.test.utils import override_settings
-
-from ..exceptions import WebhookTooManyRequests
+from django.utils.timezone import now
+
+from ..core.battles import assign_battle, clear_battles
+from ..core.circuit_breaker import Service
+from ..core.digests import clear_digest
+from ..core.shards import clear_shard_trackers
+from ..core.static_data import (
+    MissingStaticData,
+    clear_parked_killmails,
+    park_killmail,
+    parked_killmails_count,
+)
+from ..exceptions import ServiceUnavailable, WebhookTooManyRequests
 from ..models import EveKillmail, Tracker, Webhook
 from .testdata.helpers import load_killmail, load_eve_killmails, LoadTestDataMixin
 from ..tasks import (
     delete_stale_killmails,
+    release_parked_killmails,
     run_tracker,
+    run_tracker_shard,
     send_messages_to_webhook,
     run_killtracker,
     store_killmail,
     send_test_message_to_webhook,
     generate_killmail_message,
+    send_tracker_digest,
+    update_discord_group_roles,
 )
 from ..utils import generate_invalid_pk
 
@@ -45,7 +62,7 @@ class TestTrackerBase(LoadTestDataMixin, TestCase):
 
 
 @override_settings(CELERY_ALWAYS_EAGER=True)
-@patch(MODULE_PATH + ".is_esi_online")
+@patch(MODULE_PATH + ".is_service_available")
 @patch(MODULE_PATH + ".delete_stale_killmails")
 @patch(MODULE_PATH + ".store_killmail")
 @patch(MODULE_PATH + ".Killmail.create_from_zkb_redisq")
@@ -71,10 +88,10 @@ class TestRunKilltracker(TestTrackerBase):
         mock_create_from_zkb_redisq,
         mock_store_killmail,
         mock_delete_stale_killmails,
-        mock_is_esi_online,
+        mock_is_service_available,
     ):
         mock_create_from_zkb_redisq.side_effect = self.my_fetch_from_zkb()
-        mock_is_esi_online.return_value = True
+        mock_is_service_available.return_value = True
         self.webhook_1.error_queue.enqueue(load_killmail(10000004).asjson())
 
         run_killtracker.delay()
@@ -91,10 +108,10 @@ class TestRunKilltracker(TestTrackerBase):
         mock_create_from_zkb_redisq,
         mock_store_killmail,
         mock_delete_stale_killmails,
-        mock_is_esi_online,
+        mock_is_service_available,
     ):
         mock_create_from_zkb_redisq.side_effect = self.my_fetch_from_zkb()
-        mock_is_esi_online.return_value = False
+        mock_is_service_available.return_value = False
 
         run_killtracker.delay()
         self.assertEqual(mock_run_tracker.delay.call_count, 0)
@@ -109,16 +126,158 @@ class TestRunKilltracker(TestTrackerBase):
         mock_create_from_zkb_redisq,
         mock_store_killmail,
         mock_delete_stale_killmails,
-        mock_is_esi_online,
+        mock_is_service_available,
     ):
         mock_create_from_zkb_redisq.side_effect = self.my_fetch_from_zkb()
-        mock_is_esi_online.return_value = True
+        mock_is_service_available.return_value = True
 
         run_killtracker.delay()
         self.assertEqual(mock_run_tracker.delay.call_count, 6)
         self.assertEqual(mock_store_killmail.si.call_count, 3)
         self.assertTrue(mock_delete_stale_killmails.delay.called)
 
+    @patch(MODULE_PATH + ".KILLTRACKER_STORING_KILLMAILS_ENABLED", False)
+    @patch(MODULE_PATH + ".shard_queue", lambda shard: f"match_{shard}")
+    @patch(MODULE_PATH + ".shard_count", lambda: 2)
+    @patch(MODULE_PATH + ".run_tracker_shard")
+    def test_run_one_task_per_shard_when_sharding_enabled(
+        self,
+        mock_run_tracker_shard,
+        mock_run_tracker,
+        mock_create_from_zkb_redisq,
+        mock_store_killmail,
+        mock_delete_stale_killmails,
+        mock_is_service_available,
+    ):
+        mock_create_from_zkb_redisq.side_effect = self.my_fetch_from_zkb()
+        mock_is_service_available.return_value = True
+
+        run_killtracker.delay()
+        self.assertEqual(mock_run_tracker.delay.call_count, 0)
+        self.assertEqual(mock_run_tracker_shard.apply_async.call_count, 6)
+        queues = {
+            kwargs["queue"]
+            for _, kwargs in mock_run_tracker_shard.apply_async.call_args_list
+        }
+        self.assertSetEqual(queues, {"match_0", "match_1"})
+
+    @patch(MODULE_PATH + ".KILLTRACKER_STORING_KILLMAILS_ENABLED", False)
+    @patch(MODULE_PATH + ".KILLTRACKER_REDISQ_CONCURRENCY", 2)
+    def test_fetch_killmails_concurrently(
+        self,
+        mock_run_tracker,
+        mock_create_from_zkb_redisq,
+        mock_store_killmail,
+        mock_delete_stale_killmails,
+        mock_is_service_available,
+    ):
+        mock_create_from_zkb_redisq.side_effect = [
+            load_killmail(10000001),
+            load_killmail(10000002),
+            load_killmail(10000003),
+            load_killmail(10000001),
+            None,
+            None,
+        ]
+
+        run_killtracker.delay()
+        self.assertEqual(mock_create_from_zkb_redisq.call_count, 6)
+        self.assertEqual(mock_run_tracker.delay.call_count, 6)
+
+    @patch(MODULE_PATH + ".KILLTRACKER_STORING_KILLMAILS_ENABLED", False)
+    @patch(MODULE_PATH + ".KILLTRACKER_ESI_FREE_MODE", True)
+    @patch(MODULE_PATH + ".load_static_data")
+    @patch(MODULE_PATH + ".missing_static_data")
+    def test_park_killmails_with_missing_static_data_in_esi_free_mode(
+        self,
+        mock_missing_static_data,
+        mock_load_static_data,
+        mock_run_tracker,
+        mock_create_from_zkb_redisq,
+        mock_store_killmail,
+        mock_delete_stale_killmails,
+        mock_is_service_available,
+    ):
+        clear_parked_killmails()
+        mock_create_from_zkb_redisq.side_effect = self.my_fetch_from_zkb()
+        mock_missing_static_data.side_effect = lambda killmail: (
+            MissingStaticData(solar_system_ids={killmail.solar_system_id})
+            if killmail.id == 10000001
+            else MissingStaticData()
+        )
+
+        run_killtracker.delay()
+        self.assertNotIn(call(Service.ESI), mock_is_service_available.call_args_list)
+        self.assertEqual(mock_run_tracker.delay.call_count, 4)
+        self.assertEqual(parked_killmails_count(), 1)
+        _, kwargs = mock_load_static_data.delay.call_args
+        self.assertListEqual(kwargs["solar_system_ids"], [30004984])
+
+
+@patch(MODULE_PATH + ".KILLTRACKER_STORING_KILLMAILS_ENABLED", False)
+@patch(MODULE_PATH + ".run_tracker")
+class TestReleaseParkedKillmails(TestTrackerBase):
+    def setUp(self) -> None:
+        cache.clear()
+        clear_parked_killmails()
+
+    def test_should_release_killmails_with_static_data(self, mock_run_tracker):
+        # given
+        killmail = load_killmail(10000001)
+        killmail.time = now()
+        park_killmail(killmail)
+        # when
+        release_parked_killmails()
+        # then
+        self.assertEqual(mock_run_tracker.delay.call_count, 2)
+        self.assertEqual(parked_killmails_count(), 0)
+
+    def test_should_drop_killmails_too_old_for_trackers(self, mock_run_tracker):
+        # given
+        killmail = load_killmail(10000001)
+        killmail.time = now() - dt.timedelta(days=1)
+        park_killmail(killmail)
+        # when
+        release_parked_killmails()
+        # then
+        self.assertFalse(mock_run_tracker.delay.called)
+        self.assertEqual(parked_killmails_count(), 0)
+
+
+@patch(MODULE_PATH + ".send_messages_to_webhook")
+@patch(MODULE_PATH + ".generate_killmail_message")
+class TestRunTrackerShard(TestTrackerBase):
+    def setUp(self) -> None:
+        cache.clear()
+        clear_shard_trackers()
+
+    def test_should_run_all_trackers_of_shard(
+        self, mock_enqueue_killmail_message, mock_send_messages_to_webhook
+    ):
+        killmail_json = load_killmail(10000001).asjson()
+        run_tracker_shard(0, killmail_json)
+        self.assertEqual(mock_enqueue_killmail_message.delay.call_count, 1)
+        _, kwargs = mock_enqueue_killmail_message.delay.call_args
+        self.assertEqual(kwargs["tracker_pk"], self.tracker_1.pk)
+
+    @patch(MODULE_PATH + ".is_engine_enabled", lambda: True)
+    @patch(MODULE_PATH + ".shard_engine")
+    @patch(MODULE_PATH + ".shard_trackers")
+    def test_should_use_results_from_engine_when_enabled(
+        self,
+        mock_shard_trackers,
+        mock_shard_engine,
+        mock_enqueue_killmail_message,
+        mock_send_messages_to_webhook,
+    ):
+        killmail = load_killmail(10000001)
+        mock_shard_trackers.return_value = [self.tracker_1, self.tracker_2]
+        mock_shard_engine.return_value.match.return_value = [[None, killmail]]
+        run_tracker_shard(0, killmail.asjson())
+        self.assertEqual(mock_enqueue_killmail_message.delay.call_count, 1)
+        _, kwargs = mock_enqueue_killmail_message.delay.call_args
+        self.assertEqual(kwargs["tracker_pk"], self.tracker_2.pk)
+
 
 @patch(MODULE_PATH + ".send_messages_to_webhook")
 @patch(MODULE_PATH + ".generate_killmail_message")
@@ -158,6 +317,73 @@ class TestRunTracker(TestTrackerBase):
         self.assertFalse(mock_enqueue_killmail_message.delay.called)
         self.assertTrue(mock_send_messages_to_webhook.delay.called)
 
+    @patch(MODULE_PATH + ".update_battle_message")
+    def test_post_only_first_killmail_of_battle_in_battle_mode(
+        self,
+        mock_update_battle_message,
+        mock_enqueue_killmail_message,
+        mock_send_messages_to_webhook,
+    ):
+        """when tracker is in battle mode, then post first killmail of a battle
+        and schedule one throttled update of that message for further killmails
+        """
+        tracker = Tracker.objects.create(
+            name="Battles", webhook=self.webhook_1, battle_mode=True
+        )
+        clear_battles()
+        for _ in range(3):
+            killmail = load_killmail(10000001)
+            killmail.battle_info = assign_battle(killmail)
+            run_tracker(tracker.pk, killmail.asjson())
+        self.assertEqual(mock_enqueue_killmail_message.delay.call_count, 1)
+        self.assertEqual(mock_update_battle_message.apply_async.call_count, 1)
+
+    @patch(MODULE_PATH + ".send_tracker_digest")
+    def test_add_matching_killmail_to_digest(
+        self,
+        mock_send_tracker_digest,
+        mock_enqueue_killmail_message,
+        mock_send_messages_to_webhook,
+    ):
+        """when tracker is in digest mode, then add killmail to digest
+        and schedule sending of the digest once
+        """
+        tracker = Tracker.objects.create(
+            name="Digest", webhook=self.webhook_1, digest_window=60
+        )
+        clear_digest(tracker.pk)
+        run_tracker(tracker.pk, load_killmail(10000001).asjson())
+        run_tracker(tracker.pk, load_killmail(10000002).asjson())
+        self.assertFalse(mock_enqueue_killmail_message.delay.called)
+        self.assertEqual(mock_send_tracker_digest.apply_async.call_count, 1)
+        _, kwargs = mock_send_tracker_digest.apply_async.call_args
+        self.assertEqual(kwargs["countdown"], 60)
+
+
+@patch(MODULE_PATH + ".send_messages_to_webhook")
+class TestSendTrackerDigest(TestTrackerBase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.webhook_1.main_queue.clear()
+        clear_digest(self.tracker_1.pk)
+
+    def test_should_enqueue_digest_and_start_sending(
+        self, mock_send_messages_to_webhook
+    ):
+        self.tracker_1.add_to_digest(load_killmail(10000001))
+        self.tracker_1.add_to_digest(load_killmail(10000002))
+
+        send_tracker_digest(self.tracker_1.pk)
+
+        self.assertEqual(self.webhook_1.main_queue.size(), 1)
+        self.assertTrue(mock_send_messages_to_webhook.delay.called)
+
+    def test_should_do_nothing_when_no_digest(self, mock_send_messages_to_webhook):
+        send_tracker_digest(self.tracker_1.pk)
+
+        self.assertEqual(self.webhook_1.main_queue.size(), 0)
+        self.assertFalse(mock_send_messages_to_webhook.delay.called)
+
 
 @patch(MODULE_PATH + ".generate_killmail_message.retry")
 @patch(MODULE_PATH + ".send_messages_to_webhook")
@@ -246,6 +472,21 @@ class TestSendMessagesToWebhook(TestTrackerBase):
         self.assertEqual(self.webhook_1.error_queue.size(), 0)
         self.assertTrue(mock_retry.call_count, 4)
 
+    def test_should_requeue_message_when_discord_is_unavailable(
+        self, mock_logger, mock_send_message_to_webhook, mock_retry
+    ):
+        # given
+        mock_send_message_to_webhook.side_effect = ServiceUnavailable(
+            Service.DISCORD, 30
+        )
+        self.webhook_1.enqueue_message(content="Test message")
+        # when
+        send_messages_to_webhook(self.webhook_1.pk)
+        # then
+        self.assertEqual(self.webhook_1.main_queue.size(), 1)
+        _, kwargs = mock_retry.call_args
+        self.assertEqual(kwargs["countdown"], 30)
+
     def test_no_messages(self, mock_logger, mock_send_message_to_webhook, mock_retry):
         """when no mesages in queue, then do nothing"""
         mock_retry.side_effect = self.my_retry
@@ -359,3 +600,19 @@ class TestDeleteStaleKillmails(TestTrackerBase):
         mock_delete_stale.return_value = (1, {"killtracker.EveKillmail": 1})
         delete_stale_killmails()
         self.assertTrue(mock_delete_stale.called)
+
+
+@patch(MODULE_PATH + ".refresh_group_roles")
+@patch(MODULE_PATH + ".app_labels", lambda: {"discord"})
+class TestUpdateDiscordGroupRoles(TestTrackerBase):
+    def test_should_refresh_roles_of_pinged_groups_only(self, mock_refresh):
+        # given
+        group_1 = Group.objects.create(name="Group 1")
+        Group.objects.create(name="Group 2")
+        self.tracker_1.ping_groups.add(group_1)
+        mock_refresh.return_value = {group_1.pk: 42}
+        # when
+        update_discord_group_roles()
+        # then
+        groups = mock_refresh.call_args[0][0]
+        self.assertListEqual(list(groups), [group_1])
@@ -0,0 +1,49 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+from django.urls import reverse
+
+from .testdata.helpers import LoadTestDataMixin
+
+
+MODULE_PATH = "killtracker.views"
+
+
+class TestMetricsView(LoadTestDataMixin, TestCase):
+    def setUp(self) -> None:
+        self.webhook_1.main_queue.clear()
+
+    @patch(MODULE_PATH + ".KILLTRACKER_METRICS_TOKEN", None)
+    @patch(MODULE_PATH + ".KILLTRACKER_METRICS_ENABLED", True)
+    def test_should_return_metrics(self):
+        # when
+        response = self.client.get(reverse("killtracker:metrics"))
+        # then
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        content = response.content.decode("utf8")
+        self.assertIn(
+            f'killtracker_queue_size{{webhook_id="{self.webhook_1.pk}",'
+            'webhook="Webhook 1",queue="main"} 0',
+            content,
+        )
+        self.assertIn("# TYPE killtracker_killmails_received_total counter", content)
+
+    @patch(MODULE_PATH + ".KILLTRACKER_METRICS_ENABLED", False)
+    def test_should_return_404_when_disabled(self):
+        # when
+        response = self.client.get(reverse("killtracker:metrics"))
+        # then
+        self.assertEqual(response.status_code, 404)
+
+    @patch(MODULE_PATH + ".KILLTRACKER_METRICS_TOKEN", "my-token")
+    @patch(MODULE_PATH + ".KILLTRACKER_METRICS_ENABLED", True)
+    def test_should_require_token_when_configured(self):
+        # when
+        response_1 = self.client.get(reverse("killtracker:metrics"))
+        response_2 = self.client.get(
+            reverse("killtracker:metrics"), HTTP_AUTHORIZATION="Bearer my-token"
+        )
+        # then
+        self.assertEqual(response_1.status_code, 403)
+        self.assertEqual(response_2.status_code, 200)
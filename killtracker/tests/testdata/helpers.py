@@ -108,6 +108,13 @@ def load_killmail(killmail_id: int) -> Killmail:
     raise ValueError(f"Killmail with id {killmail_id} not found.")
 
 
+def load_killmail_package(killmail_id: int) -> dict:
+    """returns the package of a killmail as received from ZKB RedisQ"""
+    if killmail_id not in _killmails_data:
+        raise ValueError(f"Killmail with id {killmail_id} not found.")
+    return deepcopy(_killmails_data[killmail_id])
+
+
 class LoadTestDataMixin:
     @classmethod
     def setUpClass(cls):
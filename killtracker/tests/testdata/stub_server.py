@@ -0,0 +1,30 @@
+"""Local stub of the ZKB websocket for tests"""
+import json
+from typing import List
+
+import websockets
+
+
+class KillstreamStub:
+    """Websocket server, which sends the given messages to each subscriber"""
+
+    def __init__(self, messages: List[dict]) -> None:
+        self.messages = messages
+        self.subscriptions = []
+        self._server = None
+
+    async def _handler(self, websocket, path=None) -> None:
+        self.subscriptions.append(json.loads(await websocket.recv()))
+        for message in self.messages:
+            await websocket.send(json.dumps(message))
+        await websocket.wait_closed()
+
+    async def start(self) -> str:
+        """starts the server and returns its URL"""
+        self._server = await websockets.serve(self._handler, "127.0.0.1", 0)
+        port = self._server.sockets[0].getsockname()[1]
+        return f"ws://127.0.0.1:{port}"
+
+    async def stop(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
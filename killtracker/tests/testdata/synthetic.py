@@ -0,0 +1,205 @@
+"""Generator for synthetic killmails and trackers used in benchmarks
+
+All generated IDs are taken from the entities in the testdata,
+so that processing them never needs to call ESI.
+"""
+from dataclasses import dataclass, field
+import random
+from typing import List, Optional
+
+from django.utils.timezone import now
+
+from allianceauth.eveonline.models import EveAllianceInfo, EveCorporationInfo
+from eveuniverse.models import EveGroup, EveRegion, EveSolarSystem, EveType
+
+from ...core.killmails import Killmail
+from ...models import Tracker, Webhook
+
+
+@dataclass
+class EntityDistribution:
+    """Pools of IDs a synthetic killmail is generated from.
+
+    Pools with weights will be sampled with these weights,
+    e.g. to simulate one alliance dominating the killboard.
+    """
+
+    character_ids: List[int] = field(
+        default_factory=lambda: [
+            1001,
+            1002,
+            1003,
+            1004,
+            1005,
+            1006,
+            1007,
+            1008,
+            1009,
+            1011,
+            1012,
+        ]
+    )
+    corporation_ids: List[int] = field(
+        default_factory=lambda: [2001, 2011, 2021, 2031, 2041, 2051, 2061, 2071]
+    )
+    corporation_weights: Optional[List[int]] = None
+    alliance_ids: List[int] = field(default_factory=lambda: [3001, 3011])
+    alliance_share: float = 0.7
+    faction_ids: List[int] = field(default_factory=lambda: [500001, 500004])
+    ship_type_ids: List[int] = field(
+        default_factory=lambda: [603, 621, 638, 3756, 11379, 16238, 34562, 37483]
+    )
+    ship_type_weights: Optional[List[int]] = None
+    weapon_type_ids: List[int] = field(default_factory=lambda: [2488, 2977])
+    solar_system_ids: List[int] = field(
+        default_factory=lambda: [
+            30000145,
+            30001161,
+            30003067,
+            30003068,
+            30003087,
+            30004976,
+            30004984,
+            30045349,
+            31000005,
+        ]
+    )
+    npc_share: float = 0.1
+
+
+class SyntheticKillmailGenerator:
+    """Generates random but reproducible killmails"""
+
+    def __init__(
+        self,
+        distribution: EntityDistribution = None,
+        seed: int = 42,
+        id_start: int = 90000001,
+    ) -> None:
+        self.distribution = distribution if distribution else EntityDistribution()
+        self._random = random.Random(seed)
+        self._next_id = id_start
+
+    def generate(
+        self, count: int, attackers_min: int = 1, attackers_max: int = 10
+    ) -> List[Killmail]:
+        """returns given number of killmails
+        with attacker counts uniformly distributed between min and max
+        """
+        return [
+            self.generate_one(self._random.randint(attackers_min, attackers_max))
+            for _ in range(count)
+        ]
+
+    def generate_one(self, attackers_count: int) -> Killmail:
+        """returns a new killmail with the given number of attackers"""
+        killmail_id = self._next_id
+        self._next_id += 1
+        attackers = [
+            self._character_dict(is_attacker=True) for _ in range(attackers_count)
+        ]
+        final_blow = self._random.randrange(attackers_count) if attackers else None
+        for num, attacker in enumerate(attackers):
+            attacker["damage_done"] = self._random.randint(1, 5000)
+            attacker["final_blow"] = num == final_blow
+            attacker["security_status"] = round(self._random.uniform(-10, 5), 1)
+
+        victim = self._character_dict(is_attacker=False)
+        victim["damage_taken"] = sum(obj["damage_done"] for obj in attackers)
+        victim["position"] = {
+            "x": self._random.uniform(-1e12, 1e12),
+            "y": self._random.uniform(-1e12, 1e12),
+            "z": self._random.uniform(-1e12, 1e12),
+        }
+        total_value = self._random.lognormvariate(17, 2)
+        package_data = {
+            "killID": killmail_id,
+            "killmail": {
+                "killmail_id": killmail_id,
+                "killmail_time": now().strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "solar_system_id": self._random.choice(
+                    self.distribution.solar_system_ids
+                ),
+                "victim": victim,
+                "attackers": attackers,
+            },
+            "zkb": {
+                "locationID": 50012306,
+                "hash": f"synthetic-{killmail_id}",
+                "fittedValue": total_value * 0.8,
+                "totalValue": total_value,
+                "points": self._random.randint(1, 100),
+                "npc": self._random.random() < self.distribution.npc_share,
+                "solo": attackers_count == 1,
+                "awox": False,
+            },
+        }
+        return Killmail._create_from_dict(package_data)
+
+    def _character_dict(self, is_attacker: bool) -> dict:
+        dist = self.distribution
+        corporation_id = self._random.choices(
+            dist.corporation_ids, weights=dist.corporation_weights
+        )[0]
+        obj = {
+            "character_id": self._random.choice(dist.character_ids),
+            "corporation_id": corporation_id,
+            "ship_type_id": self._random.choices(
+                dist.ship_type_ids, weights=dist.ship_type_weights
+            )[0],
+        }
+        if self._random.random() < dist.alliance_share:
+            obj["alliance_id"] = dist.alliance_ids[
+                dist.corporation_ids.index(corporation_id) % len(dist.alliance_ids)
+            ]
+        if self._random.random() < 0.05:
+            obj["faction_id"] = self._random.choice(dist.faction_ids)
+        if is_attacker:
+            obj["weapon_type_id"] = self._random.choice(dist.weapon_type_ids)
+        return obj
+
+
+def create_synthetic_trackers(
+    count: int, webhook: Webhook, seed: int = 42
+) -> List[Tracker]:
+    """creates given number of trackers with a realistic mix of clauses
+    and returns them
+
+    The mix covers scalar clauses, security class, geography,
+    organizations and ship types, but not clauses needing routes from ESI.
+    """
+    rnd = random.Random(seed)
+    alliances = list(EveAllianceInfo.objects.all())
+    corporations = list(EveCorporationInfo.objects.all())
+    regions = list(EveRegion.objects.all())
+    solar_systems = list(EveSolarSystem.objects.all())
+    ship_groups = list(EveGroup.objects.filter(eve_category_id=6))
+    ship_types = list(EveType.objects.filter(eve_group__eve_category_id=6))
+    trackers = list()
+    for num in range(count):
+        tracker = Tracker.objects.create(
+            name=f"Synthetic Tracker {num + 1}",
+            webhook=webhook,
+            require_min_value=rnd.choice([None, None, 1, 10, 100]),
+            require_min_attackers=rnd.choice([None, None, 2, 5]),
+            require_max_attackers=rnd.choice([None, None, None, 50]),
+            exclude_high_sec=rnd.random() < 0.3,
+            exclude_w_space=rnd.random() < 0.3,
+            exclude_npc_kills=rnd.random() < 0.5,
+            identify_fleets=rnd.random() < 0.3,
+        )
+        mix = rnd.choice(["organizations", "geography", "ship_types", "catch_all"])
+        if mix == "organizations":
+            tracker.require_attacker_alliances.add(rnd.choice(alliances))
+            tracker.exclude_attacker_corporations.add(rnd.choice(corporations))
+            tracker.require_victim_corporations.add(*rnd.sample(corporations, 3))
+        elif mix == "geography":
+            tracker.require_regions.add(*rnd.sample(regions, 2))
+            tracker.require_solar_systems.add(*rnd.sample(solar_systems, 10))
+        elif mix == "ship_types":
+            tracker.require_attackers_ship_groups.add(*rnd.sample(ship_groups, 2))
+            tracker.require_victim_ship_types.add(*rnd.sample(ship_types, 3))
+
+        trackers.append(tracker)
+
+    return trackers
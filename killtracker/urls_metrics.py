@@ -0,0 +1,9 @@
+from django.urls import path
+
+from . import views
+
+app_name = "killtracker"
+
+urlpatterns = [
+    path("metrics", views.metrics, name="metrics"),
+]
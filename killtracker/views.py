@@ -0,0 +1,63 @@
+import hmac
+
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.views.decorators.http import require_GET
+
+from .app_settings import KILLTRACKER_METRICS_ENABLED, KILLTRACKER_METRICS_TOKEN
+from .core.metrics import prometheus_text
+from .models import Tracker, Webhook
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@require_GET
+def metrics(request) -> HttpResponse:
+    """Exposes metrics of the killtracker in the Prometheus text format"""
+    if not KILLTRACKER_METRICS_ENABLED:
+        raise Http404("Metrics are not enabled")
+
+    if KILLTRACKER_METRICS_TOKEN:
+        auth_header = request.META.get("HTTP_AUTHORIZATION", "")
+        if not hmac.compare_digest(auth_header, f"Bearer {KILLTRACKER_METRICS_TOKEN}"):
+            return HttpResponseForbidden()
+
+    gauges = list()
+    for webhook in Webhook.objects.all():
+        labels = {"webhook_id": webhook.pk, "webhook": webhook.name}
+        gauges.append(
+            (
+                "queue_size",
+                "Number of messages in a queue of a webhook",
+                {**labels, "queue": "main"},
+                webhook.main_queue.size(),
+            )
+        )
+        gauges.append(
+            (
+                "queue_size",
+                "Number of messages in a queue of a webhook",
+                {**labels, "queue": "error"},
+                webhook.error_queue.size(),
+            )
+        )
+        gauges.append(
+            (
+                "webhook_enabled",
+                "Whether a webhook is enabled",
+                labels,
+                int(webhook.is_enabled),
+            )
+        )
+    gauges.append(
+        (
+            "trackers_enabled",
+            "Number of enabled trackers",
+            {},
+            Tracker.objects.filter(is_enabled=True).count(),
+        )
+    )
+    label_names = {**Tracker.objects.label_names(), **Webhook.objects.label_names()}
+    return HttpResponse(
+        prometheus_text(label_names=label_names, gauges=gauges),
+        content_type=PROMETHEUS_CONTENT_TYPE,
+    )
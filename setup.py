@@ -45,7 +45,7 @@ setup(
         "dataclasses>='0.7';python_version<'3.7'",
         "dacite",
         "django-eveuniverse>=0.6.4",
-        "redis-simple-mq>=0.4",
         "dhooks-lite>=0.6",
     ],
+    extras_require={"numpy": ["numpy"], "websocket": ["websockets"]},
 )
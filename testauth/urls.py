@@ -2,5 +2,6 @@ from django.conf.urls import include, url
 from allianceauth import urls
 
 urlpatterns = [
+    url(r"^killtracker/", include("killtracker.urls_metrics")),
     url(r"", include(urls)),
 ]